@@ -1,5 +1,13 @@
+import ctypes
+import ctypes.util
+import mmap
 import trace
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 ################################################################################
 ########################### Class for Peak Problems ############################
 ################################################################################
@@ -134,6 +142,70 @@ class PeakProblem(object):
         newCol = col + problem.startCol - self.startCol
         return (newRow, newCol)
 
+################################################################################
+##################### Class for Memory-Mapped Peak Problems ####################
+################################################################################
+
+class MatrixPeakProblem(PeakProblem):
+    """
+    A peak-finding problem over a two-dimensional NumPy array instead of a
+    list of lists.  The array is usually a read-only memory map of a .npy
+    file (see createMatrixProblem), so only the cells that an algorithm
+    looks at are ever read from disk.
+    """
+
+    def get(self, location):
+        """
+        Returns the value of the array at the given location, offset by
+        the coordinates (startRow, startCol).
+
+        RUNTIME: O(1)
+        """
+
+        (r, c) = location
+        if not (0 <= r and r < self.numRow):
+            return 0
+        if not (0 <= c and c < self.numCol):
+            return 0
+        return int(self.array[self.startRow + r, self.startCol + c])
+
+    def getMaximum(self, locations, trace = None):
+        """
+        Finds the location in the current problem with the greatest value.
+        All the values are read with a single NumPy indexing operation
+        instead of one get per location; ties go to the first location, as
+        in PeakProblem.getMaximum.
+
+        RUNTIME: O(len(locations))
+        """
+
+        bestLoc = None
+
+        if len(locations) > 0:
+            coords = numpy.array(locations, dtype = numpy.intp)
+            (rows, cols) = (coords[:, 0], coords[:, 1])
+            inside = ((0 <= rows) & (rows < self.numRow) &
+                      (0 <= cols) & (cols < self.numCol))
+            values = numpy.zeros(len(locations), dtype = self.array.dtype)
+            values[inside] = self.array[self.startRow + rows[inside],
+                                        self.startCol + cols[inside]]
+            bestLoc = locations[int(values.argmax())]
+
+        if not trace is None: trace.getMaximum(locations, bestLoc)
+
+        return bestLoc
+
+    def getSubproblem(self, bounds):
+        """
+        Returns a subproblem with the given bounds, over the same array.
+
+        RUNTIME: O(1)
+        """
+
+        (sRow, sCol, nRow, nCol) = bounds
+        newBounds = (self.startRow + sRow, self.startCol + sCol, nRow, nCol)
+        return MatrixPeakProblem(self.array, newBounds)
+
 ################################################################################
 ################################ Helper Methods ################################
 ################################################################################
@@ -168,3 +240,42 @@ def createProblem(array):
 
     (rows, cols) = getDimensions(array)
     return PeakProblem(array, (0, 0, rows, cols))
+
+def createMatrixProblem(filename):
+    """
+    Constructs an instance of the MatrixPeakProblem object for the
+    two-dimensional array saved in the given .npy file.  The file is
+    memory-mapped, not read, so it may be much larger than the memory.
+
+    RUNTIME: O(1)
+    """
+
+    if numpy is None:
+        raise ImportError("createMatrixProblem needs NumPy")
+    array = numpy.load(filename, mmap_mode = "r")
+    adviseRandomAccess(array)
+    (rows, cols) = array.shape
+    return MatrixPeakProblem(array, (0, 0, rows, cols))
+
+# madvise advice meaning "expect page references in random order"
+MADV_RANDOM = 1
+
+def adviseRandomAccess(array):
+    """
+    Tells the kernel that the given memory-mapped array will be read in
+    random order.  Otherwise every page fault reads a whole read-ahead
+    window around the cell, so scanning a column (one cell per row) reads
+    far more of the file than the column itself.  Does nothing where
+    madvise is not available.
+
+    RUNTIME: O(1)
+    """
+
+    try:
+        madvise = ctypes.CDLL(ctypes.util.find_library("c")).madvise
+    except (OSError, AttributeError):
+        return
+    madvise.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+    address = array.__array_interface__["data"][0]
+    skew = address % mmap.PAGESIZE
+    madvise(address - skew, array.nbytes + skew, MADV_RANDOM)
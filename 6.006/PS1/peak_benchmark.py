@@ -0,0 +1,132 @@
+"""
+Benchmark for the four algorithms on memory-mapped matrices.
+
+Writes a rows x columns .npy matrix (a single "pyramid" peak at a random
+location, with some noise) unless --file names an existing one, memory-maps
+it with peak.createMatrixProblem, and runs each algorithm on it with a
+trace.TraceCounter, reporting the peak found, whether it is a peak, the cells
+looked at and the time taken.  algorithm2 walks one cell at a time, so on a
+large matrix it usually runs out of recursion depth long before the peak;
+that is reported instead of a peak.
+
+The default 10000 x 10000 matrix is a 400 MB file; --huge uses a
+100000 x 100000 one instead, a 40 GB file that does not fit in memory.
+test_peak.py checks that MatrixPeakProblem gives the same answers as
+PeakProblem.
+
+Usage:
+    python peak_benchmark.py [--rows 10000] [--columns 10000] [--huge]
+                             [--file FILE]
+"""
+
+import optparse
+import os
+import resource
+import sys
+import time
+
+import algorithms
+import peak
+import trace
+
+################################################################################
+############################## Peak Finding at Scale ###########################
+################################################################################
+
+def writeLandscape(filename, rows, columns, seed = 6006):
+    """
+    Writes a rows x columns matrix of 32-bit integers to a .npy file, a
+    block of rows at a time.  The values decrease by 16 per step away from
+    a random peak location, plus noise from 0 to 15, so the peak is the
+    only one.
+
+    Returns the location of the peak.
+    """
+
+    numpy = peak.numpy
+    random = numpy.random.RandomState(seed)
+    (peakRow, peakCol) = (random.randint(rows), random.randint(columns))
+    colDistance = numpy.abs(numpy.arange(columns) - peakCol)
+    top = 16 * (rows + columns)
+    step = max(1, (1 << 24) // columns)
+    # written with plain file writes, so the process never holds the
+    # matrix in memory
+    with open(filename, "wb") as output:
+        numpy.lib.format.write_array_header_1_0(output, {
+            "descr" : numpy.lib.format.dtype_to_descr(numpy.dtype("<i4")),
+            "fortran_order" : False,
+            "shape" : (rows, columns)
+        })
+        for start in range(0, rows, step):
+            end = min(start + step, rows)
+            rowDistance = numpy.abs(numpy.arange(start, end) - peakRow)
+            block = top - 16 * (rowDistance[:, numpy.newaxis] + colDistance)
+            block += random.randint(0, 16, size = block.shape)
+            block.astype("<i4").tofile(output)
+    return (peakRow, peakCol)
+
+def runAlgorithm(function, problem):
+    """
+    Runs an algorithm on a problem with a TraceCounter.  Returns the peak
+    (None if the algorithm ran out of recursion depth), the counter and the
+    time taken.
+    """
+
+    counter = trace.TraceCounter()
+    start = time.time()
+    try:
+        result = function(problem, trace = counter)
+    except RuntimeError:
+        # "maximum recursion depth exceeded"
+        result = None
+    return (result, counter, time.time() - start)
+
+algorithmList = [("Algorithm 1", algorithms.algorithm1),
+                 ("Algorithm 2", algorithms.algorithm2),
+                 ("Algorithm 3", algorithms.algorithm3),
+                 ("Algorithm 4", algorithms.algorithm4)]
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("--rows", type = "int", default = 10000,
+                      help = "number of rows of the generated matrix")
+    parser.add_option("--columns", type = "int", default = 10000,
+                      help = "number of columns of the generated matrix")
+    parser.add_option("--huge", action = "store_true", default = False,
+                      help = "generate a 100000x100000 matrix (a 40 GB file)")
+    parser.add_option("--file", default = None,
+                      help = "use (or write and keep) the matrix in FILE")
+    (options, _) = parser.parse_args(argv)
+    if options.huge:
+        (options.rows, options.columns) = (100000, 100000)
+
+    filename = options.file or "peak_benchmark.%d.npy" % os.getpid()
+    try:
+        if not os.path.exists(filename):
+            start = time.time()
+            location = writeLandscape(filename, options.rows, options.columns)
+            print("Wrote a %dx%d matrix (%.1f GB) with its peak at %s "
+                  "in %.1fs" % (options.rows, options.columns,
+                                os.path.getsize(filename) / 1e9,
+                                str(location), time.time() - start))
+        problem = peak.createMatrixProblem(filename)
+
+        print("%-12s %16s %8s %12s %10s" %
+              ("algorithm", "result", "peak?", "cells", "seconds"))
+        for (name, function) in algorithmList:
+            (result, counter, seconds) = runAlgorithm(function, problem)
+            if result is None:
+                (shown, status) = ("recursion", "-")
+            else:
+                (shown, status) = (str(result), str(problem.isPeak(result)))
+            print("%-12s %16s %8s %12d %10.3f" %
+                  (name, shown, status, counter.cells, seconds))
+            sys.stdout.flush()
+        print("Largest resident set: %.0f MB" %
+              (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+    finally:
+        if options.file is None and os.path.exists(filename):
+            os.remove(filename)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
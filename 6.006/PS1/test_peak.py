@@ -0,0 +1,90 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import algorithms
+import peak
+import trace
+
+algorithmList = [algorithms.algorithm1, algorithms.algorithm2,
+                 algorithms.algorithm3, algorithms.algorithm4]
+
+def randomMatrix(rng, rows, cols, low, high):
+    """
+    Returns a rows x cols list of lists of random integers in [low, high].
+    Small ranges make many ties.
+    """
+
+    return [[rng.randint(low, high) for c in range(cols)]
+            for r in range(rows)]
+
+@unittest.skipIf(peak.numpy is None, "NumPy is not installed")
+class TestMatrixPeakProblem(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def matrixProblems(self, matrix):
+        """
+        Returns MatrixPeakProblems for the given list of lists, one over an
+        in-memory array and one memory-mapped from a .npy file.
+        """
+
+        array = peak.numpy.array(matrix, dtype = peak.numpy.int32)
+        filename = os.path.join(self.directory, "matrix.npy")
+        peak.numpy.save(filename, array)
+        return [peak.MatrixPeakProblem(array, (0, 0) + array.shape),
+                peak.createMatrixProblem(filename)]
+
+    def assertSameRun(self, matrix):
+        listProblem = peak.createProblem(matrix)
+        for problem in self.matrixProblems(matrix):
+            for function in algorithmList:
+                (expected, result) = (trace.TraceRecord(),
+                                      trace.TraceRecord())
+                self.assertEqual(function(listProblem, trace = expected),
+                                 function(problem, trace = result))
+                self.assertEqual(expected.sequence, result.sequence)
+
+    def testRandomMatrices(self):
+        rng = random.Random(1)
+        for (rows, cols) in [(1, 1), (1, 7), (7, 1), (2, 2), (5, 8),
+                             (8, 5), (11, 11), (16, 23)]:
+            for (low, high) in [(0, 1), (0, 3), (-5, -1), (0, 1000)]:
+                self.assertSameRun(randomMatrix(rng, rows, cols, low, high))
+
+    def testFlatMatrix(self):
+        # every cell ties, so every getMaximum must pick its first location
+        for (rows, cols) in [(1, 1), (3, 4), (9, 9)]:
+            for value in [0, 7, -7]:
+                self.assertSameRun([[value] * cols for r in range(rows)])
+
+    def testGetMaximum(self):
+        rng = random.Random(2)
+        matrix = randomMatrix(rng, 9, 9, -3, 3)
+        listProblem = peak.createProblem(matrix)
+        problems = self.matrixProblems(matrix)
+        bounds = [(0, 0, 9, 9), (2, 3, 4, 5), (8, 8, 1, 1), (0, 4, 9, 1)]
+        for bound in bounds:
+            expected = listProblem.getSubproblem(bound)
+            subproblems = [problem.getSubproblem(bound)
+                           for problem in problems]
+            for i in range(200):
+                # includes locations outside the subproblem, which count
+                # as 0, and repeated locations
+                locations = [(rng.randint(-2, 10), rng.randint(-2, 10))
+                             for k in range(rng.randint(1, 6))]
+                for subproblem in subproblems:
+                    self.assertEqual(expected.getMaximum(locations),
+                                     subproblem.getMaximum(locations))
+        for problem in problems:
+            self.assertEqual(None, problem.getMaximum([]))
+            self.assertEqual((-1, 0),
+                             problem.getMaximum([(-1, 0), (9, 9), (0, 9)]))
+
+if __name__ == "__main__":
+    unittest.main()
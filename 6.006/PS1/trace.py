@@ -96,3 +96,70 @@ class TraceRecord(object):
             "type" : "foundPeak",
             "coord" : peak
         })
+
+class TraceCounter(object):
+    """
+    A class with the same hooks as TraceRecord that only counts the cells an
+    algorithm looks at, so it can be used on problems far too large to
+    record or display.
+    """
+
+    def __init__(self):
+        """
+        Initialize all the counts to zero.
+
+        RUNTIME: O(1)
+        """
+
+        self.cells = 0
+        self.maximumCalls = 0
+        self.neighborCalls = 0
+        self.subproblems = 0
+
+    def getMaximum(self, arguments, maximum):
+        """
+        Counts every location that getMaximum looked at.
+
+        RUNTIME: O(1)
+        """
+
+        self.maximumCalls += 1
+        self.cells += len(arguments)
+
+    def getBetterNeighbor(self, neighbor, better):
+        """
+        Counts the location and its four neighbors, which is an upper bound
+        on the cells that getBetterNeighbor looked at.
+
+        RUNTIME: O(1)
+        """
+
+        self.neighborCalls += 1
+        self.cells += 5
+
+    def setProblemDimensions(self, subproblem):
+        """
+        Counts the subproblems that the algorithm recursed into.
+
+        RUNTIME: O(1)
+        """
+
+        self.subproblems += 1
+
+    def setBestSeen(self, bestSeen):
+        """
+        Nothing to count.
+
+        RUNTIME: O(1)
+        """
+
+        pass
+
+    def foundPeak(self, peak):
+        """
+        Nothing to count.
+
+        RUNTIME: O(1)
+        """
+
+        pass
@@ -1,5 +1,8 @@
 #!/usr/bin/env python
 
+import array  # Used by CompiledCircuit
+import collections  # Used by BucketPriorityQueue
+import heapq  # Used by HeapPriorityQueue and BucketPriorityQueue
 import json   # Used when TRACE=jsonp
 import os     # Used to get the TRACE environment variable
 import re     # Used when TRACE=jsonp
@@ -39,6 +42,21 @@ class TruthTable:
             value = value[i]
         return value
 
+    def bitmask(self):
+        """The truth table packed into an integer.
+        
+        Bit i of the integer is the output for the inputs whose values, read as
+        a binary number with the first input as the most significant bit, add
+        up to i.
+        """
+        outputs = [self.table]
+        for i in xrange(self.input_count):
+            outputs = [half for table in outputs for half in table]
+        mask = 0
+        for i in xrange(len(outputs)):
+            mask |= outputs[i] << i
+        return mask
+
     def _build_table(self, output_list):
         # Builds an evaluation table out of a list of truth table values.
         #
@@ -259,9 +277,304 @@ class Circuit:
     def as_json(self):
         """A hash that obeys the JSON format, representing the circuit."""
         json = {}
-        json['gates'] = [gate.as_json() for gate in self.gates.itervalues()]
+        json['gates'] = [gate.as_json() for gate in self.gates.values()]
         return json
 
+class CompiledCircuit:
+    """A circuit's topology compiled into flat integer arrays.
+    
+    Gates and gate types are numbered in the order they are added, and every
+    per-gate property is stored in an array indexed by the gate's number:
+        gate_types: the number of each gate's type
+        fanin_offsets: gate i's in-gates are listed between fanin_offsets[i]
+            and fanin_offsets[i + 1] in fanin_gates, in terminal order (the
+            compressed sparse row format); unconnected terminals are -1
+        fanout_offsets: gate i's out-gates are listed between fanout_offsets[i]
+            and fanout_offsets[i + 1] in fanout_gates and fanout_bits
+        fanout_gates: the out-gates of all the gates
+        fanout_bits: the bit of the out-gate's inputs number (see
+            TruthTable.bitmask) that the gate's output is connected to
+        probed: 1 if the gate is probed, 0 otherwise
+    Gate types are described by type_delays, type_input_counts and type_masks,
+    which holds the bitmask of each type's truth table.
+    
+    The fan-out arrays are only built by the finish method, after all the gates
+    have been added.
+    """
+    
+    def __init__(self, circuit=None):
+        """Creates an empty compiled circuit, or compiles a Circuit.
+        
+        Args:
+            circuit: Optional completely built Circuit instance to be compiled.
+        """
+        self.type_names = []
+        self.type_ids = {}
+        self.type_delays = array.array('l')
+        self.type_input_counts = array.array('i')
+        self.type_masks = []
+        self.gate_names = []
+        self.gate_ids = {}
+        self.gate_types = array.array('i')
+        self.probed = bytearray()
+        self.fanin_offsets = array.array('l', [0])
+        self.fanin_gates = array.array('l')
+        if circuit is not None:
+            self._compile(circuit)
+    
+    def __len__(self):
+        # Number of gates in the circuit.
+        return len(self.gate_names)
+    
+    def add_gate_type(self, name, truth_table, delay):
+        """Adds a gate type that can be later attached to gates.
+        
+        Args:
+            name: A unique string used to identify the gate type.
+            truth_table: TruthTable instance containing the gate's logic.
+            delay: The gate's delay from an input transition to an output
+                transition.
+        
+        Returns:
+            The number of the new gate type.
+        """
+        if name in self.type_ids:
+            raise ValueError('Gate type name already used')
+        if delay < 0:
+            raise ValueError('Invalid delay')
+        type_id = self.type_ids[name] = len(self.type_names)
+        self.type_names.append(name)
+        self.type_delays.append(delay)
+        self.type_input_counts.append(truth_table.input_count)
+        self.type_masks.append(truth_table.bitmask())
+        return type_id
+    
+    def add_gate(self, name, type_name, input_names):
+        """Adds a gate whose in-gates have already been added.
+        
+        Args:
+            name: A unique string used to identify the gate.
+            type_name: The name of the gate's type.
+            input_names: List of the names of gates whose outputs are connected
+                to this gate's inputs. Input gates have an empty list.
+        
+        Returns:
+            The number of the new gate.
+        
+        Raises:
+            ValueError: An exception if a name is unknown or already used, or if
+                the gate has the wrong number of inputs for its type.
+        """
+        if name in self.gate_ids:
+            raise ValueError('Gate name already used')
+        type_id = self.type_ids.get(type_name)
+        if type_id is None:
+            raise ValueError('Unknown gate type ' + type_name)
+        if (len(input_names) != 0 and
+                len(input_names) != self.type_input_counts[type_id]):
+            raise ValueError('Invalid number of inputs for gate ' + name)
+        gate_ids = self.gate_ids
+        for input_name in input_names:
+            input_id = gate_ids.get(input_name)
+            if input_id is None:
+                raise ValueError('Unknown input gate ' + input_name)
+            self.fanin_gates.append(input_id)
+        gate_id = gate_ids[name] = len(self.gate_names)
+        self.gate_names.append(name)
+        self.gate_types.append(type_id)
+        self.probed.append(0)
+        self.fanin_offsets.append(len(self.fanin_gates))
+        return gate_id
+    
+    def add_probe(self, gate_name):
+        """Adds a gate to the list of outputs."""
+        gate_id = self.gate_ids.get(gate_name)
+        if gate_id is None:
+            raise ValueError('Unknown gate ' + gate_name)
+        if self.probed[gate_id]:
+            raise RuntimeError('Gate already probed')
+        self.probed[gate_id] = 1
+    
+    def finish(self):
+        """Builds the fan-out arrays, after all the gates have been added."""
+        gate_count = len(self.gate_names)
+        fanin_offsets = self.fanin_offsets
+        fanin_gates = self.fanin_gates
+        fanout_offsets = array.array('l', [0]) * (gate_count + 1)
+        for in_gate in fanin_gates:
+            if in_gate >= 0:
+                fanout_offsets[in_gate + 1] += 1
+        for gate in xrange(gate_count):
+            fanout_offsets[gate + 1] += fanout_offsets[gate]
+        next_edge = fanout_offsets[:-1]
+        self.fanout_gates = array.array('l', [0]) * fanout_offsets[-1]
+        self.fanout_bits = array.array('l', [0]) * fanout_offsets[-1]
+        for gate in xrange(gate_count):
+            start = fanin_offsets[gate]
+            input_count = fanin_offsets[gate + 1] - start
+            for terminal in xrange(input_count):
+                in_gate = fanin_gates[start + terminal]
+                if in_gate < 0:
+                    continue
+                edge = next_edge[in_gate]
+                next_edge[in_gate] = edge + 1
+                self.fanout_gates[edge] = gate
+                self.fanout_bits[edge] = 1 << (input_count - 1 - terminal)
+        self.fanout_offsets = fanout_offsets
+    
+    def _compile(self, circuit):
+        # Adds all the gate types and gates in a Circuit, and finishes.
+        #
+        # The Circuit's gates may reference gates that come later in its
+        # dictionary, so they are all numbered before any of them is added.
+        for gate_type in circuit.gate_types.values():
+            self.add_gate_type(gate_type.name, gate_type.truth_table,
+                               gate_type.delay)
+        gate_list = list(circuit.gates.values())
+        gate_ids = dict((gate_list[i].name, i) for i in xrange(len(gate_list)))
+        for gate in gate_list:
+            self.gate_names.append(gate.name)
+            self.gate_types.append(self.type_ids[gate.gate_type.name])
+            self.probed.append(int(gate.probed))
+            for in_gate in gate.in_gates:
+                if in_gate is None:
+                    self.fanin_gates.append(-1)
+                else:
+                    self.fanin_gates.append(gate_ids[in_gate.name])
+            self.fanin_offsets.append(len(self.fanin_gates))
+        self.gate_ids = gate_ids
+        self.finish()
+
+def read_tokens(file, chunk_size=1 << 20):
+    """Yields the list of tokens on each line of a file.
+    
+    The file is read in large chunks, which is much faster than calling readline
+    on big inputs. Since the last chunk may go past the end of the netlist, the
+    rest of the file (e.g., the layout) cannot be read afterwards.
+    
+    Args:
+        file: A File object supplying the input.
+        chunk_size: Number of characters read from the file at a time.
+    """
+    partial_line = ''
+    while True:
+        chunk = file.read(chunk_size)
+        if len(chunk) == 0:
+            break
+        lines = (partial_line + chunk).split('\n')
+        partial_line = lines.pop()
+        for line in lines:
+            yield line.split()
+    if len(partial_line) > 0:
+        yield partial_line.split()
+
+class NetlistLoader:
+    """Reads a simulation's textual description straight into a CompiledCircuit.
+    
+    No Gate objects are created. Gate and gate type names are interned into
+    numbers as they are read, and each gate's inputs are checked against its
+    type right away, so the input is only read once. The commands must come in
+    the order described in tests/README.txt, with all the flip commands after
+    the gates and probes.
+    """
+    
+    def __init__(self, file, chunk_size=1 << 20):
+        """Creates a loader that reads from a file.
+        
+        Args:
+            file: A File object supplying the input.
+            chunk_size: Number of characters read from the file at a time.
+        """
+        self.lines = read_tokens(file, chunk_size)
+        self.truth_tables = {}
+        self.compiled = CompiledCircuit()
+        self.first_flip = None
+        self.done = False
+    
+    def load_circuit(self):
+        """Reads the input up to the first flip command.
+        
+        Returns:
+            The finished CompiledCircuit.
+        """
+        compiled = self.compiled
+        for command in self.lines:
+            if len(command) < 1:
+                continue
+            if command[0] == 'table':
+                if command[1] in self.truth_tables:
+                    raise ValueError('Truth table name already used')
+                outputs = [int(token) for token in command[2:]]
+                self.truth_tables[command[1]] = TruthTable(command[1], outputs)
+            elif command[0] == 'type':
+                if len(command) != 4:
+                    raise ValueError('Invalid number of arguments for gate type'
+                                     ' command')
+                if command[2] not in self.truth_tables:
+                    raise ValueError('Unknown truth table ' + command[2] +
+                                     ' in line: ' + ' '.join(command))
+                compiled.add_gate_type(command[1],
+                                       self.truth_tables[command[2]],
+                                       int(command[3]))
+            elif command[0] == 'gate':
+                compiled.add_gate(command[1], command[2], command[3:])
+            elif command[0] == 'probe':
+                if len(command) != 2:
+                    raise ValueError('Invalid number of arguments for gate '
+                                      'probe command')
+                compiled.add_probe(command[1])
+            elif command[0] == 'flip':
+                self.first_flip = self._flip(command)
+                break
+            elif command[0] == 'done':
+                self.done = True
+                break
+        else:
+            raise ValueError('Input lacks done command')
+        compiled.finish()
+        return compiled
+    
+    def read_flips(self, count=None):
+        """Reads the next flip commands, after load_circuit was called.
+        
+        Args:
+            count: The maximum number of flips to be read, or None to read all
+                the remaining flips.
+        
+        Returns:
+            A list of [time, gate name, output, gate number] lists. The list is
+            only empty after the done command was read.
+        """
+        flips = []
+        if self.first_flip is not None:
+            flips.append(self.first_flip)
+            self.first_flip = None
+        while not self.done and (count is None or len(flips) < count):
+            command = next(self.lines, None)
+            if command is None:
+                raise ValueError('Input lacks done command')
+            if len(command) < 1:
+                continue
+            if command[0] == 'flip':
+                flips.append(self._flip(command))
+            elif command[0] == 'done':
+                self.done = True
+            elif command[0] in ('table', 'type', 'gate', 'probe'):
+                raise ValueError('Circuit command after flip commands')
+        return flips
+    
+    def _flip(self, command):
+        # Parses a flip command into a [time, name, output, number] list.
+        if len(command) != 4:
+            raise ValueError('Invalid number of arguments for flip command')
+        gate_id = self.compiled.gate_ids.get(command[1])
+        if gate_id is None:
+            raise ValueError('Unknown gate ' + command[1])
+        output = int(command[2])
+        if output != 0 and output != 1:
+            raise ValueError('Invalid output value')
+        return [int(command[3]), command[1], output, gate_id]
+
 class Transition:
     """A transition in a gate's output."""
   
@@ -393,10 +706,110 @@ class PriorityQueue:
           min = key
           self.min_index = i
 
+class HeapPriorityQueue:
+    """Binary min-heap priority queue implementation.
+
+    Drop-in replacement for PriorityQueue with O(log n) append and pop.
+    """
+    def __init__(self):
+        """Initially empty priority queue."""
+        self.queue = []
+
+    def __len__(self):
+        # Number of elements in the queue.
+        return len(self.queue)
+
+    def append(self, key):
+        """Inserts an element in the priority queue."""
+        if key is None:
+            raise ValueError('Cannot insert None in the queue')
+        heapq.heappush(self.queue, key)
+
+    def min(self):
+        """The smallest element in the queue."""
+        if len(self.queue) == 0:
+            return None
+        return self.queue[0]
+
+    def pop(self):
+        """Removes the minimum element in the queue.
+
+        Returns:
+            The value of the removed element.
+        """
+        if len(self.queue) == 0:
+            return None
+        return heapq.heappop(self.queue)
+
+class BucketPriorityQueue:
+    """Calendar (bucket) priority queue for Transitions with integer times.
+
+    Transitions that happen at the same time share a FIFO bucket. Transitions
+    are queued in the order they are created, so each bucket is already sorted
+    by object_id, and only the distinct times need to be kept in a heap. Gate
+    delays are small integers, so there are far fewer distinct pending times
+    than pending transitions.
+    """
+    def __init__(self):
+        """Initially empty priority queue."""
+        self.buckets = {}
+        self.times = []
+        self.size = 0
+
+    def __len__(self):
+        # Number of elements in the queue.
+        return self.size
+
+    def append(self, key):
+        """Inserts a Transition in the priority queue.
+
+        Raises:
+            ValueError: An exception if the Transition is older than the last
+                Transition queued for the same time, which would break the
+                bucket's FIFO order.
+        """
+        if key is None:
+            raise ValueError('Cannot insert None in the queue')
+        bucket = self.buckets.get(key.time)
+        if bucket is None:
+            bucket = self.buckets[key.time] = collections.deque()
+            heapq.heappush(self.times, key.time)
+        elif bucket[-1].object_id > key.object_id:
+            raise ValueError('Transitions must be queued in creation order')
+        bucket.append(key)
+        self.size += 1
+
+    def min(self):
+        """The smallest element in the queue."""
+        if self.size == 0:
+            return None
+        return self.buckets[self.times[0]][0]
+
+    def pop(self):
+        """Removes the minimum element in the queue.
+
+        Returns:
+            The value of the removed element.
+        """
+        if self.size == 0:
+            return None
+        time = self.times[0]
+        bucket = self.buckets[time]
+        popped_key = bucket.popleft()
+        if len(bucket) == 0:
+            del self.buckets[time]
+            heapq.heappop(self.times)
+        self.size -= 1
+        return popped_key
+
+# Priority queue implementations that can drive a Simulation, by name.
+QUEUE_ENGINES = {'array': PriorityQueue, 'heap': HeapPriorityQueue,
+                 'bucket': BucketPriorityQueue}
+
 class Simulation:
     """State needed to compute a circuit's state as it evolves over time."""
     
-    def __init__(self, circuit):
+    def __init__(self, circuit, queue_class=HeapPriorityQueue):
         """Creates a simulation that will run on a pre-built circuit.
         
         The Circuit instance does not need to be completely built before it is 
@@ -405,11 +818,13 @@ class Simulation:
         
         Args:
             circuit: The circuit whose state transitions will be simulated.
+            queue_class: The priority queue implementation that holds pending
+                transitions (one of the QUEUE_ENGINES values).
         """
         self.circuit = circuit
         self.in_transitions = []
         
-        self.queue = PriorityQueue()
+        self.queue = queue_class()
         self.probes = []
         self.probe_all_undo_log = []
 
@@ -465,7 +880,7 @@ class Simulation:
             
     def probe_all_gates(self):
         """Turns on probing for all gates in the simulation."""
-        for gate in self.circuit.gates.itervalues():
+        for gate in self.circuit.gates.values():
             if not gate.probed:
                 self.probe_all_undo_log.append(gate)
                 gate.probe()
@@ -476,20 +891,25 @@ class Simulation:
             gate.probed = False
         self.probe_all_undo_log = []
     
-    @staticmethod
-    def from_file(file):
+    @classmethod
+    def from_file(cls, file, *args):
         """Builds a simulation by reading a textual description from a file.
         
         Args:
             file: A File object supplying the input.
+            args: Extra arguments for the simulation's constructor, e.g. the
+                priority queue implementation used by the simulation.
         
-        Returns: A new Simulation instance.
+        Returns: A new instance of the class that this method is called on.
         """
         circuit = Circuit()
-        simulation = Simulation(circuit)
+        simulation = cls(circuit, *args)
         
         while True:
-            command = file.readline().split()
+            line = file.readline()
+            if len(line) == 0:
+                raise ValueError('Input lacks done command')
+            command = line.split()
             if len(command) < 1:
                 continue
             if command[0] == 'table':
@@ -569,10 +989,305 @@ class Simulation:
         json.dump(self.trace_as_json(), file)
         file.write(');\n')
 
+class WheelSimulation(Simulation):
+    """Simulation that keeps pending transitions in a timing wheel.
+    
+    Gate delays are small integers, so every pending transition happens at most
+    max_delay time units after the current time. The wheel has a slot for each
+    of these times, indexed by time % wheel size. A slot maps the gates that
+    transition at its time to their new outputs, so a gate whose inputs change
+    several times during a step is only evaluated once, and no Transition
+    objects are created.
+    
+    The probe results are identical to those of Simulation.
+    """
+    
+    # Upper bound for the number of slots in the wheel. In circuits with longer
+    # delays, a time whose slot is taken by another time goes in an overflow
+    # dictionary.
+    MAX_WHEEL_SIZE = 1 << 16
+    
+    def __init__(self, circuit):
+        """Creates a simulation that will run on a pre-built circuit.
+        
+        Args:
+            circuit: The circuit whose state transitions will be simulated.
+        """
+        self.circuit = circuit
+        self.in_transitions = []
+        
+        self.probes = []
+        self.probe_all_undo_log = []
+    
+    def step(self):
+        """Runs the simulation for one time slice.
+        
+        Returns:
+            The simulation time after the step occurred.
+        """
+        step_time, transitions = self._pop_transitions()
+        
+        # Need to apply all the transitions at the same time before propagating.
+        changed = []
+        for gate, output in transitions:
+            self._apply(gate, output, step_time, changed)
+        
+        # Propagate the transition effects, evaluating each gate once.
+        affected = set()
+        for gate in changed:
+            affected.update(gate.out_gates)
+        for gate in affected:
+            self._schedule(gate.transition_time(step_time), gate,
+                           gate.transition_output())
+        
+        return step_time
+    
+    def run(self):
+        """Runs the simulation to completion."""
+        self._start()
+        while len(self.times) > 0 or self.next_flip < len(self.flips):
+            self.step()
+        self.probes.sort()
+    
+    def _start(self):
+        # Sets up an empty wheel and the list of flips on the input gates.
+        max_delay = self._max_delay()
+        wheel_size = 1
+        while wheel_size <= max_delay and wheel_size < self.MAX_WHEEL_SIZE:
+            wheel_size *= 2
+        self.wheel = [None] * wheel_size
+        self.wheel_mask = wheel_size - 1
+        self.overflow = {}
+        self.times = []
+        self.flips = sorted(self.in_transitions)
+        self.next_flip = 0
+    
+    def _max_delay(self):
+        # The longest gate delay in the circuit.
+        max_delay = 0
+        for gate_type in self.circuit.gate_types.values():
+            max_delay = max(max_delay, gate_type.delay)
+        return max_delay
+    
+    def _pop_transitions(self):
+        # Removes the transitions at the earliest pending time.
+        #
+        # Returns a (time, transitions) tuple, where transitions is a list of
+        # (gate, new output) pairs. The flips were created before any
+        # propagated transition, so they go first.
+        step_time = None
+        if self.next_flip < len(self.flips):
+            step_time = self.flips[self.next_flip][0]
+        if len(self.times) > 0 and (step_time is None or
+                                    self.times[0] <= step_time):
+            step_time = heapq.heappop(self.times)
+            batch = self._take_batch(step_time)
+        else:
+            batch = {}
+        transitions = []
+        while (self.next_flip < len(self.flips) and
+               self.flips[self.next_flip][0] == step_time):
+            flip = self.flips[self.next_flip]
+            self.next_flip += 1
+            transitions.append((flip[3], flip[2]))
+        transitions.extend(batch.items())
+        return (step_time, transitions)
+    
+    def _apply(self, gate, output, time, changed):
+        # Makes a transition effective, if it changes the gate's output.
+        if gate.output == output:
+            return
+        gate.output = output
+        if gate.probed:
+            self.probes.append([time, gate.name, output])
+        changed.append(gate)
+    
+    def _schedule(self, time, gate, output):
+        # Records a gate's new output in the batch for the given time.
+        #
+        # All the pending transitions of a gate at a given time come from the
+        # same step, so they all have the same output.
+        slot = self.wheel[time & self.wheel_mask]
+        if slot is not None and slot[0] == time:
+            batch = slot[1]
+        elif time in self.overflow:
+            batch = self.overflow[time]
+        else:
+            batch = {}
+            if slot is None:
+                self.wheel[time & self.wheel_mask] = [time, batch]
+            else:
+                self.overflow[time] = batch
+            heapq.heappush(self.times, time)
+        batch[gate] = output
+    
+    def _take_batch(self, time):
+        # Removes the batch of transitions at the given time from the wheel.
+        slot = self.wheel[time & self.wheel_mask]
+        if slot is not None and slot[0] == time:
+            self.wheel[time & self.wheel_mask] = None
+            return slot[1]
+        return self.overflow.pop(time)
+
+class CompiledSimulation(WheelSimulation):
+    """Timing wheel simulation that runs on a CompiledCircuit.
+    
+    Instead of reading the outputs of a gate's in-gates, the simulation keeps
+    the gate's inputs as a number that indexes its truth table's bitmask, and
+    flips the number's bits as the in-gates' outputs change. Gates are
+    represented by their numbers, so there are no attribute lookups in the
+    simulation loop. The Gate instances' outputs are not updated.
+    
+    The probe results are identical to those of Simulation.
+    """
+    
+    # Number of flips read at a time by run, when it overlaps loading the input
+    # with the simulation.
+    FLIP_BATCH = 4096
+    
+    def __init__(self, circuit):
+        """Creates a simulation that will run on a pre-built circuit.
+        
+        Args:
+            circuit: The Circuit whose state transitions will be simulated. It is
+                compiled when the run method is called.
+        """
+        WheelSimulation.__init__(self, circuit)
+        self.compiled = None
+        self.loader = None
+        self.time = None
+    
+    @classmethod
+    def load(cls, file, overlap=False, chunk_size=1 << 20):
+        """Builds a simulation with a NetlistLoader, skipping the object model.
+        
+        The simulation's circuit is None, so the methods that need Gate objects
+        (e.g. add_transition, probe_all_gates, jsonp_to_file) cannot be used.
+        
+        Args:
+            file: A File object supplying the input.
+            overlap: If True, only the circuit is read right away, and the run
+                method reads the flips as the simulation advances. The flips
+                must be sorted by time.
+            chunk_size: Number of characters read from the file at a time.
+        
+        Returns: A new instance of the class that this method is called on.
+        """
+        loader = NetlistLoader(file, chunk_size)
+        simulation = cls(None)
+        simulation.compiled = loader.load_circuit()
+        if overlap:
+            simulation.loader = loader
+        else:
+            simulation.in_transitions = loader.read_flips()
+        return simulation
+    
+    def step(self):
+        """Runs the simulation for one time slice.
+        
+        Returns:
+            The simulation time after the step occurred.
+        """
+        step_time, transitions = self._pop_transitions()
+        self.time = step_time
+        compiled = self.compiled
+        outputs = self.outputs
+        
+        # Need to apply all the transitions at the same time before propagating.
+        changed = []
+        for gate, output in transitions:
+            if outputs[gate] == output:
+                continue
+            outputs[gate] = output
+            if compiled.probed[gate]:
+                self.probes.append([step_time, compiled.gate_names[gate],
+                                    output])
+            changed.append(gate)
+        
+        # Propagate the transition effects, evaluating each gate once.
+        fanout_offsets = compiled.fanout_offsets
+        fanout_gates = compiled.fanout_gates
+        fanout_bits = compiled.fanout_bits
+        inputs = self.inputs
+        affected = set()
+        for gate in changed:
+            for edge in xrange(fanout_offsets[gate], fanout_offsets[gate + 1]):
+                out_gate = fanout_gates[edge]
+                inputs[out_gate] ^= fanout_bits[edge]
+                affected.add(out_gate)
+        gate_types = compiled.gate_types
+        type_delays = compiled.type_delays
+        type_masks = compiled.type_masks
+        for gate in affected:
+            gate_type = gate_types[gate]
+            self._schedule(step_time + type_delays[gate_type], gate,
+                           (type_masks[gate_type] >> inputs[gate]) & 1)
+        
+        return step_time
+    
+    def run(self):
+        """Runs the simulation to completion."""
+        if self.loader is None:
+            return WheelSimulation.run(self)
+        self._start()
+        while True:
+            self._read_flips()
+            if len(self.times) == 0 and self.next_flip == len(self.flips):
+                break
+            self.step()
+        self.probes.sort()
+    
+    def _read_flips(self):
+        # Reads flips until all the flips at the next pending time are known.
+        #
+        # The flips are sorted by time, so that happens as soon as a flip that
+        # comes after the next pending time is read.
+        loader = self.loader
+        while not loader.done:
+            if self.next_flip < len(self.flips):
+                next_time = self.flips[self.next_flip][0]
+                if len(self.times) > 0 and self.times[0] < next_time:
+                    next_time = self.times[0]
+                if self.flips[-1][0] > next_time:
+                    return
+            del self.flips[:self.next_flip]
+            self.next_flip = 0
+            for flip in loader.read_flips(self.FLIP_BATCH):
+                if self.time is not None and flip[0] <= self.time:
+                    raise ValueError('Flips must be sorted by time')
+                self.flips.append(flip)
+            self.flips.sort()
+    
+    def _max_delay(self):
+        # The longest gate delay in the circuit.
+        return max([0] + list(self.compiled.type_delays))
+    
+    def _start(self):
+        # Compiles the circuit, and sets up the gates' state.
+        if self.circuit is not None:
+            self.compiled = CompiledCircuit(self.circuit)
+        WheelSimulation._start(self)
+        compiled = self.compiled
+        self.time = None
+        self.outputs = bytearray(len(compiled))
+        self.inputs = array.array('l', [0]) * len(compiled)
+        self.flips = [[flip[0], flip[1], flip[2], compiled.gate_ids[flip[1]]]
+                      for flip in self.flips]
+
 # Command-line controller.
 if __name__ == '__main__':
     import sys
-    sim = Simulation.from_file(sys.stdin)
+    if os.environ.get('SIMULATION') == 'wheel':
+        sim = WheelSimulation.from_file(sys.stdin)
+    elif os.environ.get('SIMULATION') == 'compiled':
+        sim = CompiledSimulation.from_file(sys.stdin)
+    elif os.environ.get('SIMULATION') == 'stream':
+        if os.environ.get('TRACE') == 'jsonp':
+            raise ValueError('SIMULATION=stream does not support TRACE=jsonp')
+        sim = CompiledSimulation.load(sys.stdin, overlap=True)
+    else:
+        queue_class = QUEUE_ENGINES[os.environ.get('QUEUE', 'heap')]
+        sim = Simulation.from_file(sys.stdin, queue_class)
     if os.environ.get('TRACE') == 'jsonp':
         sim.layout_from_file(sys.stdin)
         sim.probe_all_gates()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+"""Benchmark harness for the circuit simulator's engines.
+
+Replays the circuits in tests/ and a few synthetic netlists through the
+priority queue engines in QUEUE_ENGINES, WheelSimulation and
+CompiledSimulation, and reports the number of simulated events (gate output
+transitions) per second. It also reports the time it takes to read each
+netlist with Simulation.from_file and with NetlistLoader, and the memory used
+by each gate in the object model and in CompiledCircuit.
+
+Usage:
+    python circuit_benchmark.py [--engines array,heap] [--gates 1000,10000]
+
+The array engine is the reference implementation. It is not benchmarked by
+default, because it takes minutes on 5devadas13 and hours on the larger
+synthetic netlists.
+"""
+
+import array
+import glob
+import optparse
+import os
+import random
+import sys
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from circuit import *
+
+# Truth tables used by the synthetic netlists.
+SYNTHETIC_TABLES = [('and2', '0 0 0 1'), ('or2', '0 1 1 1'),
+                    ('xor2', '0 1 1 0'), ('nand2', '1 1 1 0')]
+
+def synthetic_netlist(gate_count, width=256, wave_count=16, max_delay=8,
+                      seed=6006):
+    """Generates the text of a random layered netlist.
+
+    The gates are arranged in levels of the given width, and each gate takes
+    its two inputs from the previous level. All the gates in a level have the
+    same delay, so every wave of input transitions reaches a level at the
+    same time, and the simulation's activity doesn't blow up with depth.
+
+    Args:
+        gate_count: The number of non-input gates in the circuit.
+        width: The number of gates in each level, including the input level.
+        wave_count: The number of times when some inputs flip.
+        max_delay: Level delays are picked between 1 and this value.
+        seed: Seed for the random number generator.
+
+    Returns:
+        A string in the simulator's input format.
+    """
+    rng = random.Random(seed)
+    lines = ['table eq 0 1']
+    lines.extend('table %s %s' % table for table in SYNTHETIC_TABLES)
+    lines.append('type in eq 0')
+    for table, _ in SYNTHETIC_TABLES:
+        for delay in xrange(1, max_delay + 1):
+            lines.append('type %s_%d %s %d' % (table, delay, table, delay))
+    level = ['i%d' % i for i in xrange(width)]
+    lines.extend('gate %s in' % name for name in level)
+    gate_id = 0
+    while gate_id < gate_count:
+        delay = rng.randint(1, max_delay)
+        next_level = []
+        for i in xrange(min(width, gate_count - gate_id)):
+            table = rng.choice(SYNTHETIC_TABLES)[0]
+            lines.append('gate g%d %s_%d %s %s' % (gate_id, table, delay,
+                                                   rng.choice(level),
+                                                   rng.choice(level)))
+            next_level.append('g%d' % gate_id)
+            gate_id += 1
+        level = next_level
+    lines.extend('probe %s' % name for name in level)
+    for wave in xrange(wave_count):
+        for i in rng.sample(xrange(width), width // 4):
+            lines.append('flip i%d %d %d' % (i, rng.randrange(2), wave))
+    lines.append('done')
+    return '\n'.join(lines) + '\n'
+
+def queue_simulation_factory(queue_class):
+    """A function that reads a Simulation using a priority queue engine."""
+    return lambda file: Simulation.from_file(file, queue_class)
+
+# Functions that read a netlist into a simulation, by engine name.
+SIMULATION_FACTORIES = dict((name, queue_simulation_factory(queue_class))
+                            for name, queue_class in QUEUE_ENGINES.items())
+SIMULATION_FACTORIES['wheel'] = WheelSimulation.from_file
+SIMULATION_FACTORIES['compiled'] = CompiledSimulation.from_file
+
+def object_model_bytes(circuit):
+    """The memory used by a circuit's Gate instances and their lists.
+
+    Gate names are not counted, because they are shared with CompiledCircuit.
+    """
+    total = 0
+    for gate in circuit.gates.values():
+        total += (sys.getsizeof(gate) + sys.getsizeof(gate.__dict__) +
+                  sys.getsizeof(gate.in_gates) + sys.getsizeof(gate.out_gates))
+    return total
+
+def compiled_bytes(compiled):
+    """The memory used by a CompiledCircuit's per-gate arrays.
+
+    The arrays that hold the simulation state (an output byte and an inputs
+    number per gate) are included.
+    """
+    arrays = [compiled.gate_types, compiled.fanin_offsets,
+              compiled.fanin_gates, compiled.fanout_offsets,
+              compiled.fanout_gates, compiled.fanout_bits, compiled.probed,
+              bytearray(len(compiled)), array.array('l', [0]) * len(compiled)]
+    return sum(sys.getsizeof(a) for a in arrays)
+
+def benchmark_netlist(text, engine):
+    """Simulates a netlist with one of the simulator's engines.
+
+    All the gates are probed, so every engine records the same events.
+
+    Args:
+        text: The netlist, in the simulator's input format.
+        engine: The name of the engine in SIMULATION_FACTORIES.
+
+    Returns:
+        A (events, seconds, probes) tuple, where events is the number of gate
+        output transitions, and seconds only covers the simulation, not the
+        parsing.
+    """
+    sim = SIMULATION_FACTORIES[engine](StringIO(text))
+    sim.probe_all_gates()
+    start = time.time()
+    sim.run()
+    seconds = time.time() - start
+    return (len(sim.probes), seconds, sim.probes)
+
+# Functions that read a netlist into a CompiledSimulation, by loader name.
+LOADERS = {
+    'from_file': CompiledSimulation.from_file,
+    'load': CompiledSimulation.load,
+    'overlap': lambda file: CompiledSimulation.load(file, overlap=True),
+}
+
+def benchmark_loader(text, loader):
+    """Reads and simulates a netlist with one of the LOADERS.
+
+    Returns:
+        A (load seconds, total seconds) tuple. With the overlap loader, most of
+        the input is read during the simulation, so only the total is
+        meaningful.
+    """
+    start = time.time()
+    sim = LOADERS[loader](StringIO(text))
+    load_seconds = time.time() - start
+    sim.run()
+    return (load_seconds, time.time() - start)
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option('--engines', default='heap,bucket,wheel,compiled',
+                      help='comma-separated SIMULATION_FACTORIES names')
+    parser.add_option('--gates', default='1000,10000,100000',
+                      help='comma-separated synthetic netlist sizes')
+    options, _ = parser.parse_args(argv)
+    engines = options.engines.split(',')
+    netlists = []
+    test_dir = os.path.join(os.path.dirname(__file__), 'tests')
+    for in_filename in sorted(glob.glob(os.path.join(test_dir, '*.in'))):
+        with open(in_filename) as in_file:
+            netlists.append((os.path.basename(in_filename), in_file.read()))
+    for gate_count in options.gates.split(','):
+        if gate_count:
+            netlists.append(('synthetic%s' % gate_count,
+                             synthetic_netlist(int(gate_count))))
+
+    print('%-20s %-8s %10s %10s %14s' % ('netlist', 'engine', 'events',
+                                          'seconds', 'events/second'))
+    for name, text in netlists:
+        reference = None
+        for engine in engines:
+            events, seconds, probes = benchmark_netlist(text, engine)
+            if reference is None:
+                reference = probes
+            elif probes != reference:
+                raise RuntimeError('%s disagrees with %s on %s' %
+                                   (engine, engines[0], name))
+            print('%-20s %-8s %10d %10.3f %14.0f' % (
+                  name, engine, events, seconds, events / max(seconds, 1e-9)))
+            sys.stdout.flush()
+
+    print('')
+    print('%-20s %-10s %10s %10s %10s' % ('netlist', 'loader', 'load s',
+                                          'total s', 'load MB/s'))
+    for name, text in netlists:
+        for loader in sorted(LOADERS):
+            load_seconds, total_seconds = benchmark_loader(text, loader)
+            print('%-20s %-10s %10.3f %10.3f %10.1f' % (
+                  name, loader, load_seconds, total_seconds,
+                  len(text) / 1e6 / max(load_seconds, 1e-9)))
+            sys.stdout.flush()
+
+    print('')
+    print('%-20s %10s %14s %14s' % ('netlist', 'gates', 'object B/gate',
+                                     'compiled B/gate'))
+    for name, text in netlists:
+        circuit = Simulation.from_file(StringIO(text)).circuit
+        gate_count = len(circuit.gates)
+        print('%-20s %10d %14.1f %14.1f' % (
+              name, gate_count, object_model_bytes(circuit) / float(gate_count),
+              compiled_bytes(CompiledCircuit(circuit)) / float(gate_count)))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
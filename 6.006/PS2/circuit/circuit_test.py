@@ -4,6 +4,7 @@ import unittest
 import sys
 import glob
 import re
+from StringIO import StringIO
 from circuit import *
 
 class CircuitTest(unittest.TestCase):
@@ -37,6 +38,111 @@ class CircuitTest(unittest.TestCase):
                     else: 
                         print 'Failed'
                     self.assertTrue(same)
+
+    def testQueueEngines(self):
+        print 'Testing queue engines:'
+        for engine in sorted(QUEUE_ENGINES):
+            print 'Testing {0} ......'.format(engine),
+            sys.stdout.flush()
+            queue = QUEUE_ENGINES[engine]()
+            gate = Gate('g', GateType('in', TruthTable('eq', [0, 1]), 0))
+            transitions = [Transition(gate, 1, time)
+                           for time in [5, 3, 5, 0, 3, 9, 0]]
+            for transition in transitions:
+                queue.append(transition)
+            self.assertEqual(len(transitions), len(queue))
+            popped = []
+            while len(queue) > 0:
+                self.assertTrue(queue.min() is queue.min())
+                popped.append(queue.pop())
+            self.assertEqual(sorted(transitions), popped)
+            self.assertEqual(None, queue.pop())
+            print 'OK'
+
+    def testWheelCorrectness(self):
+        class TinyWheelSimulation(WheelSimulation):
+            # Forces most times into the overflow dictionary.
+            MAX_WHEEL_SIZE = 4
+        for simulation_class in [WheelSimulation, TinyWheelSimulation,
+                                 CompiledSimulation]:
+            for in_filename in self._in_files:
+                with open(in_filename) as in_file:
+                    sim = simulation_class.from_file(in_file)
+                    sim.run()
+                    out_lines = sim.outputs_to_line_list()
+                gold_filename = re.sub('\.in$', '.gold', in_filename)
+                with open(gold_filename) as gold_file:
+                    self.assertTrue(self._cmp_files(gold_file, out_lines))
+
+    def testTruthTableBitmask(self):
+        table = TruthTable('mux', [0, 0, 1, 1, 0, 1, 0, 1])
+        mask = table.bitmask()
+        for i in xrange(8):
+            inputs = [(i >> 2) & 1, (i >> 1) & 1, i & 1]
+            self.assertEqual(table.output(inputs), (mask >> i) & 1)
+
+    def testCompiledCircuit(self):
+        with open(self._in_files[1]) as in_file:
+            circuit = Simulation.from_file(in_file).circuit
+        compiled = CompiledCircuit(circuit)
+        self.assertEqual(len(circuit.gates), len(compiled))
+        for gate in circuit.gates.values():
+            gate_id = compiled.gate_ids[gate.name]
+            start = compiled.fanout_offsets[gate_id]
+            end = compiled.fanout_offsets[gate_id + 1]
+            out_names = [compiled.gate_names[compiled.fanout_gates[edge]]
+                         for edge in xrange(start, end)]
+            self.assertEqual(sorted(g.name for g in gate.out_gates),
+                             sorted(out_names))
+            self.assertEqual(int(gate.probed), compiled.probed[gate_id])
+
+    def testLoaderCorrectness(self):
+        for overlap in [False, True]:
+            for in_filename in self._in_files:
+                with open(in_filename) as in_file:
+                    sim = CompiledSimulation.load(in_file, overlap, 7)
+                    sim.run()
+                    out_lines = sim.outputs_to_line_list()
+                gold_filename = re.sub('\.in$', '.gold', in_filename)
+                with open(gold_filename) as gold_file:
+                    self.assertTrue(self._cmp_files(gold_file, out_lines))
+
+    def testLoaderValidation(self):
+        header = ('table and2 0 0 0 1\ntable eq 0 1\ntype in eq 0\n'
+                  'type and and2 1\ngate a in\ngate b in\n')
+        bad_inputs = [header + 'gate c and a\ndone\n',
+                      header + 'gate c and a d\ndone\n',
+                      header + 'gate c nor a b\ndone\n',
+                      header + 'gate c and a b\nflip a 2 0\ndone\n',
+                      header + 'gate c and a b\nflip a 1 0\n',
+                      header + 'flip a 1 0\ngate c and a b\ndone\n',
+                      header + 'type or or2 1\ngate c or a b\ndone\n']
+        for text in bad_inputs:
+            self.assertRaises(ValueError, CompiledSimulation.load,
+                              StringIO(text))
+        self.assertRaises(ValueError, Simulation.from_file,
+                          StringIO(header + 'gate c and a b\n'))
+        unsorted = header + ('gate c and a b\nprobe c\nflip a 1 0\n'
+                             'flip b 1 5\nflip a 0 9\nflip b 0 2\ndone\n')
+        sim = CompiledSimulation.load(StringIO(unsorted))
+        sim.run()
+        self.assertEqual([[6, 'c', 1], [10, 'c', 0]], sim.probes)
+        class TinyBatchSimulation(CompiledSimulation):
+            # Reads one flip at a time, so flip b 0 2 comes after time 5.
+            FLIP_BATCH = 1
+        sim = TinyBatchSimulation.load(StringIO(unsorted), True)
+        self.assertRaises(ValueError, sim.run)
+
+    def testEnginesAgree(self):
+        for in_filename in self._in_files[:4]:
+            probes = []
+            for engine in sorted(QUEUE_ENGINES):
+                with open(in_filename) as in_file:
+                    sim = Simulation.from_file(in_file, QUEUE_ENGINES[engine])
+                    sim.run()
+                    probes.append(sim.probes)
+            for engine_probes in probes:
+                self.assertEqual(probes[0], engine_probes)
     
 if __name__ == '__main__':
     unittest.main()
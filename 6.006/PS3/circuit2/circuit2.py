@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 
+import array  # Used by FenwickRangeIndex
+import bisect  # Used by SlabCrossVerifier
 import json   # Used when TRACE=jsonp
+import multiprocessing  # Used by SlabCrossVerifier
 import os     # Used to get the TRACE environment variable
 import re     # Used when TRACE=jsonp
 import sys    # Used to smooth over the range / xrange issue.
@@ -533,6 +536,29 @@ Supports insert, delete, find, find_min, next_larger each in O(lg n) time.
         if node.key <= h:
             self.node_list(node.right, l, h, result)
 
+    def iter_list(self, l, h):
+        """Yields the keys k such that l <= k <= h, in sorted order.
+        
+        Walks the same nodes as node_list, but keeps only a stack of O(lg n)
+        nodes in memory instead of building the list of keys. The index must
+        not be changed until the iteration is done.
+        """
+        stack = []
+        node = self.root
+        while node is not None or len(stack) > 0:
+            if node is not None:
+                if node.key >= l:
+                    stack.append(node)
+                    node = node.left
+                else:
+                    node = node.right
+            else:
+                node = stack.pop()
+                if node.key > h:
+                    return
+                yield node.key
+                node = node.right
+
     def lca(self, l, h):
         node = self.root
         while (node != None and not (l <= node.key and h >= node.key)):
@@ -598,9 +624,89 @@ class TracedRangeIndex(RangeIndex):
                        'to': last_key.key, 'count': result})
     return result
 
+class FenwickRangeIndex(object):
+  """Count-only range index over a fixed set of keys.
+  
+  All the keys that will be added or queried are given to the constructor, and
+  are mapped to their ranks in sorted order (coordinate compression). The number
+  of added keys at each rank is kept in a Fenwick (binary indexed) tree, which
+  is a flat array of integers, so add, remove and count take O(lg n) time and
+  don't allocate memory.
+  
+  Unlike RangeIndex, the index holds plain keys, and it can't list them.
+  """
+  
+  def __init__(self, keys):
+    """Creates an empty index for a set of keys.
+    
+    Args:
+      keys: all the keys that will be passed to add, remove and count
+    """
+    sorted_keys = sorted(set(keys))
+    self.ranks = dict((sorted_keys[i], i + 1) for i in xrange(len(sorted_keys)))
+    self.tree = array.array('l', [0]) * (len(sorted_keys) + 1)
+  
+  def add(self, key):
+    """Inserts a key into the index."""
+    self._update(self.ranks[key], 1)
+  
+  def remove(self, key):
+    """Deletes a key that was added to the index."""
+    self._update(self.ranks[key], -1)
+  
+  def count(self, low, high):
+    """The number of keys k in the index such that low <= k <= high."""
+    return self._prefix_count(self.ranks[high]) - self._prefix_count(
+        self.ranks[low] - 1)
+  
+  def _update(self, rank, delta):
+    # Adds delta to the number of keys with the given rank.
+    tree = self.tree
+    size = len(tree)
+    while rank < size:
+      tree[rank] += delta
+      rank += rank & -rank
+  
+  def _prefix_count(self, rank):
+    # The number of keys whose ranks are at most the given rank.
+    tree = self.tree
+    total = 0
+    while rank > 0:
+      total += tree[rank]
+      rank -= rank & -rank
+    return total
+
+class SortedArrayRangeIndex(object):
+  """Count-only range index that keeps its keys in a sorted list.
+  
+  add and remove shift the end of the list, which takes O(n) time, but the
+  shifting and the binary searches run in C. Unless the index holds a very large
+  number of keys at once, this is faster than FenwickRangeIndex.
+  """
+  
+  def __init__(self):
+    """Creates an empty index."""
+    self.keys = []
+  
+  def add(self, key):
+    """Inserts a key into the index."""
+    bisect.insort(self.keys, key)
+  
+  def remove(self, key):
+    """Deletes a key that was added to the index."""
+    del self.keys[bisect.bisect_left(self.keys, key)]
+  
+  def count(self, low, high):
+    """The number of keys k in the index such that low <= k <= high."""
+    return (bisect.bisect_right(self.keys, high) -
+            bisect.bisect_left(self.keys, low))
+
 class ResultSet(object):
   """Records the result of the circuit verifier (pairs of crossing wires)."""
   
+  # Number of crossings written to a file at a time.
+  WRITE_BATCH = 4096
+  
   def __init__(self):
     """Creates an empty result set."""
     self.crossings = []
@@ -611,22 +717,106 @@ class ResultSet(object):
   
   def write_to_file(self, file):
     """Write the result to a file."""
-    for crossing in self.crossings:
-      file.write(' '.join(crossing))
-      file.write('\n')
+    self._write_crossings(self.crossings, file)
+  
+  def _write_crossings(self, crossings, file):
+    """Writes crossings (pairs of wire names) to a file, in batches."""
+    lines = []
+    for crossing in crossings:
+      lines.append(' '.join(crossing))
+      if len(lines) == self.WRITE_BATCH:
+        lines.append('')
+        file.write('\n'.join(lines))
+        lines = []
+    if len(lines) > 0:
+      lines.append('')
+      file.write('\n'.join(lines))
+
+class StreamingResultSet(ResultSet):
+  """A result set that writes crossings as they are found, without storing them.
+  
+  The crossings come from an iterator, e.g. CrossVerifier.iter_crossings, which
+  write_to_file consumes, so the result can only be written once.
+  """
+  
+  def __init__(self, crossing_iterator):
+    """Creates a result set that will read crossings from an iterator.
+    
+    Args:
+      crossing_iterator: yields the pairs of wires that cross each other
+    """
+    ResultSet.__init__(self)
+    self.crossing_iterator = crossing_iterator
+  
+  def write_to_file(self, file):
+    """Write the result to a file."""
+    self._write_crossings((sorted([wire1.name, wire2.name])
+                           for wire1, wire2 in self.crossing_iterator), file)
 
 class TracedResultSet(ResultSet):
   """Augments ResultSet to build a trace for the visualizer."""
   
-  def __init__(self, trace):
-    """Sets the object receiving tracing info."""
+  def __init__(self, trace, keep_crossings=True):
+    """Sets the object receiving tracing info.
+    
+    Args:
+      trace: the list (or JsonpTraceWriter) receiving tracing info
+      keep_crossings: if False, crossings only go to the trace
+    """
     ResultSet.__init__(self)
     self.trace = trace
+    self.keep_crossings = keep_crossings
     
   def add_crossing(self, wire1, wire2):
     self.trace.append({'type': 'crossing', 'id1': wire1.name,
                        'id2': wire2.name})
-    ResultSet.add_crossing(self, wire1, wire2)
+    if self.keep_crossings:
+      ResultSet.add_crossing(self, wire1, wire2)
+
+class JsonpTraceWriter(object):
+  """Writes the visualizer trace to a JSONP file while it is recorded.
+  
+  This can be used instead of the trace list in TracedCrossVerifier. Each event
+  is written to the file as soon as it is appended, so the trace never has to
+  fit in memory.
+  
+  The writer can record only every k-th sweep line position, together with the
+  queries and crossings found there. Index additions and deletions are always
+  recorded, so the visualizer's view of the range index stays consistent.
+  """
+  
+  def __init__(self, file, layer, sample_every=1):
+    """Starts writing a trace.
+    
+    Args:
+      file: the File object receiving the JSONP trace
+      layer: the WireLayer being verified, which is written first
+      sample_every: records every k-th sweep line position
+    """
+    self.file = file
+    self.sample_every = sample_every
+    self.sweep_count = 0
+    self.sampled = True
+    self.event_count = 0
+    file.write('onJsonp({"layer": ')
+    file.write(json.dumps(layer.as_json()))
+    file.write(', "trace": [')
+  
+  def append(self, event):
+    """Writes an event to the trace, unless it's left out by sampling."""
+    if event['type'] == 'sweep':
+      self.sampled = self.sweep_count % self.sample_every == 0
+      self.sweep_count += 1
+    if not self.sampled and event['type'] in ('sweep', 'list', 'crossing'):
+      return
+    if self.event_count > 0:
+      self.file.write(', ')
+    self.file.write(json.dumps(event))
+    self.event_count += 1
+  
+  def close(self):
+    """Finishes the JSONP trace. The file is not closed."""
+    self.file.write(']});\n')
 
 class KeyWirePair(object):
   """Wraps a wire and the key representing it in the range index.
@@ -713,12 +903,19 @@ class CrossVerifier(object):
     self.result_set = ResultSet()
     self.performed = False
   
+  # The range index used by count_crossings: 'fenwick' for FenwickRangeIndex,
+  # 'sorted' for SortedArrayRangeIndex, or 'avl' for the RangeIndex used by
+  # wire_crossings.
+  count_engine = 'fenwick'
+  
   def count_crossings(self):
     """Returns the number of pairs of wires that cross each other."""
     if self.performed:
       raise 
     self.performed = True
-    return self._compute_crossings(True)
+    if self.count_engine == 'avl':
+      return self._compute_crossings(True)
+    return self._count_crossings_with(self._count_index())
 
   def wire_crossings(self):
     """An array of pairs of wires that cross each other."""
@@ -727,6 +924,28 @@ class CrossVerifier(object):
     self.performed = True
     return self._compute_crossings(False)
 
+  def iter_crossings(self):
+    """Yields the pairs of wires that cross each other, as the sweep advances.
+    
+    Unlike wire_crossings, the crossings are not stored, so the memory used
+    only depends on the number of wires that cross the sweep line.
+    """
+    if self.performed:
+      raise 
+    self.performed = True
+    for event in self.events:
+      event_x, event_type, wire = event[0], event[3], event[4]
+      self.trace_sweep_line(event_x)
+      
+      if event_type == 'add':
+        self.index.add(KeyWirePair(wire.y1, wire))
+      elif event_type == 'query':
+        for kwp in self.index.iter_list(KeyWirePairL(wire.y1),
+                                        KeyWirePairH(wire.y2)):
+          yield (wire, kwp.wire)
+      else:
+        self.index.remove(KeyWirePair(wire.y1, wire))
+
   def _events_from_layer(self, layer):
     """Populates the sweep line events from the wire layer."""
     for wire in layer.wires.values():
@@ -766,6 +985,30 @@ class CrossVerifier(object):
      
 
   
+  def _count_index(self):
+    """Builds the count-only range index selected by count_engine."""
+    if self.count_engine == 'sorted':
+      return SortedArrayRangeIndex()
+    keys = []
+    for event in self.events:
+      keys.append(event[4].y1)
+      if event[1] == 1:
+        keys.append(event[4].y2)
+    return FenwickRangeIndex(keys)
+  
+  def _count_crossings_with(self, index):
+    """Implements count_crossings using a count-only range index."""
+    result = 0
+    for event in self.events:
+      event_type, wire = event[1], event[4]
+      if event_type == 0:
+        index.add(wire.y1)
+      elif event_type == 1:
+        result += index.count(wire.y1, wire.y2)
+      else:
+        index.remove(wire.y1)
+    return result
+  
   def trace_sweep_line(self, x):
     """When tracing is enabled, adds info about where the sweep line is.
     
@@ -778,11 +1021,24 @@ class CrossVerifier(object):
 class TracedCrossVerifier(CrossVerifier):
   """Augments CrossVerifier to build a trace for the visualizer."""
   
-  def __init__(self, layer):
+  # FenwickRangeIndex can't be traced.
+  count_engine = 'avl'
+  
+  def __init__(self, layer, trace=None):
+    """Verifier for a layer of wires.
+    
+    Args:
+      layer: the WireLayer to be verified
+      trace: optional JsonpTraceWriter receiving the trace; by default, the
+          trace is kept in memory, and so are the crossings
+    """
     CrossVerifier.__init__(self, layer)
-    self.trace = []
+    if trace is None:
+      self.trace = []
+    else:
+      self.trace = trace
     self.index = TracedRangeIndex(self.trace)
-    self.result_set = TracedResultSet(self.trace)
+    self.result_set = TracedResultSet(self.trace, trace is None)
     
   def trace_sweep_line(self, x):
     self.trace.append({'type': 'sweep', 'x': x})
@@ -791,20 +1047,128 @@ class TracedCrossVerifier(CrossVerifier):
     """List that obeys the JSON format restrictions with the verifier trace."""
     return self.trace
 
+class SlabCrossVerifier(CrossVerifier):
+  """Counts crossings by splitting the layer into vertical slabs.
+  
+  The slab boundaries are picked so that each slab has about the same number of
+  vertical wires. Each slab is swept separately, in a pool of worker processes,
+  and the slabs' crossing counts are added up. A horizontal wire is swept,
+  clipped to the slab's boundaries, in the slabs that contain its endpoints. The
+  slabs in between are completely covered by the wire, so they only need its Y
+  coordinate.
+  """
+  
+  def __init__(self, layer, slab_count=None, processes=None):
+    """Verifier for a layer of wires.
+    
+    Args:
+      layer: the WireLayer to be verified
+      slab_count: the number of slabs; defaults to the number of processes
+      processes: the number of worker processes; defaults to the number of
+          CPUs, and 1 sweeps the slabs in this process
+    """
+    CrossVerifier.__init__(self, layer)
+    self.processes = processes or multiprocessing.cpu_count()
+    self.slab_count = slab_count or self.processes
+  
+  def count_crossings(self):
+    """Returns the number of pairs of wires that cross each other."""
+    if self.performed:
+      raise 
+    self.performed = True
+    slabs = self.slabs()
+    if self.processes == 1:
+      return sum(count_slab_crossings(slab) for slab in slabs)
+    pool = multiprocessing.Pool(self.processes)
+    try:
+      return sum(pool.map(count_slab_crossings, slabs))
+    finally:
+      pool.close()
+      pool.join()
+  
+  def slabs(self):
+    """Splits the layer's wires into vertical slabs.
+    
+    Returns a list of (low x, high x, wires, spanning ys) tuples. A slab covers
+    the X coordinates between low x (included) and high x (excluded). Its wires
+    are the vertical wires in the slab and the horizontal wires with an endpoint
+    in the slab. Spanning ys is the sorted list of the Y coordinates of the
+    horizontal wires that cover the whole slab. Slabs without vertical wires
+    can't have crossings, so they are left out.
+    """
+    vertical_xs = [event[0] for event in self.events if event[1] == 1]
+    boundaries = []
+    for i in xrange(1, self.slab_count):
+      if vertical_xs:
+        x = vertical_xs[i * len(vertical_xs) // self.slab_count]
+        if not boundaries or boundaries[-1] < x:
+          boundaries.append(x)
+    lows = [float('-inf')] + boundaries
+    highs = boundaries + [float('inf')]
+    slab_wires = [[] for low in lows]
+    spanning_ys = [[] for low in lows]
+    for event in self.events:
+      wire = event[4]
+      if event[1] == 1:
+        slab_wires[bisect.bisect_right(boundaries, wire.x1)].append(wire)
+      elif event[1] == 0:
+        first = bisect.bisect_right(boundaries, wire.x1)
+        last = bisect.bisect_right(boundaries, wire.x2)
+        slab_wires[first].append(wire)
+        if last != first:
+          slab_wires[last].append(wire)
+        for i in xrange(first + 1, last):
+          spanning_ys[i].append(wire.y1)
+    return [(lows[i], highs[i], slab_wires[i], sorted(spanning_ys[i]))
+            for i in xrange(len(lows))
+            if any(wire.is_vertical() for wire in slab_wires[i])]
+
+def count_slab_crossings(slab):
+  """Counts the crossings in one of the slabs built by SlabCrossVerifier.
+  
+  This runs in SlabCrossVerifier's worker processes, so it must be a top-level
+  function.
+  
+  Args:
+    slab: a (low x, high x, wires, spanning ys) tuple returned by
+        SlabCrossVerifier.slabs
+  """
+  low, high, wires, spanning_ys = slab
+  count = 0
+  verifier = CrossVerifier(WireLayer())
+  for wire in wires:
+    if wire.is_horizontal():
+      # Clipping doesn't change the order of the events within the slab: the
+      # adds still come before the queries at the low boundary, and the removes
+      # come after all the queries.
+      verifier.events.append([max(wire.x1, low), 0, wire.object_id, 'add',
+                              wire])
+      verifier.events.append([min(wire.x2, high), 2, wire.object_id, 'remove',
+                              wire])
+    else:
+      verifier.events.append([wire.x1, 1, wire.object_id, 'query', wire])
+      count += (bisect.bisect_right(spanning_ys, wire.y2) -
+                bisect.bisect_left(spanning_ys, wire.y1))
+  verifier.events.sort()
+  return count + verifier.count_crossings()
+
 # Command-line controller.
 if __name__ == '__main__':
     import sys
     layer = WireLayer.from_file(sys.stdin)
-    verifier = CrossVerifier(layer)
+    if os.environ.get('PROCESSES'):
+      verifier = SlabCrossVerifier(layer,
+                                   processes=int(os.environ['PROCESSES']))
+    else:
+      verifier = CrossVerifier(layer)
     
     if os.environ.get('TRACE') == 'jsonp':
-      verifier = TracedCrossVerifier(layer)
-      result = verifier.wire_crossings()
-      json_obj = {'layer': layer.as_json(), 'trace': verifier.trace_as_json()}
-      sys.stdout.write('onJsonp(')
-      json.dump(json_obj, sys.stdout)
-      sys.stdout.write(');\n')
+      writer = JsonpTraceWriter(sys.stdout, layer,
+                                int(os.environ.get('TRACE_SAMPLE', '1')))
+      verifier = TracedCrossVerifier(layer, writer)
+      verifier.wire_crossings()
+      writer.close()
     elif os.environ.get('TRACE') == 'list':
-      verifier.wire_crossings().write_to_file(sys.stdout)
+      StreamingResultSet(verifier.iter_crossings()).write_to_file(sys.stdout)
     else:
       sys.stdout.write(str(verifier.count_crossings()) + "\n")
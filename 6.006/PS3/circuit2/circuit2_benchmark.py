@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""Scaling benchmark for the circuit verifier's crossing counters.
+
+Counts the crossings in the count tests in tests/ and in a few synthetic
+layers, with CrossVerifier's AVL, Fenwick tree and sorted array count engines
+and with SlabCrossVerifier using 1 to N worker processes. Reports the time and
+the speedup over the AVL engine, and on Python 3 the peak memory allocated by
+the serial engines.
+
+Usage:
+    python circuit2_benchmark.py [--processes 8] [--wires 10000,100000]
+"""
+
+import glob
+import multiprocessing
+import optparse
+import os
+import random
+import sys
+import time
+
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+from circuit2 import *
+
+def synthetic_layer(wire_count, size=1000000, max_length=100000, seed=6006):
+  """Builds a random layer of horizontal and vertical wires.
+
+  Wires on the same line may overlap, which the verifier doesn't allow, so
+  every wire gets its own X (vertical) or Y (horizontal) coordinate.
+
+  Args:
+    wire_count: the number of wires in the layer, half of them horizontal
+    size: the wires' coordinates are between 0 and this value
+    max_length: the maximum length of a wire
+    seed: seed for the random number generator
+  """
+  rng = random.Random(seed)
+  layer = WireLayer()
+  lines = rng.sample(xrange(size), wire_count)
+  for i in xrange(wire_count):
+    start = rng.randrange(size)
+    end = min(size, start + rng.randrange(1, max_length))
+    if i % 2 == 0:
+      layer.add_wire('h%d' % i, start, lines[i], end, lines[i])
+    else:
+      layer.add_wire('v%d' % i, lines[i], start, lines[i], end)
+  return layer
+
+def time_count(verifier):
+  """Returns the crossing count and the seconds it took to compute it."""
+  start = time.time()
+  count = verifier.count_crossings()
+  return (count, time.time() - start)
+
+def peak_count_memory(layer, count_engine):
+  """The peak memory allocated while counting crossings with an engine.
+
+  Returns None if tracemalloc isn't available (Python 2).
+  """
+  if tracemalloc is None:
+    return None
+  verifier = CrossVerifier(layer)
+  verifier.count_engine = count_engine
+  tracemalloc.start()
+  verifier.count_crossings()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return peak
+
+def main(argv):
+  parser = optparse.OptionParser()
+  parser.add_option('--processes', type='int',
+                    default=multiprocessing.cpu_count(),
+                    help='maximum number of worker processes')
+  parser.add_option('--wires', default='10000,100000',
+                    help='comma-separated synthetic layer sizes')
+  options, _ = parser.parse_args(argv)
+
+  layers = []
+  test_dir = os.path.join(os.path.dirname(__file__), 'tests')
+  for in_filename in sorted(glob.glob(os.path.join(test_dir, '*.in'))):
+    if in_filename.find('list_') >= 0:
+      continue
+    with open(in_filename) as in_file:
+      layers.append((os.path.basename(in_filename),
+                     WireLayer.from_file(in_file)))
+  for wire_count in options.wires.split(','):
+    if wire_count:
+      layers.append(('synthetic' + wire_count,
+                     synthetic_layer(int(wire_count))))
+
+  print('%-20s %-12s %12s %10s %8s %10s' % ('layer', 'verifier', 'crossings',
+                                            'seconds', 'speedup', 'peak MB'))
+  for name, layer in layers:
+    for count_engine in ['avl', 'fenwick', 'sorted']:
+      verifier = CrossVerifier(layer)
+      verifier.count_engine = count_engine
+      engine_count, seconds = time_count(verifier)
+      if count_engine == 'avl':
+        count, serial_seconds = engine_count, seconds
+      elif engine_count != count:
+        raise RuntimeError('The %s engine miscounted %s' % (count_engine,
+                                                            name))
+      peak = peak_count_memory(layer, count_engine)
+      print('%-20s %-12s %12d %10.3f %8.2f %10s' % (
+            name, count_engine, engine_count, seconds,
+            serial_seconds / max(seconds, 1e-9),
+            '-' if peak is None else '%.1f' % (peak / 1e6)))
+    for processes in xrange(1, options.processes + 1):
+      # Extra slabs even out the workers' loads.
+      verifier = SlabCrossVerifier(layer, slab_count=4 * processes,
+                                   processes=processes)
+      slab_count, seconds = time_count(verifier)
+      if slab_count != count:
+        raise RuntimeError('SlabCrossVerifier miscounted ' + name)
+      print('%-20s %-12s %12d %10.3f %8.2f' % (
+            name, 'slabs x%d' % processes, slab_count, seconds,
+            serial_seconds / max(seconds, 1e-9)))
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -4,6 +4,8 @@ import unittest
 import sys
 import glob
 import re
+import random
+from StringIO import StringIO
 from circuit2 import *
 
 class Circuit2Test(unittest.TestCase):
@@ -62,6 +64,107 @@ class Circuit2Test(unittest.TestCase):
           else: 
             print 'Failed'
           self.assertTrue(same)
+
+  def _count_tests(self):
+    # The (input, gold count) pairs of the count tests that have gold files.
+    tests = []
+    for in_filename in self._in_files:
+      gold_filename = re.sub('\.in$', '.gold', in_filename)
+      if in_filename.find('list_') >= 0 or not os.path.exists(gold_filename):
+        continue
+      with open(gold_filename) as gold_file:
+        tests.append((in_filename, int(gold_file.readline())))
+    return tests
+
+  def testCountEngines(self):
+    for in_filename, gold_count in self._count_tests():
+      with open(in_filename) as in_file:
+        layer = WireLayer.from_file(in_file)
+      for count_engine in ['avl', 'fenwick', 'sorted']:
+        verifier = CrossVerifier(layer)
+        verifier.count_engine = count_engine
+        self.assertEqual(gold_count, verifier.count_crossings())
+
+  def testCountOnlyIndexes(self):
+    keys = [5, 1, 3, 3, 8, 1, 2]
+    fenwick = FenwickRangeIndex(keys + [0, 4, 9])
+    sorted_array = SortedArrayRangeIndex()
+    for index in [fenwick, sorted_array]:
+      for key in keys:
+        index.add(key)
+      index.remove(3)
+      index.remove(8)
+      self.assertEqual(5, index.count(0, 9))
+      self.assertEqual(3, index.count(1, 2))
+      self.assertEqual(2, index.count(3, 5))
+      self.assertEqual(0, index.count(8, 9))
+      self.assertEqual(1, index.count(4, 5))
+
+  def testStreamingCrossings(self):
+    for in_filename in self._in_files:
+      gold_filename = re.sub('\.in$', '.gold', in_filename)
+      if in_filename.find('list_') < 0 or not os.path.exists(gold_filename):
+        continue
+      with open(in_filename) as in_file:
+        layer = WireLayer.from_file(in_file)
+      out_file = StringIO()
+      result = StreamingResultSet(CrossVerifier(layer).iter_crossings())
+      result.WRITE_BATCH = 3
+      result.write_to_file(out_file)
+      result_set = ResultSet()
+      result_set.crossings = [line.split()
+                              for line in out_file.getvalue().splitlines()]
+      with open(gold_filename) as gold_file:
+        self.assertTrue(self._cmp_lists(gold_file, result_set))
+
+  def _read_jsonp(self, text):
+    self.assertTrue(text.startswith('onJsonp(') and text.endswith(');\n'))
+    return json.loads(text[len('onJsonp('):-len(');\n')])
+
+  def testJsonpTraceWriter(self):
+    with open('tests/5logo.in') as in_file:
+      layer = WireLayer.from_file(in_file)
+    verifier = TracedCrossVerifier(layer)
+    verifier.wire_crossings()
+    trace = json.loads(json.dumps(verifier.trace_as_json()))
+
+    out_file = StringIO()
+    writer = JsonpTraceWriter(out_file, layer)
+    TracedCrossVerifier(layer, writer).wire_crossings()
+    writer.close()
+    jsonp = self._read_jsonp(out_file.getvalue())
+    self.assertEqual(json.loads(json.dumps(layer.as_json())), jsonp['layer'])
+    self.assertEqual(trace, jsonp['trace'])
+
+    out_file = StringIO()
+    writer = JsonpTraceWriter(out_file, layer, 3)
+    TracedCrossVerifier(layer, writer).wire_crossings()
+    writer.close()
+    sampled = self._read_jsonp(out_file.getvalue())['trace']
+    sweeps = [event for event in trace if event['type'] == 'sweep']
+    self.assertEqual(sweeps[::3],
+                     [event for event in sampled if event['type'] == 'sweep'])
+    for event_type in ['add', 'delete']:
+      self.assertEqual([event for event in trace if event['type'] == event_type],
+                       [event for event in sampled
+                        if event['type'] == event_type])
+
+  def testIterList(self):
+    index = RangeIndex()
+    keys = random.Random(6006).sample(xrange(1000), 300)
+    for key in keys:
+      index.add(key)
+    for low, high in [(0, 999), (100, 200), (-5, 3), (500, 500), (990, 2000)]:
+      self.assertEqual(sorted(index.list(low, high)),
+                       list(index.iter_list(low, high)))
+
+  def testSlabCounts(self):
+    for in_filename, gold_count in self._count_tests():
+      with open(in_filename) as in_file:
+        layer = WireLayer.from_file(in_file)
+      for processes in [1, 2]:
+        verifier = SlabCrossVerifier(layer, slab_count=7, processes=processes)
+        self.assertEqual(gold_count, verifier.count_crossings())
     
 if __name__ == '__main__':
   unittest.main()
@@ -1,6 +1,8 @@
 #!/usr/bin/env python2.7
 
+import os
 import unittest
+from array import array
 from dnaseqlib import *
 
 ### Utility classes ###
@@ -114,6 +116,227 @@ def getExactSubmatches(a, b, k, m):
     return d.get_indices()
 
 
+### Packed k-mer index engine ###
+
+# 2-bit codes for the nucleotides.  Any other character (N, soft-masked
+# lowercase nucleotides, ...) is stored as code 0 plus an exception that
+# keeps the character itself, so k-mers match exactly as in
+# getExactSubmatches.
+NUCLEOTIDE_CODES = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
+
+# Stores a sequence of 2-bit nucleotide codes, four per byte, and the
+# characters at the positions that aren't nucleotides.
+class PackedSequence(object):
+    def __init__(self):
+        self.data = bytearray()
+        self.length = 0
+        self.exceptions = {}
+
+    def __len__(self):
+        return self.length
+
+    # Appends a code (0-3) to the end of the sequence.  If char is given,
+    # it is a character other than a nucleotide, stored with code 0.
+    def append(self, code, char=None):
+        if char is not None:
+            self.exceptions[self.length] = char
+        shift = (self.length & 3) << 1
+        if shift == 0:
+            self.data.append(code)
+        else:
+            self.data[-1] |= code << shift
+        self.length += 1
+
+    # Returns the code at position i.
+    def code_at(self, i):
+        return (self.data[i >> 2] >> ((i & 3) << 1)) & 3
+
+    # True if the k characters starting at position i match the k characters
+    # starting at position j in other.
+    def same_kmer(self, i, other, j, k):
+        for offset in xrange(k):
+            if self.code_at(i + offset) != other.code_at(j + offset):
+                return False
+            if (self.exceptions.get(i + offset) !=
+                    other.exceptions.get(j + offset)):
+                return False
+        return True
+
+# Modular polynomial hash over the 2-bit codes of a k-length window.  The
+# factor that removes the oldest code is computed once, so sliding the window
+# costs O(1).  When 4^k fits under the modulus, the hash is the k-mer's exact
+# 2k-bit encoding, so equal hashes always mean equal k-mers.
+class RollingKmerHash(object):
+    HASH_BASE = 4
+    MODULUS = (1 << 61) - 1
+
+    def __init__(self, k):
+        self.k = k
+        self.top_factor = pow(self.HASH_BASE, k - 1, self.MODULUS)
+        self.exact = self.HASH_BASE ** k <= self.MODULUS
+        self.curhash = 0
+
+    # Returns the current hash value.
+    def current_hash(self):
+        return self.curhash
+
+    # Appends a code to the window, without removing one.  Used while the
+    # first k codes are read.
+    def append(self, code):
+        self.curhash = (self.curhash * self.HASH_BASE + code) % self.MODULUS
+        return self.curhash
+
+    # Updates the hash by removing the code prevcode and adding nextcode.
+    # Returns the updated hash value.
+    def slide(self, prevcode, nextcode):
+        h = self.curhash - prevcode * self.top_factor
+        self.curhash = (h * self.HASH_BASE + nextcode) % self.MODULUS
+        return self.curhash
+
+# Open-addressing hash table from integer hashes to lists of positions.  The
+# keys live in one array, and each key's positions form a linked list in two
+# parallel arrays, so no Python objects are allocated per k-mer.
+class KmerTable(object):
+    EMPTY = -1
+    # Knuth's multiplicative hashing constant, which spreads consecutive keys.
+    MULTIPLIER = 2654435761
+
+    def __init__(self, capacity=1 << 10):
+        self.size = 0
+        self._allocate(capacity)
+        self.positions = array('l')
+        self.next_links = array('l')
+
+    def __len__(self):
+        return self.size
+
+    # Creates an empty slot array with the given capacity (a power of 2).
+    def _allocate(self, capacity):
+        self.mask = capacity - 1
+        self.keys = array('l', [self.EMPTY]) * capacity
+        self.heads = array('l', [self.EMPTY]) * capacity
+
+    # Returns the slot holding key, or the empty slot where it would go.
+    def _slot(self, key):
+        keys = self.keys
+        mask = self.mask
+        slot = ((key * self.MULTIPLIER) >> 16) & mask
+        while keys[slot] != key and keys[slot] != self.EMPTY:
+            slot = (slot + 1) & mask
+        return slot
+
+    # Doubles the capacity, and reinserts the keys.
+    def _grow(self):
+        old_keys, old_heads = self.keys, self.heads
+        self._allocate(2 * len(old_keys))
+        for i in xrange(len(old_keys)):
+            if old_keys[i] != self.EMPTY:
+                slot = self._slot(old_keys[i])
+                self.keys[slot] = old_keys[i]
+                self.heads[slot] = old_heads[i]
+
+    # Associates position with key.
+    def put(self, key, position):
+        slot = self._slot(key)
+        if self.keys[slot] == self.EMPTY:
+            if 2 * (self.size + 1) > len(self.keys):
+                self._grow()
+                slot = self._slot(key)
+            self.keys[slot] = key
+            self.size += 1
+        self.positions.append(position)
+        self.next_links.append(self.heads[slot])
+        self.heads[slot] = len(self.positions) - 1
+
+    # Returns the first link in key's position list, or EMPTY.
+    def head(self, key):
+        return self.heads[self._slot(key)]
+
+    # Yields the positions associated with key, most recent first.
+    def get(self, key):
+        link = self.head(key)
+        while link != self.EMPTY:
+            yield self.positions[link]
+            link = self.next_links[link]
+
+# Yields (key, position) for the k-length windows of seq, and appends each
+# character to packed (which must start out empty).  If m is given, only
+# windows starting at multiples of m are yielded.  The key of a window of
+# nucleotides is its RollingKmerHash value.  A window holding other
+# characters also gets a rolling hash of those, and its key is at least
+# OTHER_KEY, so it never equals the key of a window of nucleotides.
+OTHER_KEY = 1 << 61
+OTHER_BASE = 257
+
+def packedKmerHashes(seq, k, packed, m=1):
+    codes = NUCLEOTIDE_CODES
+    exceptions = packed.exceptions
+    rolling = RollingKmerHash(k)
+    # The rolling hashes are inlined, because this loop runs once per
+    # character.
+    base, modulus, top_factor = (rolling.HASH_BASE, rolling.MODULUS,
+                                 rolling.top_factor)
+    other_top_factor = pow(OTHER_BASE, k - 1, modulus)
+    h = 0
+    # Hash of the non-nucleotides in the window (ord + 1 for each, 0 for
+    # nucleotides), kept only while the window holds one.
+    other = 0
+    last_other = -k
+    index = 0
+    for c in seq:
+        code = codes.get(c)
+        if code is None:
+            packed.append(0, c)
+            code = 0
+            last_other = index
+        else:
+            packed.append(code)
+        if index < k:
+            h = (h * base + code) % modulus
+        else:
+            h = ((h - packed.code_at(index - k) * top_factor) * base +
+                 code) % modulus
+        if index - last_other < k:
+            value = ord(c) + 1 if last_other == index else 0
+            out = exceptions.get(index - k)
+            if out is not None:
+                other -= (ord(out) + 1) * other_top_factor
+            other = (other * OTHER_BASE + value) % modulus
+        else:
+            other = 0
+        index += 1
+        if index >= k and (index - k) % m == 0:
+            if index - last_other <= k:
+                yield (OTHER_KEY + (h * OTHER_BASE + other) % modulus,
+                       index - k)
+            else:
+                yield h, index - k
+
+# Same contract as getExactSubmatches, using the packed k-mer index engine.
+# Sequence A is packed two bits per nucleotide and every m-th k-mer's key
+# goes into a KmerTable; sequence B is then streamed through the same rolling
+# hashes, and matches are yielded as they are found.  Windows that hold
+# characters other than ACGT are compared character by character, so the
+# matches are the same as getExactSubmatches'.
+def getPackedSubmatches(a, b, k, m):
+    a_packed = PackedSequence()
+    table = KmerTable()
+    for key, position in packedKmerHashes(a, k, a_packed, m):
+        table.put(key, position)
+    b_packed = PackedSequence()
+    exact = RollingKmerHash(k).exact
+    for key, b_position in packedKmerHashes(b, k, b_packed):
+        # Most k-mers in B don't occur in A, so check before setting up the
+        # position list generator.
+        if table.head(key) == table.EMPTY:
+            continue
+        check = not exact or key >= OTHER_KEY
+        for a_position in table.get(key):
+            if not check or a_packed.same_kmer(a_position, b_packed,
+                                               b_position, k):
+                yield (a_position, b_position)
+
+
 # Create a Queue
 class QueueObject(object):
     """ Object for creating a Queue. """
@@ -169,6 +392,11 @@ class PushQueue(object):
         output.append(self.last.value)
         return ''.join(output)
 
+# getExactSubmatches implementations, by name.  The ENGINE environment
+# variable picks the one used by the command-line driver.
+SUBMATCH_ENGINES = {'queue': getExactSubmatches,
+                    'packed': getPackedSubmatches}
+
 if __name__ == '__main__':
     if len(sys.argv) != 4:
         print 'Usage: {0} [file_a.fa] [file_b.fa] [output.png]'.format(sys.argv[0])
@@ -180,4 +408,7 @@ if __name__ == '__main__':
     # filename of sequence A, 5) the filename of sequence B, 6) k, the
     # subsequence size, and 7) m, the sampling interval for sequence
     # A.
-    compareSequences(getExactSubmatches, sys.argv[3], (500,500), sys.argv[1], sys.argv[2], 8, 100)
+    # The PROCESSES environment variable sets the number of worker processes
+    # that bin the matches.
+    compareSequences(SUBMATCH_ENGINES[os.environ.get('ENGINE', 'packed')], sys.argv[3], (500,500), sys.argv[1], sys.argv[2], 8, 100,
+                     int(os.environ.get('PROCESSES', '1')))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python2.7
+
+# Benchmark for the getExactSubmatches engines in dnaseq.SUBMATCH_ENGINES.
+#
+# Compares the FASTA inputs in data/ (inputaN.fa against inputbN.fa) and a
+# few synthetic sequence pairs, and reports the number of matches and the
+# nucleotides hashed per second by each engine.  The sequences are read into
+# memory first, so the FASTA reader's speed doesn't count.
+#
+# Usage:
+#     python dnaseq_benchmark.py [--engines queue,packed] [-k 8] [-m 100]
+#                                [--lengths 10000,100000] [a.fa b.fa ...]
+
+import glob
+import optparse
+import os
+import random
+import sys
+import time
+
+import kfasta
+from dnaseq import *
+
+# Builds a random pair of sequences of the given length, where sequence B
+# repeats a few stretches of sequence A so that there are long matches.
+def syntheticPair(length, seed=6006):
+    rng = random.Random(seed)
+    a = ''.join(rng.choice('ACGT') for i in xrange(length))
+    b = []
+    while len(b) < length:
+        if rng.random() < 0.5:
+            start = rng.randrange(length)
+            b.extend(a[start:start + rng.randrange(1, 1000)])
+        else:
+            b.extend(rng.choice('ACGT') for i in xrange(rng.randrange(1, 1000)))
+    return a, ''.join(b[:length])
+
+# Runs an engine on a pair of sequences.  Returns (matches, seconds).
+def benchmarkEngine(engine, a, b, k, m):
+    start = time.time()
+    matches = 0
+    for match in SUBMATCH_ENGINES[engine](iter(a), iter(b), k, m):
+        matches += 1
+    return matches, time.time() - start
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option('--engines', default='queue,packed',
+                      help='comma-separated SUBMATCH_ENGINES names')
+    parser.add_option('-k', type='int', default=8, help='subsequence length')
+    parser.add_option('-m', type='int', default=100,
+                      help='sampling interval for sequence A')
+    parser.add_option('--lengths', default='10000,100000',
+                      help='comma-separated synthetic sequence lengths')
+    options, args = parser.parse_args(argv)
+    if len(args) % 2 != 0:
+        parser.error('FASTA files must come in (A, B) pairs')
+
+    files = zip(args[0::2], args[1::2])
+    if not files:
+        data_dir = os.path.join(os.path.dirname(__file__), 'data')
+        for afile in sorted(glob.glob(os.path.join(data_dir, 'inputa*.fa'))):
+            bfile = afile.replace('inputa', 'inputb')
+            if os.path.exists(bfile):
+                files.append((afile, bfile))
+    pairs = []
+    for afile, bfile in files:
+        pairs.append(('%s:%s' % (os.path.basename(afile),
+                                 os.path.basename(bfile)),
+                      str(kfasta.MappedFastaSequence(afile).data),
+                      str(kfasta.MappedFastaSequence(bfile).data)))
+    for length in options.lengths.split(','):
+        if length:
+            a, b = syntheticPair(int(length))
+            pairs.append(('synthetic%s' % length, a, b))
+
+    print '%-30s %-8s %12s %10s %14s' % ('inputs', 'engine', 'matches',
+                                         'seconds', 'nucleotides/s')
+    for name, a, b in pairs:
+        reference = None
+        for engine in options.engines.split(','):
+            matches, seconds = benchmarkEngine(engine, a, b, options.k,
+                                               options.m)
+            if reference is None:
+                reference = matches
+            elif matches != reference:
+                raise RuntimeError('%s found %d matches instead of %d on %s' %
+                                   (engine, matches, reference, name))
+            print '%-30s %-8s %12d %10.3f %14.0f' % (
+                name, engine, matches, seconds,
+                (len(a) + len(b)) / max(seconds, 1e-9))
+            sys.stdout.flush()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,5 +1,7 @@
 import sys
 import math
+import itertools
+import multiprocessing
 import kfasta
 from array import array
 try:
@@ -8,6 +10,11 @@ except ImportError:
     print "You don't have PIL (the Python Imaging Library) installed."
     print "Please check README.txt for instructions on how to install PIL."
     sys.exit(-1)
+# NumPy is optional; it speeds up binning the matches and rendering the image.
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Produces hash values for a rolling sequence.
 class RollingHash:
@@ -55,35 +62,134 @@ class Array2D:
 
 ### High-level driver code.  You shouldn't have to tweak this. ###
 
+# The number of matches binned at a time when NumPy is available.
+MATCH_BATCH = 1 << 16
+
+# Returns an all-zero histogram with w*h bins, stored in row-major order.
+def newHistogram(w, h):
+    if numpy is not None:
+        return numpy.zeros(w * h, dtype=numpy.int64)
+    return array('L', [0]) * (w * h)
+
+# Adds the (A position, B position) matches to the histogram hist, which has w
+# bins per row.  boffset is added to the B positions.  With NumPy, the matches
+# are binned MATCH_BATCH at a time with a single bincount call.
+def binMatches(hist, w, abinsize, bbinsize, matches, boffset=0):
+    if numpy is None:
+        for apos, bpos in matches:
+            hist[((bpos + boffset) // bbinsize) * w + apos // abinsize] += 1
+        return hist
+    matches = iter(matches)
+    while True:
+        batch = list(itertools.islice(matches, MATCH_BATCH))
+        if not batch:
+            return hist
+        positions = numpy.fromiter(itertools.chain.from_iterable(batch),
+                                   dtype=numpy.int64, count=2 * len(batch))
+        bins = (((positions[1::2] + boffset) // bbinsize) * w +
+                positions[0::2] // abinsize)
+        counts = numpy.bincount(bins, minlength=len(hist))
+        assert len(counts) == len(hist)
+        hist += counts
+
+# Renders a w-by-h histogram to an image and saves it to filename.  The shade
+# of each distinct bin count is computed once, and the pixels are handed to PIL
+# as a single buffer.
+def renderHistogram(filename, w, h, hist, remapfn):
+    maxval = float(hist.max() if numpy is not None else max(hist)) or 1.0
+    if numpy is not None:
+        values, inverse = numpy.unique(hist, return_inverse=True)
+        shades = numpy.array([255 - int(math.ceil(remapfn(v / maxval) * 255.0))
+                              for v in values], dtype=numpy.uint8)
+        pixels = shades[inverse].tostring()
+    else:
+        shades = {}
+        pixels = bytearray(w * h)
+        for i in xrange(w * h):
+            count = hist[i]
+            shade = shades.get(count)
+            if shade is None:
+                shade = 255 - int(math.ceil(remapfn(count / maxval) * 255.0))
+                shades[count] = shade
+            pixels[i] = shade
+        pixels = str(pixels)
+    if hasattr(Image, 'frombytes'):
+        img = Image.frombytes('L', (w, h), pixels)
+    else:
+        img = Image.fromstring('L', (w, h), pixels)
+    img.convert('RGB').save(filename)
+
+# The sizes of the bins used for sequences of lengths alen and blen.
+def binSizes(w, h, alen, blen):
+    abinsize = int(math.ceil(alen / float(w)))
+    bbinsize = int(math.ceil(blen / float(h)))
+    assert abinsize > 0 and bbinsize > 0
+    return abinsize, bbinsize
+
 # Given a sequence of matches, produces a w-by-h image and saves it to filename.
 # The remapping function takes values in (0,1) and returns values in (0,1); the default
 # value (fourth-root) makes lightly-populated bins considerably darker.
 def buildComparisonImage(filename, w, h, alen, blen, matches, remapfn=lambda x:math.sqrt(math.sqrt(x))):
-    arr = Array2D('L', w, h, 0L)
     print "Sequence A length: " + str(alen)
     print "Sequence B length: " + str(blen)
-    abinsize = int(math.ceil(alen / float(w)))
-    bbinsize = int(math.ceil(blen / float(h)))
-    assert abinsize > 0 and bbinsize > 0
+    abinsize, bbinsize = binSizes(w, h, alen, blen)
     print "Binning matches..."
-    for m in matches:
-        #print m, (abinsize, bbinsize), (m[0]//abinsize, m[1]//bbinsize), (w, h)
-        arr.incr(m[0] // abinsize, m[1] // bbinsize)
+    hist = binMatches(newHistogram(w, h), w, abinsize, bbinsize, matches)
     print "...done binning matches."
     print "Normalizing and plotting results..."
-    maxval = float(arr.max())
-    img = Image.new('RGB', (w,h))
-    for y in range(0, h):
-        for x in range(0, w):
-            val = 255 - int(math.ceil(remapfn((arr.get(x,y) / maxval)) * 255.0))
-            img.putpixel((x,y), (val,val,val))
+    renderHistogram(filename, w, h, hist, remapfn)
     print "...done normalizing and plotting."
-    img.save(filename)
 
-def compareSequences(getExactSubmatches, imgfile, imgsize, afile, bfile, k, m):
-    a = kfasta.FastaSequence(afile)
-    b = kfasta.FastaSequence(bfile)
-    matches = getExactSubmatches(a, b, k, m)
-    buildComparisonImage(imgfile, imgsize[0], imgsize[1],
-                         kfasta.getSequenceLength(afile),
-                         kfasta.getSequenceLength(bfile), matches)
+# Worker for compareSequences: bins the matches between all of sequence A and
+# the k-mers of sequence B that start in [bstart, bend).  Returns the partial
+# histogram.
+def binSliceMatches(args):
+    (getExactSubmatches, afile, bfile, k, m, bstart, bend, w, h, abinsize,
+     bbinsize) = args
+    a = kfasta.MappedFastaSequence(afile)
+    b = kfasta.MappedFastaSequence(bfile)
+    bslice = b.slice(bstart, min(len(b), bend + k - 1))
+    matches = getExactSubmatches(iter(a), iter(bslice), k, m)
+    return binMatches(newHistogram(w, h), w, abinsize, bbinsize, matches,
+                      bstart)
+
+# Compares the sequences in afile and bfile and saves the comparison image to
+# imgfile.  With more than one process, each worker process handles a slice of
+# sequence B (and builds its own index of sequence A), and the workers' partial
+# histograms are added up.  getExactSubmatches must be a module-level function.
+def compareSequences(getExactSubmatches, imgfile, imgsize, afile, bfile, k, m,
+                     processes=1, remapfn=lambda x:math.sqrt(math.sqrt(x))):
+    a = kfasta.MappedFastaSequence(afile)
+    b = kfasta.MappedFastaSequence(bfile)
+    if processes == 1:
+        matches = getExactSubmatches(a, b, k, m)
+        buildComparisonImage(imgfile, imgsize[0], imgsize[1], len(a), len(b),
+                             matches, remapfn)
+        return
+    w, h = imgsize
+    alen, blen = len(a), len(b)
+    del a, b
+    print "Sequence A length: " + str(alen)
+    print "Sequence B length: " + str(blen)
+    abinsize, bbinsize = binSizes(w, h, alen, blen)
+    slice_size = max(1, -(-blen // processes))
+    tasks = [(getExactSubmatches, afile, bfile, k, m, bstart,
+              bstart + slice_size, w, h, abinsize, bbinsize)
+             for bstart in xrange(0, blen, slice_size)]
+    print "Binning matches in %d processes..." % processes
+    pool = multiprocessing.Pool(processes)
+    try:
+        hist = newHistogram(w, h)
+        for partial in pool.imap_unordered(binSliceMatches, tasks):
+            if numpy is not None:
+                hist += partial
+            else:
+                for i in xrange(len(hist)):
+                    hist[i] += partial[i]
+    finally:
+        pool.close()
+        pool.join()
+    print "...done binning matches."
+    print "Normalizing and plotting results..."
+    renderHistogram(imgfile, w, h, hist, remapfn)
+    print "...done normalizing and plotting."
@@ -7,6 +7,9 @@
 # and if it breaks, you get to keep both pieces.
 #
 
+import mmap
+import os
+import tempfile
 import unittest
 
 # An iterator that returns the nucleotide sequence stored in the given FASTA file.
@@ -30,6 +33,52 @@ class FastaSequence:
         self.pos += 1
         return nextchar
 
+# A FASTA file's nucleotide sequence, read into memory in one pass.  The file
+# is memory-mapped and copied in chunks, without the header line and the
+# whitespace, into one contiguous buffer.  Slices are zero-copy views of the
+# buffer, and the length is known without reading the file again.
+class MappedFastaSequence:
+    # The number of bytes stripped at a time; bounds the temporary copies.
+    CHUNK_SIZE = 1 << 24
+
+    def __init__(self, filename):
+        self.data = bytearray()
+        self.info = ''
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                start = 0
+                if mapped[0:1] == '>':
+                    start = mapped.find('\n') + 1
+                    if start == 0:
+                        start = size
+                    self.info = mapped[0:start]
+                for offset in xrange(start, size, self.CHUNK_SIZE):
+                    chunk = mapped[offset:offset + self.CHUNK_SIZE]
+                    self.data.extend(chunk.translate(None, ' \t\r\n'))
+            finally:
+                mapped.close()
+
+    def __len__(self):
+        return len(self.data)
+
+    # Returns the nucleotides between start and end, as a zero-copy view.
+    def slice(self, start, end):
+        return memoryview(self.data)[start:end]
+
+    # Iterates over the nucleotides one character at a time.
+    def __iter__(self):
+        return iter(memoryview(self.data))
+
+    # Iterates over the sequence in zero-copy views of up to size nucleotides.
+    def chunks(self, size=1 << 20):
+        view = memoryview(self.data)
+        for start in xrange(0, len(self.data), size):
+            yield view[start:start + size]
+
 def getSequenceLength(filename):
     seq = FastaSequence(filename)
     n = 0
@@ -64,5 +113,19 @@ class TestKFASTA(unittest.TestCase):
             print subseq
             i += 1
         self.assertTrue(24 == i)
+    def test_mapped(self):
+        fd, filename = tempfile.mkstemp(suffix='.fa')
+        try:
+            os.write(fd, '>trivial\nABCDEFGHIJ\r\nKLMNOPQRST\nUVWXYZ\n')
+            os.close(fd)
+            seq = MappedFastaSequence(filename)
+            self.assertTrue('>trivial\n' == seq.info)
+            self.assertTrue(26 == len(seq))
+            self.assertTrue('ABCDEFGHIJKLMNOPQRSTUVWXYZ' == ''.join(seq))
+            self.assertTrue('JKLM' == seq.slice(9, 13).tobytes())
+            self.assertTrue(['ABCDEFGHIJ', 'KLMNOPQRST', 'UVWXYZ'] ==
+                            [chunk.tobytes() for chunk in seq.chunks(10)])
+        finally:
+            os.remove(filename)
 #if __name__ == '__main__':
 #    unittest.main()
@@ -1,3 +1,6 @@
+import os
+import random
+import tempfile
 from dnaseq import *
 
 ### Testing ###
@@ -33,4 +36,99 @@ class TestExactSubmatches(unittest.TestCase):
        for x in correct:
            self.assertTrue(x in matches)
 
+class TestPackedSubmatches(unittest.TestCase):
+    def test_packed_sequence(self):
+        packed = PackedSequence()
+        codes = [3, 0, 2, 1, 1, 3, 0]
+        for code in codes:
+            packed.append(code)
+        self.assertTrue(len(packed) == len(codes))
+        self.assertTrue([packed.code_at(i) for i in range(len(codes))] == codes)
+        self.assertTrue(packed.same_kmer(3, packed, 3, 4))
+        self.assertFalse(packed.same_kmer(0, packed, 1, 2))
+
+    def test_kmer_table(self):
+        table = KmerTable(4)
+        for i in range(100):
+            table.put(i * 7919, i)
+            table.put(i * 7919, i + 1000)
+        self.assertTrue(len(table) == 100)
+        for i in range(100):
+            self.assertTrue(sorted(table.get(i * 7919)) == [i, i + 1000])
+        self.assertTrue(list(table.get(5)) == [])
+
+    def test_rolling(self):
+        for k in [3, 40]:
+            seq = 'ACGTTGCAACGTAGGCTAACGTTGCAACGTAGGCTAACGTTGCAACGTAGG'
+            hashes = list(packedKmerHashes(seq, k, PackedSequence()))
+            self.assertTrue(len(hashes) == len(seq) - k + 1)
+            for h, position in hashes:
+                expected = list(packedKmerHashes(seq[position:position + k], k,
+                                                 PackedSequence()))
+                self.assertTrue(expected == [(h, 0)])
+
+    def test_matches_queue_engine(self):
+        rng = random.Random(6006)
+        for k, m in [(3, 1), (4, 3), (8, 5), (40, 2)]:
+            a = ''.join(rng.choice('ACGT') for i in range(300))
+            b = ''.join(rng.choice('ACGT') for i in range(200)) + a[50:150]
+            expected = sorted(getExactSubmatches(iter(a), iter(b), k, m))
+            actual = sorted(getPackedSubmatches(iter(a), iter(b), k, m))
+            self.assertTrue(len(expected) > 0)
+            self.assertTrue(expected == actual)
+
+    def test_non_nucleotides(self):
+        # N, lowercase and other characters match only themselves, as in
+        # getExactSubmatches.
+        a = 'ACGTNNNNNNNNacgtACGT'
+        b = 'NNNNNNNNNacgtACGT'
+        matches = sorted(getPackedSubmatches(iter(a), iter(b), 4, 1))
+        self.assertTrue(len(matches) == 39)
+        self.assertTrue(matches == sorted(getExactSubmatches(iter(a), iter(b),
+                                                             4, 1)))
+        rng = random.Random(6006)
+        for k, m in [(1, 1), (3, 2), (8, 1), (40, 3)]:
+            a = ''.join(rng.choice('ACGTNacgt-') for i in range(300))
+            b = ''.join(rng.choice('ACGNt') for i in range(100)) + a[20:200]
+            expected = sorted(getExactSubmatches(iter(a), iter(b), k, m))
+            actual = sorted(getPackedSubmatches(iter(a), iter(b), k, m))
+            self.assertTrue(len(expected) > 0)
+            self.assertTrue(expected == actual)
+
+class TestBinning(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(6006)
+        self.a = ''.join(rng.choice('ACGT') for i in range(2000))
+        self.b = ''.join(rng.choice('ACGT') for i in range(500)) + self.a[:1000]
+        self.files = []
+        for seq in [self.a, self.b]:
+            fd, filename = tempfile.mkstemp(suffix='.fa')
+            os.write(fd, '>test\n' + seq + '\n')
+            os.close(fd)
+            self.files.append(filename)
+
+    def tearDown(self):
+        for filename in self.files:
+            os.remove(filename)
+
+    def test_bin_matches(self):
+        w, h = 7, 5
+        abinsize, bbinsize = binSizes(w, h, len(self.a), len(self.b))
+        matches = list(getPackedSubmatches(iter(self.a), iter(self.b), 6, 1))
+        expected = Array2D('L', w, h, 0)
+        for apos, bpos in matches:
+            expected.incr(apos // abinsize, bpos // bbinsize)
+        hist = binMatches(newHistogram(w, h), w, abinsize, bbinsize,
+                          iter(matches))
+        self.assertTrue(list(hist) == list(expected.arr))
+
+        # Slices of B, binned separately, add up to the same histogram.
+        total = [0] * (w * h)
+        for bstart in range(0, len(self.b), 400):
+            partial = binSliceMatches((getPackedSubmatches, self.files[0],
+                                       self.files[1], 6, 1, bstart,
+                                       bstart + 400, w, h, abinsize, bbinsize))
+            total = [x + y for x, y in zip(total, partial)]
+        self.assertTrue(total == list(expected.arr))
+
 unittest.main()
@@ -1,6 +1,7 @@
 '''Large number arithmetic optimized for KS cores.'''
 
 from __future__ import division  # Use // for integer division.
+import json   # Used to read the tuning file.
 import os     # Used for os.environ.
 import sys    # Used to smooth over the range / xrange issue.
 # Python 3 doesn't have xrange, and range behaves like xrange.
@@ -41,6 +42,8 @@ class BigNum(object):
     # Used by the Newton-Raphson division code.
     self.__inverse = None
     self.__inverse_precision = None
+    # Used by the native powmod engines when this number is a modulus.
+    self.__native_modulus = None
     
   @staticmethod
   def zero(size = 1):
@@ -76,6 +79,17 @@ class BigNum(object):
     '''Shorthand for from_hex(hex_string).'''
     return BigNum.from_hex(hex_string)
   
+  @staticmethod
+  def from_int(value):
+    '''BigNum representing the given non-negative Python integer.'''
+    if value < 0:
+      raise ValueError('BigNums cannot hold negative numbers')
+    return BigNum.from_hex('%X' % value)
+  
+  def to_int(self):
+    '''Python integer with the same value as this BigNum.'''
+    return int(self.hex(), 16)
+  
   def hex(self):
     '''Hexadecimal string representing this BigNum.
     
@@ -240,6 +254,31 @@ class BigNum(object):
         carry = Byte.zero()
     return result.normalize()
   
+  # The engine used by *. Can be set with the BIGNUM_MUL environment variable.
+  #   limbs: limb_mul, which picks an algorithm using the tuning thresholds
+  #   ks: slow_mul and fast_mul, on the KS primitives (the reference)
+  mul_engine = os.environ.get('BIGNUM_MUL', 'limbs')
+  
+  # Algorithm crossover points, in digits. Operands with more digits than a
+  # threshold use the asymptotically faster algorithm. big_num_calibrate.py
+  # measures them and writes them to a tuning file; see load_tuning.
+  tuning = {'karatsuba_threshold': 63, 'toom3_threshold': 191,
+            'divmod_threshold': 3}
+  
+  @staticmethod
+  def load_tuning(file):
+    '''Reads algorithm thresholds from a JSON file.
+    
+    Args:
+      file: a File object supplying a JSON object whose keys are a subset of
+            the keys in BigNum.tuning
+    '''
+    tuning = json.load(file)
+    for name in tuning:
+      if name not in BigNum.tuning:
+        raise ValueError('Unknown tuning parameter ' + name)
+      BigNum.tuning[name] = int(tuning[name])
+  
   def __mul__(self, other):
     '''* for BigNums.
     
@@ -248,9 +287,34 @@ class BigNum(object):
     '''
     if not isinstance(other, BigNum):
       return NotImplemented  # BigNums can only be multiplied by BigNums.    
+    if self.mul_engine == 'limbs':
+      return self.limb_mul(other)
     if len(self.d) <= 64 or len(other.d) <= 64:
       return self.slow_mul(other)
     return self.fast_mul(other)
+  
+  def limb_mul(self, other):
+    '''
+    Multiplication on arrays of digit values, with schoolbook, Karatsuba or
+    Toom-3 multiplication depending on the operand sizes.
+    '''
+    values = _BYTE_VALUES
+    product = mul_limbs([values[digit] for digit in self.d],
+                        [values[digit] for digit in other.d],
+                        BigNum.tuning['karatsuba_threshold'],
+                        BigNum.tuning['toom3_threshold'])
+    # Carrying is postponed until the end, so the algorithms above can work
+    # on unbounded (and negative) digit values.
+    digits = []
+    carry = 0
+    for value in product:
+      carry += value
+      digits.append(_BYTES[carry & 0xFF])
+      carry >>= 8
+    while carry:
+      digits.append(_BYTES[carry & 0xFF])
+      carry >>= 8
+    return BigNum(digits, None, True).normalize()
 
   def slow_mul(self, other):
     '''
@@ -329,7 +393,8 @@ class BigNum(object):
       return NotImplemented  # BigNums can only be divided by other BigNums.  
     self.normalize()
     other.normalize()
-    if len(self.d) <= 256 or len(other.d) <= 256:
+    threshold = BigNum.tuning['divmod_threshold']
+    if len(self.d) <= threshold or len(other.d) <= threshold:
       return self.slow_divmod(other)
     return self.fast_divmod(other)
   
@@ -409,6 +474,13 @@ class BigNum(object):
           (other * old_inverse * old_inverse)
       other.__inverse.normalize()
       other.__inverse_precision *= 2
+      # Each refinement at most doubles the number of correct digits, so the
+      # digits past that are dropped. Otherwise the inverse doubles in size on
+      # every refinement, and Newton's multiplications become huge.
+      excess = len(other.__inverse.d) - 2 * len(old_inverse.d) - 1
+      if excess > 0:
+        other.__inverse = other.__inverse >> excess
+        other.__inverse_precision -= excess
       # Trim zero digits at the end, they don't help.
       zero_digits = 0
       while other.__inverse.d[zero_digits] == Byte.zero():
@@ -417,6 +489,10 @@ class BigNum(object):
         other.__inverse = other.__inverse >> zero_digits
         other.__inverse_precision -= zero_digits
     
+  # The engine used by powmod. Can be set with the BIGNUM_POWMOD environment
+  # variable; see POWMOD_ENGINES for the choices.
+  powmod_engine = os.environ.get('BIGNUM_POWMOD', 'native')
+  
   def powmod(self, exponent, modulus):
     '''Modular ^.
     
@@ -426,6 +502,39 @@ class BigNum(object):
       
     Returns (self ^ exponent) mod modulus.
     '''
+    if self.powmod_engine == 'ks':
+      return self.ks_powmod(exponent, modulus)
+    if self.powmod_engine == 'native':
+      return self.native_powmod(exponent, modulus)
+    if self.powmod_engine == 'checked':
+      result = self.native_powmod(exponent, modulus)
+      if result != self.ks_powmod(exponent, modulus):
+        raise RuntimeError('native powmod disagrees with the KS reference')
+      return result
+    raise ValueError('Unknown powmod engine ' + self.powmod_engine)
+  
+  def native_powmod(self, exponent, modulus):
+    '''Modular ^ computed with Python integers.
+    
+    Uses sliding-window exponentiation, with Montgomery reduction for odd
+    moduli. The precomputed reduction values are cached in the modulus, so
+    they are reused across calls.
+    '''
+    if modulus.__native_modulus is None:
+      n = modulus.to_int()
+      if n % 2 == 1:
+        modulus.__native_modulus = MontgomeryModulus(n)
+      else:
+        modulus.__native_modulus = ClassicModulus(n)
+    return BigNum.from_int(modulus.__native_modulus.powmod(self.to_int(),
+                                                           exponent.to_int()))
+  
+  def ks_powmod(self, exponent, modulus):
+    '''Modular ^ computed with the KS primitives.
+    
+    This is the reference implementation: bit-by-bit square-and-multiply,
+    with a BigNum division after every multiplication.
+    '''
     multiplier = BigNum(self.d)
     result = BigNum.one()
     exp = BigNum(exponent.d)
@@ -460,3 +569,257 @@ class BigNum(object):
   def is_normalized(self):
     '''False if the number has at least one trailing 0 (zero) digit.'''
     return len(self.d) == 1 or self.d[-1] != Byte.zero()
+
+
+# The engines that BigNum.powmod can use.
+#   ks: square-and-multiply on the KS primitives (the reference)
+#   native: sliding window on Python integers, with Montgomery reduction
+#   checked: native, verified against ks on every call
+POWMOD_ENGINES = ('ks', 'native', 'checked')
+
+
+class ClassicModulus(object):
+  '''Modulus for native_powmod that reduces with Python's % operator.
+  
+  Numbers in the engine's internal form are plain residues.
+  '''
+  
+  def __init__(self, n):
+    if n <= 0:
+      raise ValueError('The modulus must be positive')
+    self.n = n
+  
+  def to_form(self, a):
+    '''Converts a number to the engine's internal form.'''
+    return a % self.n
+  
+  def from_form(self, a):
+    '''Converts a number in the engine's internal form to a residue.'''
+    return a
+  
+  def one(self):
+    '''The number 1 in the engine's internal form.'''
+    return 1 % self.n
+  
+  def mul(self, a, b):
+    '''Multiplies two numbers in the engine's internal form.'''
+    return a * b % self.n
+  
+  def powmod(self, base, exponent):
+    '''(base ^ exponent) mod n, using sliding-window exponentiation.
+    
+    The window size grows with the exponent, so the table of odd powers of
+    the base stays small compared to the number of squarings.
+    '''
+    if exponent == 0:
+      return 1 % self.n
+    bits = exponent.bit_length()
+    window = 1
+    for min_bits, size in ((672, 6), (240, 5), (80, 4), (24, 3)):
+      if bits >= min_bits:
+        window = size
+        break
+    
+    mul = self.mul
+    x = self.to_form(base)
+    # Odd powers of the base: x^1, x^3, ..., x^(2^window - 1).
+    powers = [x]
+    if window > 1:
+      x_squared = mul(x, x)
+      for i in xrange(1, 1 << (window - 1)):
+        powers.append(mul(powers[-1], x_squared))
+    
+    result = None
+    i = bits - 1
+    while i >= 0:
+      if not (exponent >> i) & 1:
+        result = mul(result, result)
+        i -= 1
+        continue
+      # The longest window ending in a 1 bit, which starts at bit i.
+      j = max(i - window + 1, 0)
+      while not (exponent >> j) & 1:
+        j += 1
+      value = (exponent >> j) & ((1 << (i - j + 1)) - 1)
+      if result is None:
+        result = powers[value >> 1]
+      else:
+        for k in xrange(i - j + 1):
+          result = mul(result, result)
+        result = mul(result, powers[value >> 1])
+      i = j - 1
+    return self.from_form(result)
+
+
+class MontgomeryModulus(ClassicModulus):
+  '''Odd modulus for native_powmod that uses Montgomery reduction.
+  
+  Numbers in the engine's internal form are a * R mod n, where R = 2^bits is
+  the smallest power of 2 above n. Reducing a product only takes two
+  multiplications, a mask and a shift, instead of a division.
+  '''
+  
+  def __init__(self, n):
+    ClassicModulus.__init__(self, n)
+    if n % 2 == 0:
+      raise ValueError('Montgomery reduction requires an odd modulus')
+    self.bits = n.bit_length()
+    self.mask = (1 << self.bits) - 1
+    # Newton's iteration for 1 / n mod R; each step doubles the number of
+    # correct low bits, and n * n = 1 (mod 8) for every odd n.
+    inverse = n
+    correct_bits = 3
+    while correct_bits < self.bits:
+      inverse = (inverse * (2 - n * inverse)) & self.mask
+      correct_bits *= 2
+    # n * n_prime = -1 (mod R)
+    self.n_prime = (-inverse) & self.mask
+    # R^2 mod n, used to convert numbers into Montgomery form.
+    self.r_squared = (1 << (2 * self.bits)) % n
+  
+  def reduce(self, t):
+    '''t / R mod n, for 0 <= t < n * R.'''
+    m = ((t & self.mask) * self.n_prime) & self.mask
+    t = (t + m * self.n) >> self.bits
+    if t >= self.n:
+      t -= self.n
+    return t
+  
+  def to_form(self, a):
+    return self.reduce((a % self.n) * self.r_squared)
+  
+  def from_form(self, a):
+    return self.reduce(a)
+  
+  def one(self):
+    return (1 << self.bits) % self.n
+  
+  def mul(self, a, b):
+    return self.reduce(a * b)
+
+
+# Private: the Byte singletons, indexed by value, and their values.
+_BYTES = [Byte.from_hex('%02X' % value) for value in xrange(0x100)]
+_BYTE_VALUES = dict((byte, value) for value, byte in enumerate(_BYTES))
+
+
+def mul_limbs(a, b, karatsuba_threshold, toom3_threshold):
+  '''Multiplies two numbers stored as little-endian lists of digit values.
+  
+  The result's digits are not carried, so they can be larger than a digit.
+  Operands with more digits than a threshold use Karatsuba or Toom-3
+  multiplication; if one operand is much longer, it is multiplied in slices
+  as long as the other operand.
+  
+  Returns a list of len(a) + len(b) - 1 digit values.
+  '''
+  if len(a) < len(b):
+    a, b = b, a
+  n = len(b)
+  out = [0] * (len(a) + n - 1)
+  if n <= karatsuba_threshold:
+    _schoolbook_into(out, 0, a, b)
+    return out
+  for start in xrange(0, len(a), n):
+    part = a[start:(start + n)]
+    if len(part) < n:
+      if len(part) <= karatsuba_threshold:
+        _schoolbook_into(out, start, b, part)
+        continue
+      part.extend([0] * (n - len(part)))
+    product = _mul_balanced(part, b, karatsuba_threshold, toom3_threshold)
+    _add_into(out, start, product[0:(len(out) - start)])
+  return out
+
+def _schoolbook_into(out, offset, a, b):
+  '''Adds the product of a and b to out, starting at out[offset].'''
+  for i in xrange(len(a)):
+    digit = a[i]
+    if digit == 0:
+      continue
+    k = offset + i
+    for d in b:
+      out[k] += digit * d
+      k += 1
+
+def _add_into(out, offset, a):
+  '''Adds the digits in a to out, starting at out[offset].'''
+  for i in xrange(len(a)):
+    out[offset + i] += a[i]
+
+def _mul_balanced(a, b, karatsuba_threshold, toom3_threshold):
+  '''Product of two digit value lists with the same length.'''
+  n = len(a)
+  if n <= karatsuba_threshold:
+    out = [0] * (2 * n - 1)
+    _schoolbook_into(out, 0, a, b)
+    return out
+  if n <= toom3_threshold:
+    return _karatsuba(a, b, karatsuba_threshold, toom3_threshold)
+  return _toom3(a, b, karatsuba_threshold, toom3_threshold)
+
+def _karatsuba(a, b, karatsuba_threshold, toom3_threshold):
+  '''Karatsuba product of two digit value lists with the same length.'''
+  n = len(a)
+  low = n // 2
+  high = n - low
+  a0, a1 = a[0:low] + [0] * (high - low), a[low:]
+  b0, b1 = b[0:low] + [0] * (high - low), b[low:]
+  z0 = _mul_balanced(a0, b0, karatsuba_threshold, toom3_threshold)
+  z2 = _mul_balanced(a1, b1, karatsuba_threshold, toom3_threshold)
+  z1 = _mul_balanced([x + y for x, y in zip(a0, a1)],
+                     [x + y for x, y in zip(b0, b1)],
+                     karatsuba_threshold, toom3_threshold)
+  for i in xrange(len(z1)):
+    z1[i] -= z0[i] + z2[i]
+  out = [0] * (2 * n - 1)
+  _add_into(out, 0, z0[0:(2 * n - 1)])
+  _add_into(out, low, z1[0:(2 * n - 1 - low)])
+  _add_into(out, 2 * low, z2[0:(2 * n - 1 - 2 * low)])
+  return out
+
+def _toom3(a, b, karatsuba_threshold, toom3_threshold):
+  '''Toom-Cook 3-way product of two digit value lists with the same length.
+  
+  Each operand is split in 3 parts, which are the coefficients of a
+  polynomial. The polynomials are evaluated at 0, 1, -1, -2 and infinity, the
+  5 values are multiplied recursively, and the product polynomial is
+  interpolated (Bodrato's sequence). Divisions are exact, because the digits
+  are never carried.
+  '''
+  n = len(a)
+  k = (n + 2) // 3
+  padding = [0] * (3 * k - n)
+  a = a + padding
+  b = b + padding
+  
+  def evaluate(x):
+    x0, x1, x2 = x[0:k], x[k:(2 * k)], x[(2 * k):]
+    p0 = [u + w for u, w in zip(x0, x2)]
+    p1 = [u + v for u, v in zip(p0, x1)]
+    pm1 = [u - v for u, v in zip(p0, x1)]
+    pm2 = [2 * (u + v) - w for u, v, w in zip(pm1, x2, x0)]
+    return (x0, p1, pm1, pm2, x2)
+  
+  products = [_mul_balanced(u, v, karatsuba_threshold, toom3_threshold)
+              for u, v in zip(evaluate(a), evaluate(b))]
+  r0, r1, rm1, rm2, r4 = products
+  r3 = [(u - v) // 3 for u, v in zip(rm2, r1)]
+  r1 = [(u - v) // 2 for u, v in zip(r1, rm1)]
+  r2 = [u - v for u, v in zip(rm1, r0)]
+  r3 = [(u - v) // 2 + 2 * w for u, v, w in zip(r2, r3, r4)]
+  r2 = [u + v - w for u, v, w in zip(r2, r1, r4)]
+  r1 = [u - v for u, v in zip(r1, r3)]
+  
+  out = [0] * (6 * k - 1)
+  for i, coefficient in enumerate([r0, r1, r2, r3, r4]):
+    _add_into(out, i * k, coefficient)
+  return out[0:(2 * n - 1)]
+
+
+# Reads the tuning file written by big_num_calibrate.py, if there is one.
+TUNING_FILE = os.environ.get('BIGNUM_TUNING', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'big_num_tuning.json'))
+if os.path.exists(TUNING_FILE):
+  with open(TUNING_FILE) as tuning_file:
+    BigNum.load_tuning(tuning_file)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+'''Measures BigNum's algorithm crossover points on this machine.
+
+Times schoolbook against Karatsuba multiplication, Karatsuba against Toom-3
+multiplication, and shift-and-subtract against Newton-Raphson division, for
+growing operand sizes. The thresholds are written to the tuning file that
+big_num.py reads when it is imported.
+
+Usage:
+    python big_num_calibrate.py [--output big_num_tuning.json] [--repeat 5]
+'''
+
+from __future__ import division  # Use // for integer division.
+import json
+import optparse
+import random
+import sys
+import time
+
+from big_num import *
+
+def best_time(function, repeat):
+  '''The shortest time, in seconds, that function() took in a few runs.'''
+  best = None
+  for i in xrange(repeat):
+    start = time.time()
+    function()
+    seconds = time.time() - start
+    if best is None or seconds < best:
+      best = seconds
+  return best
+
+def random_limbs(rng, digits):
+  '''A list of random digit values.'''
+  return [rng.randrange(0x100) for i in xrange(digits)]
+
+def random_big_num(rng, digits):
+  '''A random BigNum with exactly the given number of digits.'''
+  return BigNum.from_int(rng.getrandbits(8 * digits) | (1 << (8 * digits - 1)))
+
+def crossover(sizes, slow, fast, repeat):
+  '''The largest size where the slow algorithm still beats the fast one.
+
+  The sizes are tried in increasing order, and the search stops at the first
+  size where the fast algorithm wins, so the slow algorithm is never timed on
+  much larger operands.
+
+  Args:
+    sizes: increasing operand sizes, in digits
+    slow: slow(size) returns the function that runs the slow algorithm
+    fast: fast(size) returns the function that runs the fast algorithm
+    repeat: the number of timed runs for each measurement
+  '''
+  for size in sizes:
+    slow_seconds = best_time(slow(size), repeat)
+    fast_seconds = best_time(fast(size), repeat)
+    print('  %6d digits: %.6fs vs %.6fs' % (size, slow_seconds, fast_seconds))
+    sys.stdout.flush()
+    if fast_seconds < slow_seconds:
+      return size - 1
+  return sizes[-1]
+
+def calibrate(repeat, max_digits, rng):
+  '''Returns a dict of thresholds, with the same keys as BigNum.tuning.'''
+  tuning = {}
+  no_toom3 = 1 << 30
+
+  print('Schoolbook vs Karatsuba multiplication:')
+  sizes = [size for size in [4, 6, 8, 12, 16, 24, 32, 48, 64, 96, 128]
+           if size <= max_digits]
+  def mul(karatsuba_threshold, toom3_threshold):
+    return lambda size: (lambda a=random_limbs(rng, size),
+                                b=random_limbs(rng, size):
+        mul_limbs(a, b, karatsuba_threshold(size), toom3_threshold(size)))
+  # One level of Karatsuba, with schoolbook multiplication below it.
+  tuning['karatsuba_threshold'] = crossover(
+      sizes, mul(lambda size: size, lambda size: no_toom3),
+      mul(lambda size: size - 1, lambda size: no_toom3), repeat)
+
+  print('Karatsuba vs Toom-3 multiplication:')
+  karatsuba_threshold = tuning['karatsuba_threshold']
+  sizes = [size for size in [48, 64, 96, 128, 192, 256, 384, 512, 768, 1024]
+           if size > 2 * karatsuba_threshold and size <= max_digits]
+  if sizes:
+    tuning['toom3_threshold'] = crossover(
+        sizes, mul(lambda size: karatsuba_threshold, lambda size: no_toom3),
+        mul(lambda size: karatsuba_threshold, lambda size: size - 1), repeat)
+  else:
+    tuning['toom3_threshold'] = max_digits
+
+  print('Shift-and-subtract vs Newton-Raphson division:')
+  old_tuning = dict(BigNum.tuning)
+  BigNum.tuning.update(tuning)
+  try:
+    sizes = [size for size in [4, 8, 16, 32, 64, 128, 256, 512]
+             if size <= max_digits]
+    def divmod_function(method):
+      def function(size):
+        dividend = random_big_num(rng, 2 * size)
+        divisor = random_big_num(rng, size)
+        # Newton-Raphson reuses the divisor's inverse, like powmod does.
+        divisor.fast_divmod(random_big_num(rng, 2 * size))
+        return lambda: getattr(dividend, method)(divisor)
+      return function
+    tuning['divmod_threshold'] = crossover(
+        sizes, divmod_function('slow_divmod'), divmod_function('fast_divmod'),
+        repeat)
+  finally:
+    BigNum.tuning.update(old_tuning)
+  return tuning
+
+def main(argv):
+  parser = optparse.OptionParser()
+  parser.add_option('--output', default=TUNING_FILE,
+                    help='the tuning file to write')
+  parser.add_option('--repeat', type='int', default=5,
+                    help='number of timed runs for each measurement')
+  parser.add_option('--max-digits', type='int', default=1024,
+                    help='largest operand size to try')
+  options, _ = parser.parse_args(argv)
+
+  tuning = calibrate(options.repeat, options.max_digits, random.Random(6006))
+  with open(options.output, 'w') as tuning_file:
+    json.dump(tuning, tuning_file, indent=2, sort_keys=True)
+  print('Wrote %s to %s' % (json.dumps(tuning, sort_keys=True),
+                            options.output))
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
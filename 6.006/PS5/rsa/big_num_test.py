@@ -2,6 +2,15 @@
 
 import unittest
 import os
+import random
+import sys
+try:
+  from StringIO import StringIO
+except ImportError:
+  from io import StringIO
+# Python 3 doesn't have xrange, and range behaves like xrange.
+if sys.version_info >= (3,):
+    xrange = range
 
 if os.environ.get('SOLUTION'):
   from big_num_full import *
@@ -131,6 +140,45 @@ class BigNumTest(unittest.TestCase):
     finally:
       BigNum.__mul__ = old_mul
 
+  def _with_tuning(self, function, **tuning):
+    old_tuning = dict(BigNum.tuning)
+    try:
+      BigNum.tuning.update(tuning)
+      function()
+    finally:
+      BigNum.tuning.update(old_tuning)
+
+  def test_limb_multiplication(self):
+    old_mul = BigNum.__mul__
+    try:
+      BigNum.__mul__ = BigNum.limb_mul
+      rng = random.Random(6006)
+      def check():
+        self.test_multiplication()
+        for i in xrange(20):
+          a = rng.getrandbits(rng.randrange(1, 2000))
+          b = rng.getrandbits(rng.randrange(1, 2000))
+          self.assertEqual(BigNum.from_int(a) * BigNum.from_int(b),
+                           BigNum.from_int(a * b))
+      # Low thresholds make small numbers go through Karatsuba and Toom-3.
+      self._with_tuning(check, karatsuba_threshold=1, toom3_threshold=2)
+      self._with_tuning(check, karatsuba_threshold=2, toom3_threshold=9)
+      self._with_tuning(check, karatsuba_threshold=100, toom3_threshold=200)
+    finally:
+      BigNum.__mul__ = old_mul
+
+  def test_load_tuning(self):
+    old_tuning = dict(BigNum.tuning)
+    try:
+      BigNum.load_tuning(StringIO('{"karatsuba_threshold": 10}'))
+      self.assertEqual(10, BigNum.tuning['karatsuba_threshold'])
+      self.assertEqual(old_tuning['toom3_threshold'],
+                       BigNum.tuning['toom3_threshold'])
+      self.assertRaises(ValueError, BigNum.load_tuning,
+                        StringIO('{"fft_threshold": 10}'))
+    finally:
+      BigNum.tuning.update(old_tuning)
+
   def test_division(self):
     self.assertEqual(BigNum.one() // BigNum.one(), BigNum.one(), '1 // 1 == 1')
     self.assertEqual(BigNum.zero() // BigNum.one(), BigNum.zero(),
@@ -202,5 +250,38 @@ class BigNumTest(unittest.TestCase):
     self.assertEqual(BigNum.h('41').powmod(BigNum.h('BECF'), modulo),
                      BigNum.h('C73043C1'))
 
+  def test_ints(self):
+    self.assertEqual(BigNum.from_int(0), BigNum.zero())
+    self.assertEqual(BigNum.from_int(0x1F1E2D3C4B5), BigNum.h('1F1E2D3C4B5'))
+    self.assertEqual(BigNum.h('00F1E2D3C4B5').to_int(), 0xF1E2D3C4B5)
+    self.assertRaises(ValueError, BigNum.from_int, -1)
+
+  def test_powmod_engines(self):
+    rng = random.Random(6006)
+    for digits in [1, 3, 6]:
+      for i in xrange(2):
+        base = BigNum.from_int(rng.getrandbits(8 * digits + 3))
+        # Long enough to use a few sliding windows.
+        exponent = BigNum.from_int(rng.getrandbits(48))
+        # Odd moduli use Montgomery reduction, even ones don't.
+        for modulus in [BigNum.from_int(rng.getrandbits(8 * digits) | 1),
+                        BigNum.from_int(rng.getrandbits(8 * digits) + 2 & ~1)]:
+          expected = base.ks_powmod(exponent, modulus)
+          self.assertEqual(base.native_powmod(exponent, modulus), expected)
+          # The second call uses the cached MontgomeryModulus.
+          self.assertEqual(base.native_powmod(exponent, modulus), expected)
+
+  def test_montgomery(self):
+    rng = random.Random(6006)
+    for bits in [1, 3, 64, 1000]:
+      n = rng.getrandbits(bits) | 1
+      modulus = MontgomeryModulus(n)
+      self.assertEqual(n * modulus.n_prime % (1 << modulus.bits),
+                       (1 << modulus.bits) - 1)
+      a, b = rng.getrandbits(bits) % n, rng.getrandbits(bits) % n
+      product = modulus.mul(modulus.to_form(a), modulus.to_form(b))
+      self.assertEqual(modulus.from_form(product), a * b % n)
+    self.assertRaises(ValueError, MontgomeryModulus, 10)
+
 if __name__ == '__main__':
   unittest.main()
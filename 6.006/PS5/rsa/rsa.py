@@ -1,5 +1,7 @@
 from __future__ import division  # Use // for integer division.
-import json   # Used when TRACE=jsonp
+import collections  # Used by LruCache.
+import json   # Used when TRACE=jsonp, and for saving the chunk cache.
+import multiprocessing  # Used to decrypt images in parallel.
 import os     # Used to get the TRACE environment variable
 import sys
 # Python 3 doesn't have xrange, and range behaves like xrange.
@@ -12,44 +14,137 @@ else:
   from big_num import *
 
 
+class LruCache(object):
+  '''Dictionary with a maximum size that evicts the least recently used entry.'''
+  
+  def __init__(self, max_size):
+    '''Creates an empty cache that holds at most max_size entries.'''
+    self.max_size = max_size
+    self.entries = collections.OrderedDict()
+  
+  def __len__(self):
+    return len(self.entries)
+  
+  def __contains__(self, key):
+    return key in self.entries
+  
+  def get(self, key, default = None):
+    '''The value for a key, or default if the key isn't cached.
+    
+    Marks the key as the most recently used one.
+    '''
+    if key not in self.entries:
+      return default
+    value = self.entries.pop(key)
+    self.entries[key] = value
+    return value
+  
+  def put(self, key, value):
+    '''Caches a value, evicting the least recently used entry if needed.'''
+    self.entries.pop(key, None)
+    self.entries[key] = value
+    while len(self.entries) > self.max_size:
+      self.entries.popitem(False)
+  
+  def items(self):
+    '''The (key, value) pairs, from the least to the most recently used.'''
+    return list(self.entries.items())
+
+
 class RsaKey(object):
   '''Public or private RSA key.'''
+  
+  # The maximum number of decrypted chunks kept in chunk_cache.
+  CACHE_SIZE = 1 << 16
+  
   def __init__(self, exponent_hex_string, modulus_hex_string):
     '''Initializes a key from a public or private exponent and the modulus.'''
     self.e = BigNum.from_hex(exponent_hex_string)
     self.n = BigNum.from_hex(modulus_hex_string)
     self.size = (len(self.n.hex()) + 1) // 2
-    self.chunk_cache = {}
+    self.chunk_cache = LruCache(self.CACHE_SIZE)
     
   def raw_crypt(self, number):
     '''Performs ECB RSA encryption / decryption.'''
     return number.powmod(self.e, self.n)
+  
+  def split(self, hex_string):
+    '''Splits a hexadecimal string into the chunks that get decrypted.'''
+    in_chunk_size = self.size * 2
+    return [hex_string[i:(i + in_chunk_size)]
+            for i in xrange(0, len(hex_string), in_chunk_size)]
+  
+  def raw_decrypt_chunk(self, in_chunk):
+    '''Decrypts a chunk of hexadecimal data, without using the cache.
+    
+    Returns a hexadecimal string with exactly (size - 1) bytes of data.
+    '''
+    out_chunk_size = (self.size - 1) * 2
+    out_chunk = self.raw_crypt(BigNum.from_hex(in_chunk)).hex()
+    if len(out_chunk) > out_chunk_size:
+      # This indicates a decryption error. However, we'll truncate the
+      # result, so the visualization can work.
+      out_chunk = out_chunk[0:out_chunk_size]
+    if len(out_chunk) < out_chunk_size:
+      out_chunk = '0' * (out_chunk_size - len(out_chunk)) + out_chunk
+    return out_chunk
+  
+  def decrypt_chunk(self, in_chunk):
+    '''Decrypts a chunk of hexadecimal data, using the cache.'''
+    out_chunk = self.chunk_cache.get(in_chunk)
+    if out_chunk is None:
+      out_chunk = self.raw_decrypt_chunk(in_chunk)
+      self.chunk_cache.put(in_chunk, out_chunk)
+    return out_chunk
     
   def decrypt(self, hex_string):
     '''Decrypts a bunch of data stored as a hexadecimal string.
     
     Returns a hexadecimal string with the decrypted data.
     '''
-    out_chunks = []
-    i = 0
-    in_chunk_size = self.size * 2
-    out_chunk_size = (self.size - 1) * 2
-    while i < len(hex_string):
-      in_chunk = hex_string[i:(i + in_chunk_size)]
-      if in_chunk in self.chunk_cache:
-        out_chunk = self.chunk_cache[in_chunk]
-      else:
-        out_chunk = self.raw_crypt(BigNum.from_hex(in_chunk)).hex()
-        if len(out_chunk) > out_chunk_size:
-          # This indicates a decryption error. However, we'll truncate the
-          # result, so the visualization can work.
-          out_chunk = out_chunk[0:out_chunk_size]
-        self.chunk_cache[in_chunk] = out_chunk
-      if len(out_chunk) < out_chunk_size:
-        out_chunks.append('0' * (out_chunk_size - len(out_chunk)))
-      out_chunks.append(out_chunk)
-      i += in_chunk_size
-    return ''.join(out_chunks)
+    return ''.join([self.decrypt_chunk(in_chunk)
+                    for in_chunk in self.split(hex_string)])
+  
+  def save_cache(self, file):
+    '''Writes the chunk cache to a file, so a later run can reuse it.
+    
+    Args:
+        file: A File object that receives the cache, as JSON
+    '''
+    json.dump({'e': self.e.hex(), 'n': self.n.hex(),
+               'chunks': self.chunk_cache.items()}, file)
+  
+  def load_cache(self, file):
+    '''Adds the chunks in a file written by save_cache to the chunk cache.
+    
+    The file is ignored if it was written for a different key.
+    
+    Args:
+        file: A File object supplying the cache
+    
+    Returns True if the file's chunks were added to the cache.
+    '''
+    jso = json.load(file)
+    if jso['e'] != self.e.hex() or jso['n'] != self.n.hex():
+      return False
+    for in_chunk, out_chunk in jso['chunks']:
+      self.chunk_cache.put(str(in_chunk), str(out_chunk))
+    return True
+
+
+# Private: the RsaKey used by a decryption worker process.
+_worker_key = None
+
+def _init_decryption_worker(exponent_hex_string, modulus_hex_string,
+                            powmod_engine):
+  '''Sets up a worker process for EncryptedImage.iter_rows.'''
+  global _worker_key
+  BigNum.powmod_engine = powmod_engine
+  _worker_key = RsaKey(exponent_hex_string, modulus_hex_string)
+
+def _decrypt_chunk_in_worker(in_chunk):
+  '''Decrypts a chunk in a worker process set up by _init_decryption_worker.'''
+  return _worker_key.raw_decrypt_chunk(in_chunk)
 
 
 class EncryptedImage(object):
@@ -60,6 +155,8 @@ class EncryptedImage(object):
     self.encrypted_rows = []
     self.rows = None
     self.columns = None
+    # The number of processes used to decrypt the image.
+    self.processes = 1
   
   def set_key(self, exponent_hex_string, modulus_hex_string):
     '''Sets the RSA key to be used for decrypting the image.'''
@@ -73,13 +170,76 @@ class EncryptedImage(object):
     '''Decrypts the encrypted image.'''
     if self.rows is not None:
       return 
-    self.rows = []
-    for encrypted_row in self.encrypted_rows:
-      row = self.key.decrypt(encrypted_row)
-      row_size = self.columns and (self.columns * 6) 
-      if row_size:
-        row = row[0:row_size]
-      self.rows.append(row)
+    self.rows = list(self.iter_rows())
+  
+  def iter_rows(self):
+    '''Yields the decrypted rows in order, each one as soon as it's ready.
+    
+    The encrypted chunks are deduplicated across the whole image first, so
+    each distinct chunk that isn't in the key's cache is decrypted once, in
+    the order of its first appearance. If processes is more than 1, the
+    distinct chunks are decrypted by a pool of worker processes.
+    
+    The decrypted rows are not stored, unless decrypt_image was called.
+    '''
+    if self.rows is not None:
+      for row in self.rows:
+        yield row
+      return
+    
+    key = self.key
+    row_chunks = [key.split(encrypted_row)
+                  for encrypted_row in self.encrypted_rows]
+    # Decrypted chunks that rows which weren't yielded yet will need, and the
+    # last row that needs each chunk.
+    decrypted = {}
+    last_row = {}
+    # The distinct chunks that must be decrypted, and the number of them that
+    # must be decrypted before each row is ready.
+    new_chunks = []
+    ready_after = []
+    for i, chunks in enumerate(row_chunks):
+      for in_chunk in chunks:
+        if in_chunk not in last_row:
+          out_chunk = key.chunk_cache.get(in_chunk)
+          if out_chunk is None:
+            new_chunks.append(in_chunk)
+          else:
+            decrypted[in_chunk] = out_chunk
+        last_row[in_chunk] = i
+      ready_after.append(len(new_chunks))
+    
+    pool = None
+    if self.processes > 1 and len(new_chunks) > 1:
+      pool = multiprocessing.Pool(self.processes, _init_decryption_worker,
+                                  (key.e.hex(), key.n.hex(),
+                                   BigNum.powmod_engine))
+      # Small batches keep the first rows coming out quickly.
+      batch_size = max(1, min(64, len(new_chunks) // (4 * self.processes)))
+      out_chunks = pool.imap(_decrypt_chunk_in_worker, new_chunks, batch_size)
+    else:
+      out_chunks = (key.raw_decrypt_chunk(in_chunk) for in_chunk in new_chunks)
+    
+    try:
+      done = 0
+      row_size = self.columns and (self.columns * 6)
+      for i, chunks in enumerate(row_chunks):
+        while done < ready_after[i]:
+          in_chunk = new_chunks[done]
+          decrypted[in_chunk] = next(out_chunks)
+          key.chunk_cache.put(in_chunk, decrypted[in_chunk])
+          done += 1
+        row = ''.join([decrypted[in_chunk] for in_chunk in chunks])
+        for in_chunk in chunks:
+          if last_row[in_chunk] == i:
+            decrypted.pop(in_chunk, None)
+        if row_size:
+          row = row[0:row_size]
+        yield row
+    finally:
+      if pool is not None:
+        pool.terminate()
+        pool.join()
   
   def to_line_list(self):
     '''Returns a list of strings representing the image data.'''
@@ -92,9 +252,10 @@ class EncryptedImage(object):
     Args:
         file: A File object that receives the image data
     '''
-    for line in self.to_line_list():
+    for line in self.iter_rows():
       file.write(line)
       file.write("\n")
+      file.flush()
       
   def as_json(self):
     '''"A dict that obeys the JSON format, representing the image.'''
@@ -132,6 +293,13 @@ class EncryptedImage(object):
 # Command-line controller.
 if __name__ == '__main__':
   image = EncryptedImage.from_file(sys.stdin)
+  # PROCESSES sets the number of decryption processes. CHUNK_CACHE names a
+  # file that saves the decrypted chunks for the next run with the same key.
+  image.processes = int(os.environ.get('PROCESSES', '1'))
+  cache_filename = os.environ.get('CHUNK_CACHE')
+  if cache_filename and os.path.exists(cache_filename):
+    with open(cache_filename) as cache_file:
+      image.key.load_cache(cache_file)
   
   if os.environ.get('TRACE') == 'jsonp':
     sys.stdout.write('onJsonp(')
@@ -139,3 +307,7 @@ if __name__ == '__main__':
     sys.stdout.write(');\n')
   else:
     image.to_file(sys.stdout)
+  
+  if cache_filename:
+    with open(cache_filename, 'w') as cache_file:
+      image.key.save_cache(cache_file)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+'''Benchmark for the BigNum.powmod engines.
+
+Decrypts the images in tests/ with each engine in big_num.POWMOD_ENGINES,
+checks the output against the .gold files, and reports the time taken.
+
+Usage:
+    python rsa_benchmark.py [--engines ks,native] [--processes 1]
+                            [tests/1verdict_32.in ...]
+
+The ks engine is the reference implementation; it takes minutes on
+5future_1024.
+'''
+
+from __future__ import division  # Use // for integer division.
+import glob
+import optparse
+import os
+import re
+import sys
+import time
+
+from rsa import *
+
+def time_decryption(in_filename, engine, processes=1):
+  '''Decrypts a test image with a powmod engine and some worker processes.
+
+  Returns a (correct, seconds, chunks) tuple, where chunks is the number of
+  distinct encrypted chunks in the image.
+  '''
+  with open(in_filename) as in_file:
+    image = EncryptedImage.from_file(in_file)
+  image.processes = processes
+  old_engine = BigNum.powmod_engine
+  BigNum.powmod_engine = engine
+  try:
+    start = time.time()
+    rows = image.to_line_list()
+    seconds = time.time() - start
+  finally:
+    BigNum.powmod_engine = old_engine
+  with open(re.sub('\.in$', '.gold', in_filename)) as gold_file:
+    correct = [line.strip() for line in gold_file] == rows
+  return (correct, seconds, len(image.key.chunk_cache))
+
+def main(argv):
+  parser = optparse.OptionParser()
+  parser.add_option('--engines', default='ks,native',
+                    help='comma-separated POWMOD_ENGINES names')
+  parser.add_option('--processes', type='int', default=1,
+                    help='number of decryption processes')
+  options, in_filenames = parser.parse_args(argv)
+  if not in_filenames:
+    test_dir = os.path.join(os.path.dirname(__file__), 'tests')
+    in_filenames = sorted(glob.glob(os.path.join(test_dir, '*.in')))
+
+  print('%-20s %-8s %8s %10s %10s %8s' % ('test', 'engine', 'chunks',
+                                          'seconds', 'chunks/s', 'correct'))
+  for in_filename in in_filenames:
+    for engine in options.engines.split(','):
+      correct, seconds, chunks = time_decryption(in_filename, engine,
+                                                 options.processes)
+      print('%-20s %-8s %8d %10.3f %10.1f %8s' % (
+            os.path.basename(in_filename), engine, chunks, seconds,
+            chunks / max(seconds, 1e-9), correct))
+      sys.stdout.flush()
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -4,6 +4,10 @@ import unittest
 import sys
 import glob
 import re
+try:
+  from StringIO import StringIO
+except ImportError:
+  from io import StringIO
 
 from rsa import *
 
@@ -38,6 +42,51 @@ class RsaTest(unittest.TestCase):
           else: 
             sys.stdout.write('Failed\n')
           self.assertTrue(same)
-  
+
+  def _gold_lines(self, in_filename):
+    gold_filename = re.sub('\.in$', '.gold', in_filename)
+    with open(gold_filename) as gold_file:
+      return [line.strip() for line in gold_file]
+
+  def testParallelDecryption(self):
+    for in_filename in self._in_files[:3]:
+      with open(in_filename) as in_file:
+        image = EncryptedImage.from_file(in_file)
+      image.processes = 2
+      out_file = StringIO()
+      image.to_file(out_file)
+      self.assertEqual(self._gold_lines(in_filename),
+                       out_file.getvalue().splitlines())
+      self.assertIsNone(image.rows)
+
+  def testChunkCache(self):
+    in_filename = self._in_files[1]
+    with open(in_filename) as in_file:
+      image = EncryptedImage.from_file(in_file)
+    image.key.chunk_cache = LruCache(5)
+    self.assertEqual(self._gold_lines(in_filename), image.to_line_list())
+    self.assertEqual(5, len(image.key.chunk_cache))
+
+    cache_file = StringIO()
+    image.key.save_cache(cache_file)
+    with open(in_filename) as in_file:
+      image = EncryptedImage.from_file(in_file)
+    cache_file.seek(0)
+    self.assertTrue(image.key.load_cache(cache_file))
+    self.assertEqual(5, len(image.key.chunk_cache))
+    other_key = RsaKey('10001', 'DDE7DDE7')
+    cache_file.seek(0)
+    self.assertFalse(other_key.load_cache(cache_file))
+
+  def testLruCache(self):
+    cache = LruCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    self.assertEqual(1, cache.get('a'))
+    cache.put('c', 3)
+    self.assertFalse('b' in cache)
+    self.assertEqual(None, cache.get('b'))
+    self.assertEqual([('a', 1), ('c', 3)], cache.items())
+
 if __name__ == '__main__':
     unittest.main()
@@ -3,10 +3,15 @@
 import sys
 import os
 import time
+import heapq
+import json
+from array import array
 from math import *
 from nhpn import *
 from priority_queue import *
 
+INFINITY = float('inf')
+
 def distance(node1, node2):
     """Returns the distance between node1 and node2, ignoring the Earth's 
     curvature.
@@ -23,7 +28,9 @@ def distance_curved(node1, node2):
     B = node1.longitude * pi / 10**6 / 180
     C = node2.latitude * pi / 10**6 / 180
     D = node2.longitude * pi / 10**6 / 180
-    return acos(sin(A) * sin(C) + cos(A) * cos(C) * cos(B - D))
+    # Rounding can push the cosine just past 1 for (nearly) equal points.
+    return acos(min(1.0, max(-1.0, sin(A) * sin(C) +
+                                   cos(A) * cos(C) * cos(B - D))))
 
 class NodeDistancePair(object):
     """Wraps a node and its distance representing it in the priority queue."""
@@ -60,11 +67,44 @@ class NodeDistancePair(object):
     
 class Network(object):
     """The National Highway Planning network."""
+    
+    # The nhpn.Snapshot that the network was loaded from, if any.
+    snapshot = None
+    
     def __init__(self):
         """Creates a network with nodes, links and an edge set."""
-        self.nodes, self.links = self._load_data()
+        self.nodes, self._links = self._load_data()
         self._create_adjacency_lists()
-        self.edge_set = self._create_edge_set()
+        self._edge_set = None
+        self._name_index = None
+    
+    @property
+    def links(self):
+        """List of links; made from the snapshot when first used, if any."""
+        if self._links is None:
+            self._links = self.snapshot.links(self.nodes)
+        return self._links
+    
+    @property
+    def edge_set(self):
+        """Set of (begin, end) node pairs of the links, built when first used.
+        """
+        if self._edge_set is None:
+            self._edge_set = self._create_edge_set()
+        return self._edge_set
+    
+    @property
+    def name_index(self):
+        """nhpn.NameIndex of the nodes, from the snapshot or built when first
+        used."""
+        if self._name_index is None:
+            if self.snapshot is not None:
+                self._name_index = self.snapshot.name_index
+            else:
+                self._name_index = NameIndex.build(
+                    [node.state for node in self.nodes],
+                    [node.description for node in self.nodes])
+        return self._name_index
     
     def __str__(self):
         """String representation of the network size."""
@@ -109,7 +149,15 @@ class Network(object):
         Returns:
             The node if it exists, or None otherwise.
         """
-    
+        # Any node whose description contains the city has a word that
+        # contains the city's first word, so these candidates, in order,
+        # give the same first match as scanning all the nodes.
+        words = NameIndex.words(city)
+        if words:
+            for index in self.name_index.search(state, words[0]):
+                if city in self.nodes[index].description:
+                    return self.nodes[index]
+            return None
         for node in self.nodes:
             if node.state == state:
                 if city in node.description:
@@ -117,14 +165,27 @@ class Network(object):
         return None
     
     def _load_data(self):
-        loader = Loader()
+        # NHPN_CACHE names the snapshot file; NHPN_CACHE= disables it.
+        cachefile = os.environ.get('NHPN_CACHE', 'data/nhpn.snapshot') or None
+        loader = Loader(cachefile=cachefile)
+        self.snapshot = loader.snapshot
         lnodes = loader.nodes()
+        if self.snapshot is not None:
+            return lnodes, None
         llinks = loader.links()
         return lnodes, llinks
     
     def _create_adjacency_lists(self):
         # Use an adjacency list representation, by putting all vertices
         # adjacent to node in node.adj.
+        if self.snapshot is not None:
+            nodes = self.nodes
+            offsets = self.snapshot.arrays['adjacency_offsets']
+            neighbors = [nodes[j]
+                         for j in self.snapshot.arrays['adjacency_targets']]
+            for i, node in enumerate(nodes):
+                node.adj = neighbors[offsets[i]:offsets[i + 1]]
+            return
         for node in self.nodes:
             node.adj = []
         for link in self.links:
@@ -133,6 +194,12 @@ class Network(object):
             
     def _create_edge_set(self):
         # Puts edges in a set for faster lookup.
+        if self.snapshot is not None:
+            nodes = self.nodes
+            return set(zip(map(nodes.__getitem__,
+                               self.snapshot.arrays['link_begins']),
+                           map(nodes.__getitem__,
+                               self.snapshot.arrays['link_ends'])))
         edge_set = set()
         for link in self.links:
             edge_set.add((link.begin, link.end))
@@ -226,34 +293,432 @@ class NodePriorityQueue(object):
             if self.heap[index] is not key:
                 raise ValueError('Key index mapping is wrong.')
             
+class SearchState(object):
+    """Per-node state of one search direction, valid only for one generation.
+    
+    An entry in distance, parent or estimate is valid if seen has the current
+    generation for that node, and a node is visited in the current search if
+    visited has the current generation.
+    """
+    
+    def __init__(self, node_count):
+        self.distance = array('d', [0.0]) * node_count
+        self.parent = array('l', [-1]) * node_count
+        self.estimate = array('d', [0.0]) * node_count
+        self.seen = array('l', [0]) * node_count
+        self.visited = array('l', [0]) * node_count
+    
+    def path(self, index):
+        """The node indexes on the path from the search's source to index."""
+        indexes = []
+        while index != -1:
+            indexes.append(index)
+            index = self.parent[index]
+        indexes.reverse()
+        return indexes
+
+class Landmarks(object):
+    """Shortest path distances from a few landmark nodes to every node.
+    
+    ALT uses them for A* lower bounds: by the triangle inequality, the distance
+    from node v to node t is at least |d(L, t) - d(L, v)| for any landmark L.
+    """
+    
+    def __init__(self, weight_name, indexes, distances):
+        """Creates a set of landmarks.
+        
+        Args:
+            weight_name: name of the weight function used for the distances.
+            indexes: the landmarks' node indexes in the CompiledNetwork.
+            distances: array with the distance between landmark i and the node
+                with index v at distances[v * len(indexes) + i], or infinity if
+                there is no path between them.
+        """
+        self.weight_name = weight_name
+        self.indexes = indexes
+        self.distances = distances
+    
+    def node_count(self):
+        return len(self.distances) // max(len(self.indexes), 1)
+    
+    def save(self, file):
+        """Writes the landmarks to a binary file object."""
+        file.write(json.dumps({'weight': self.weight_name,
+                               'landmarks': list(self.indexes),
+                               'nodes': self.node_count()}) + '\n')
+        self.distances.tofile(file)
+    
+    @staticmethod
+    def load(file):
+        """Reads landmarks written by save from a binary file object."""
+        header = json.loads(file.readline())
+        distances = array('d')
+        distances.fromfile(file, header['nodes'] * len(header['landmarks']))
+        return Landmarks(header['weight'], header['landmarks'], distances)
+
+class CompiledNetwork(object):
+    """A Network converted once into arrays, for answering many path queries.
+    
+    The adjacency lists are stored in compressed sparse row (CSR) form: the
+    neighbors of the node with index i are targets[offsets[i]:offsets[i+1]],
+    in the same order as in node.adj. The weight of every edge is computed
+    once per weight function, so queries don't call the weight function.
+    
+    The per-query state (distances, parents, visited flags) lives in arrays
+    stamped with a query generation number, so starting a new query does not
+    reset anything.
+    
+    Besides Dijkstra's algorithm, paths can be found by bidirectional
+    Dijkstra, by A* with the straight-line (or great-circle) distance to the
+    destination as the heuristic, and by ALT, which is A* with lower bounds
+    from precomputed landmark distances.
+    """
+    
+    # The number of landmarks that alt selects if none were selected or loaded.
+    landmark_count = 16
+    
+    def __init__(self, network, weights=None):
+        """Compiles a network.
+        
+        Args:
+            network: the Network to be compiled.
+            weights: weight functions whose edge weights are computed now;
+                others are computed when first used. Defaults to distance and
+                distance_curved.
+        """
+        self.network = network
+        self.nodes = network.nodes
+        self.node_index = {}
+        for i, node in enumerate(self.nodes):
+            self.node_index[node] = i
+        if network.snapshot is not None:
+            self.offsets = network.snapshot.arrays['adjacency_offsets']
+            self.targets = network.snapshot.arrays['adjacency_targets']
+        else:
+            self.offsets = array('l', [0])
+            self.targets = array('l')
+            for node in self.nodes:
+                for neighbor in node.adj:
+                    self.targets.append(self.node_index[neighbor])
+                self.offsets.append(len(self.targets))
+        
+        self.edge_weights = {}
+        if weights is None:
+            weights = [distance, distance_curved]
+        for weight in weights:
+            self.weights_for(weight)
+        self.landmarks = {}
+        
+        self.generation = 0
+        self.forward = SearchState(len(self.nodes))
+        self.backward = SearchState(len(self.nodes))
+    
+    def weights_for(self, weight):
+        """The array of edge weights for a weight function, parallel to targets.
+        """
+        if weight not in self.edge_weights:
+            nodes = self.nodes
+            targets = self.targets
+            weights = array('d')
+            for i in xrange(len(nodes)):
+                node = nodes[i]
+                for edge in xrange(self.offsets[i], self.offsets[i + 1]):
+                    weights.append(weight(node, nodes[targets[edge]]))
+            self.edge_weights[weight] = weights
+        return self.edge_weights[weight]
+    
+    def dijkstra(self, weight, source, destination):
+        """Performs Dijkstra's algorithm from source until it reaches destination.
+        
+        Finds the same paths as PathFinder.dijkstra, and visits the same nodes
+        unless several nodes are at exactly the same distance from the source.
+        
+        Args:
+            weight: function for calculating the weight of edge (u, v).
+            source: the source node in the network.
+            destination: the destination node in the network.
+        
+        Returns:
+            A tuple: (the path as a list of nodes from source to destination,
+                      the number of visited nodes)
+        """
+        return self._astar(weight, source, destination, None)
+    
+    def astar(self, weight, source, destination):
+        """Performs A* search from source to destination.
+        
+        The heuristic is weight(node, destination), which is a lower bound on
+        the distance to the destination for distance (the straight line) and
+        distance_curved (the great circle), because edge weights are computed
+        with the same function.
+        
+        Args and return value as in dijkstra.
+        """
+        nodes = self.nodes
+        destination_index = self.node_index[destination]
+        return self._astar(weight, source, destination,
+                           lambda index: 0 if index == destination_index
+                           else weight(nodes[index], destination))
+    
+    def alt(self, weight, source, destination):
+        """Performs A* search with landmark lower bounds (ALT).
+        
+        Uses the landmarks selected or loaded for weight; if there are none,
+        selects landmark_count landmarks first.
+        
+        Args and return value as in dijkstra.
+        """
+        if weight not in self.landmarks:
+            self.select_landmarks(weight, self.landmark_count)
+        landmarks = self.landmarks[weight]
+        count = len(landmarks.indexes)
+        distances = landmarks.distances
+        base = self.node_index[destination] * count
+        # Landmarks that can't reach the destination give no bounds.
+        usable = [(i, distances[base + i]) for i in xrange(count)
+                  if distances[base + i] != INFINITY]
+        def lower_bound(index):
+            base = index * count
+            bound = 0
+            for i, to_destination in usable:
+                difference = abs(to_destination - distances[base + i])
+                if difference > bound:
+                    bound = difference
+            return bound
+        return self._astar(weight, source, destination, lower_bound)
+    
+    def bidirectional(self, weight, source, destination):
+        """Performs Dijkstra's algorithm from source and destination at once.
+        
+        Each step advances the search whose next node is closer to its own
+        source. The searches stop when the sum of their next distances is at
+        least the length of the shortest path found between them. The network
+        is undirected, so the backward search uses the same edges.
+        
+        Args and return value as in dijkstra.
+        """
+        self.generation += 1
+        generation = self.generation
+        offsets, targets = self.offsets, self.targets
+        weights = self.weights_for(weight)
+        source_index = self.node_index[source]
+        destination_index = self.node_index[destination]
+        if source_index == destination_index:
+            return ([source], 1)
+        states = [self.forward, self.backward]
+        heaps = [[(0, source_index)], [(0, destination_index)]]
+        for state, heap in zip(states, heaps):
+            index = heap[0][1]
+            state.distance[index] = 0
+            state.parent[index] = -1
+            state.seen[index] = generation
+        
+        best = INFINITY
+        meeting = None
+        num_visited = 0
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            state, other = states[side], states[1 - side]
+            current_distance, current = heapq.heappop(heaps[side])
+            if state.visited[current] == generation:
+                continue
+            state.visited[current] = generation
+            num_visited += 1
+            for edge in xrange(offsets[current], offsets[current + 1]):
+                node = targets[edge]
+                new_distance = weights[edge] + current_distance
+                if state.visited[node] != generation and (
+                        state.seen[node] != generation or
+                        new_distance < state.distance[node]):
+                    state.distance[node] = new_distance
+                    state.parent[node] = current
+                    state.seen[node] = generation
+                    heapq.heappush(heaps[side], (new_distance, node))
+                if (other.seen[node] == generation and
+                        new_distance + other.distance[node] < best):
+                    best = new_distance + other.distance[node]
+                    meeting = (side, current, node)
+        if meeting is None:
+            return (None, num_visited)
+        side, current, node = meeting
+        if side == 1:
+            current, node = node, current
+        indexes = self.forward.path(current)
+        indexes.extend(reversed(self.backward.path(node)))
+        return ([self.nodes[i] for i in indexes], num_visited)
+    
+    def select_landmarks(self, weight, count):
+        """Selects landmarks for ALT queries with a weight function.
+        
+        Uses farthest selection: each landmark is the node farthest from the
+        landmarks selected before it, and the first one is the node farthest
+        from the network's first node.
+        
+        Args:
+            weight: function for calculating the weight of edge (u, v).
+            count: the number of landmarks.
+        
+        Returns:
+            The Landmarks, which are also used by later alt queries.
+        """
+        weights = self.weights_for(weight)
+        node_count = len(self.nodes)
+        indexes = []
+        rows = []
+        closest = self._distances_from(weights, 0)
+        while len(indexes) < count:
+            farthest, farthest_distance = -1, 0
+            for i in xrange(node_count):
+                if closest[i] != INFINITY and closest[i] > farthest_distance:
+                    farthest, farthest_distance = i, closest[i]
+            if farthest == -1:
+                break  # Every node is a landmark or has distance 0.
+            row = self._distances_from(weights, farthest)
+            if not indexes:
+                closest = row
+            else:
+                closest = array('d', map(min, closest, row))
+            indexes.append(farthest)
+            rows.append(row)
+        
+        distances = array('d', [0.0]) * (node_count * len(indexes))
+        for i, row in enumerate(rows):
+            distances[i::len(indexes)] = row
+        landmarks = Landmarks(weight.__name__, indexes, distances)
+        self.landmarks[weight] = landmarks
+        return landmarks
+    
+    def load_landmarks(self, weight, file):
+        """Loads landmarks saved by Landmarks.save for use by alt queries.
+        
+        Raises:
+            ValueError: if the landmarks were computed with another weight
+                function or for a network with a different number of nodes.
+        """
+        landmarks = Landmarks.load(file)
+        if landmarks.weight_name != weight.__name__:
+            raise ValueError('Landmarks are for weight function %s, not %s' %
+                             (landmarks.weight_name, weight.__name__))
+        if landmarks.node_count() != len(self.nodes):
+            raise ValueError('Landmarks are for a network with %d nodes, not %d'
+                             % (landmarks.node_count(), len(self.nodes)))
+        self.landmarks[weight] = landmarks
+        return landmarks
+    
+    def _astar(self, weight, source, destination, heuristic):
+        # A* search, or Dijkstra's algorithm if heuristic is None. The heap is
+        # keyed by distance plus estimate, and stale entries are skipped.
+        self.generation += 1
+        generation = self.generation
+        offsets, targets = self.offsets, self.targets
+        weights = self.weights_for(weight)
+        state = self.forward
+        distances, parent, estimate = state.distance, state.parent, state.estimate
+        seen, visited = state.seen, state.visited
+        source_index = self.node_index[source]
+        destination_index = self.node_index[destination]
+        
+        distances[source_index] = 0
+        parent[source_index] = -1
+        estimate[source_index] = 0
+        seen[source_index] = generation
+        heap = [(0, source_index)]
+        num_visited = 0
+        while heap:
+            current = heapq.heappop(heap)[1]
+            if visited[current] == generation:
+                continue  # Stale entry, left behind by a decreased distance.
+            visited[current] = generation
+            num_visited += 1
+            if current == destination_index:
+                indexes = state.path(destination_index)
+                return ([self.nodes[i] for i in indexes], num_visited)
+            current_distance = distances[current]
+            for edge in xrange(offsets[current], offsets[current + 1]):
+                node = targets[edge]
+                if visited[node] == generation:
+                    continue
+                new_distance = weights[edge] + current_distance
+                if seen[node] != generation:
+                    if heuristic is not None:
+                        estimate[node] = heuristic(node)
+                    else:
+                        estimate[node] = 0
+                elif new_distance >= distances[node]:
+                    continue
+                distances[node] = new_distance
+                parent[node] = current
+                seen[node] = generation
+                heapq.heappush(heap, (new_distance + estimate[node], node))
+        return (None, num_visited)
+    
+    def _distances_from(self, weights, source_index):
+        # The distances from a node to every node, by Dijkstra's algorithm.
+        offsets, targets = self.offsets, self.targets
+        distances = array('d', [INFINITY]) * len(self.nodes)
+        distances[source_index] = 0
+        heap = [(0, source_index)]
+        while heap:
+            current_distance, current = heapq.heappop(heap)
+            if current_distance > distances[current]:
+                continue
+            for edge in xrange(offsets[current], offsets[current + 1]):
+                node = targets[edge]
+                new_distance = weights[edge] + current_distance
+                if new_distance < distances[node]:
+                    distances[node] = new_distance
+                    heapq.heappush(heap, (new_distance, node))
+        return distances
+
 class PathFinder(object):
     """Finds a shortest path from the source to the destination in the network.
     """
-    def __init__(self, network, source, destination):
+    # Query modes of shortest_path; all but dijkstra need a CompiledNetwork.
+    MODES = ['dijkstra', 'bidirectional', 'astar', 'alt']
+    
+    def __init__(self, network, source, destination, compiled=None):
         """Creates a PathFinder for the network with source and destination.
         
         Args:
             network: the network on which paths should be found.
             source: source of the path.
             destination: destination of the path.
+            compiled: optional CompiledNetwork for network; if given, it is
+                used to find paths instead of PathFinder.dijkstra. Modes other
+                than dijkstra compile the network if it is not given.
         """    
         self.network = network
         self.source = source
         self.destination = destination
+        self.compiled = compiled
         
-    def shortest_path(self, weight):
+    def shortest_path(self, weight, mode='dijkstra'):
         """Returns a PathResult for the shortest path from source to destination. 
         
         Args: 
             weight: weight function to compute edge weights.
+            mode: the search algorithm, one of MODES.
             
         Returns:
             PathResult for the shortest path or None if path is empty.
+        
+        Raises:
+            ValueError: if mode is not in MODES.
         """
+        if mode not in self.MODES:
+            raise ValueError('Unknown mode %s' % mode)
+        if mode != 'dijkstra' and self.compiled is None:
+            self.compiled = CompiledNetwork(self.network)
         start_time = time.clock()
         
-        path, num_visited = self.dijkstra(weight, self.network.nodes, 
-                                          self.source, self.destination)
+        if self.compiled is not None:
+            search = getattr(self.compiled, mode)
+            path, num_visited = search(weight, self.source, self.destination)
+        else:
+            path, num_visited = self.dijkstra(weight, self.network.nodes, 
+                                              self.source, self.destination)
             
         time_used = round(time.clock() - start_time, 3)
         if path:
@@ -329,13 +794,14 @@ class PathFinder(object):
         return(nodes)
     
     @staticmethod
-    def from_file(file, network):
+    def from_file(file, network, compiled=None):
         """Creates a PathFinder object with source and destination read from 
         file.
         
         Args:
             file: file containing source and destination.
             network: network in which a shortest path needs to be found.
+            compiled: optional CompiledNetwork for network.
         
         Returns:
             A PathFinder object.
@@ -354,7 +820,7 @@ class PathFinder(object):
                 destination = node
                 
         if source and destination:
-            return PathFinder(network, source, destination)
+            return PathFinder(network, source, destination, compiled)
         else:
             if source is None:
                 raise ValueError('Invalid source.')
@@ -445,17 +911,36 @@ class PathResult(object):
 # Command-line controller.
 if __name__ == '__main__':
     network = Network()
+    # ENGINE=csr answers the query with a CompiledNetwork. MODE selects the
+    # search algorithm (PathFinder.MODES); for MODE=alt, LANDMARKS=file.bin
+    # keeps the landmarks in file-distance.bin and file-distance_curved.bin.
+    mode = os.environ.get('MODE', 'dijkstra')
+    compiled = None
+    if os.environ.get('ENGINE') == 'csr' or mode != 'dijkstra':
+        compiled = CompiledNetwork(network)
+    if mode == 'alt' and os.environ.get('LANDMARKS'):
+        root, ext = os.path.splitext(os.environ['LANDMARKS'])
+        for weight in [distance, distance_curved]:
+            landmark_filename = '%s-%s%s' % (root, weight.__name__, ext)
+            if os.path.exists(landmark_filename):
+                with open(landmark_filename, 'rb') as file:
+                    compiled.load_landmarks(weight, file)
+            else:
+                landmarks = compiled.select_landmarks(
+                    weight, int(os.environ.get('LANDMARK_COUNT', 16)))
+                with open(landmark_filename, 'wb') as file:
+                    landmarks.save(file)
     if os.environ.get('TRACE') == 'kml':
-        pf = PathFinder.from_file(sys.stdin, network)
+        pf = PathFinder.from_file(sys.stdin, network, compiled)
         with open('path_flat.kml', 'w') as file:
-            r = pf.shortest_path(distance)
+            r = pf.shortest_path(distance, mode)
             r and file.write(r.to_kml())
         with open('path_curved.kml', 'w') as file:
-            r = pf.shortest_path(distance_curved)
+            r = pf.shortest_path(distance_curved, mode)
             r and file.write(r.to_kml())
     else:
-        pf = PathFinder.from_file(sys.stdin, network)
-        r = pf.shortest_path(distance)
+        pf = PathFinder.from_file(sys.stdin, network, compiled)
+        r = pf.shortest_path(distance, mode)
         if r:
             if os.environ.get('TRACE') == 'sol':
                 r.sol_to_file(sys.stdout)
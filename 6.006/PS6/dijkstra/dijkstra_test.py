@@ -4,13 +4,70 @@ import unittest
 import sys
 import os
 import glob
+import random
 import re
+import shutil
+import tempfile
 
 if os.environ.get('SOLUTION'):
     from dijkstra_full import *
 else:
     from dijkstra import *
 
+class SyntheticNetwork(Network):
+    """A random road grid, for tests that don't need the NHPN data files."""
+    def __init__(self, size=20, seed=6006):
+        self.size = size
+        self.seed = seed
+        Network.__init__(self)
+    
+    def _load_data(self):
+        rng = random.Random(self.seed)
+        nodes = []
+        for row in range(self.size):
+            for column in range(self.size):
+                nodes.append(Node(-100000000 + column * 50000 +
+                                  rng.randrange(-20000, 20000),
+                                  40000000 + row * 50000 +
+                                  rng.randrange(-20000, 20000),
+                                  'ST', 'CITY%d' % len(nodes)))
+        links = []
+        for row in range(self.size):
+            for column in range(self.size):
+                i = row * self.size + column
+                if column + 1 < self.size and rng.random() < 0.9:
+                    links.append(Link(nodes[i], nodes[i + 1], 'ROAD'))
+                if row + 1 < self.size and rng.random() < 0.9:
+                    links.append(Link(nodes[i], nodes[i + self.size], 'ROAD'))
+        return nodes, links
+
+class FileNetwork(Network):
+    """A network loaded from NHPN files, optionally through a snapshot."""
+    def __init__(self, nodesource, linksource, cachefile=None):
+        self.loader = Loader(nodesource, linksource, cachefile)
+        Network.__init__(self)
+    
+    def _load_data(self):
+        self.snapshot = self.loader.snapshot
+        if self.snapshot is not None:
+            return self.loader.nodes(), None
+        return self.loader.nodes(), self.loader.links()
+
+def write_nhpn_files(network, nodesource, linksource):
+    """Writes a network's nodes and links in the NHPN fixed-width formats."""
+    feature_ids = {}
+    with open(nodesource, 'w') as file:
+        for node in network.nodes:
+            feature_ids[node] = 1000 + len(feature_ids)
+            file.write('%23s%10d%10d%10d%2s%-33s\n' % (
+                '', feature_ids[node], node.longitude, node.latitude,
+                node.state, node.description))
+    with open(linksource, 'w') as file:
+        for link in network.links:
+            file.write('%33s%10d%10d%-35s\n' % (
+                '', feature_ids[link.begin], feature_ids[link.end],
+                link.description))
+
 class DijkstraTest(unittest.TestCase):
     def setUp(self):
         dir = os.path.dirname(__file__)
@@ -54,5 +111,163 @@ class DijkstraTest(unittest.TestCase):
                         sys.stdout.write('Failed\n')
                     self.assertTrue(same)
 
+    def testCompiledNetwork(self):
+        network = SyntheticNetwork()
+        compiled = CompiledNetwork(network)
+        rng = random.Random(42)
+        for i in range(20):
+            source, destination = rng.sample(network.nodes, 2)
+            for weight in [distance, distance_curved]:
+                expected = PathFinder(network, source,
+                                      destination).shortest_path(weight)
+                result = PathFinder(network, source, destination,
+                                    compiled).shortest_path(weight)
+                self.assertEqual(expected.path, result.path)
+                self.assertEqual(expected.num_visited, result.num_visited)
+                self.assertEqual(expected.sol_to_lines(),
+                                 result.sol_to_lines())
+                if result.path:
+                    network.verify_path(result.path, source, destination)
+
+    def testQueryModes(self):
+        network = SyntheticNetwork()
+        compiled = CompiledNetwork(network)
+        compiled.select_landmarks(distance, 4)
+        rng = random.Random(7)
+        visited = dict((mode, 0) for mode in PathFinder.MODES)
+        for i in range(20):
+            source, destination = rng.sample(network.nodes, 2)
+            for weight in [distance, distance_curved]:
+                pf = PathFinder(network, source, destination, compiled)
+                expected = pf.shortest_path(weight)
+                visited['dijkstra'] += expected.num_visited
+                for mode in PathFinder.MODES[1:]:
+                    result = pf.shortest_path(weight, mode)
+                    self.assertEqual(expected.path, result.path)
+                    visited[mode] += result.num_visited
+        self.assertEqual(4, len(compiled.landmarks[distance].indexes))
+        self.assertEqual(compiled.landmark_count,
+                         len(compiled.landmarks[distance_curved].indexes))
+        for mode in PathFinder.MODES[1:]:
+            self.assertTrue(visited[mode] < visited['dijkstra'])
+        pf = PathFinder(network, source, source, compiled)
+        for mode in PathFinder.MODES:
+            self.assertEqual([source], pf.shortest_path(distance, mode).path)
+        self.assertRaises(ValueError, pf.shortest_path, distance, 'bfs')
+
+    def testAstarManyDestinations(self):
+        # distance_curved(node, node) used to hit acos of slightly over 1.
+        network = SyntheticNetwork()
+        compiled = CompiledNetwork(network)
+        rng = random.Random(16)
+        for i in range(400):
+            source, destination = rng.sample(network.nodes, 2)
+            pf = PathFinder(network, source, destination, compiled)
+            for weight in [distance, distance_curved]:
+                self.assertEqual(pf.shortest_path(weight).path,
+                                 pf.shortest_path(weight, 'astar').path)
+        for node in network.nodes:
+            self.assertAlmostEqual(0, distance_curved(node, node))
+
+    def testLandmarkFile(self):
+        network = SyntheticNetwork(10)
+        compiled = CompiledNetwork(network)
+        landmarks = compiled.select_landmarks(distance_curved, 3)
+        with tempfile.TemporaryFile() as file:
+            landmarks.save(file)
+            file.seek(0)
+            loaded = CompiledNetwork(network).load_landmarks(distance_curved,
+                                                             file)
+            self.assertEqual(landmarks.indexes, loaded.indexes)
+            self.assertEqual(landmarks.distances, loaded.distances)
+            file.seek(0)
+            self.assertRaises(ValueError, compiled.load_landmarks, distance,
+                              file)
+
+    def testSnapshot(self):
+        directory = tempfile.mkdtemp()
+        try:
+            nodesource = os.path.join(directory, 'nhpn.nod')
+            linksource = os.path.join(directory, 'nhpn.lnk')
+            cachefile = os.path.join(directory, 'nhpn.snapshot')
+            write_nhpn_files(SyntheticNetwork(8), nodesource, linksource)
+            text = FileNetwork(nodesource, linksource)
+            self.assertEqual(None, text.snapshot)
+            built = FileNetwork(nodesource, linksource, cachefile)
+            self.assertTrue(os.path.exists(cachefile))
+            loaded = FileNetwork(nodesource, linksource, cachefile)
+            for network in [built, loaded]:
+                self.assertNotEqual(None, network.snapshot)
+                self.assertEqual(repr(text.nodes), repr(network.nodes))
+                self.assertEqual(repr(text.links), repr(network.links))
+                for node, other in zip(text.nodes, network.nodes):
+                    self.assertEqual(repr(node.adj), repr(other.adj))
+                self.assertEqual(len(text.edge_set), len(network.edge_set))
+                self.assertEqual(str(text), str(network))
+                source, destination = network.nodes[0], network.nodes[-1]
+                result = PathFinder(network, source, destination,
+                                    CompiledNetwork(network)
+                                    ).shortest_path(distance)
+                network.verify_path(result.path, source, destination)
+                expected = PathFinder(text, text.nodes[0], text.nodes[-1]
+                                      ).shortest_path(distance)
+                self.assertEqual(expected.sol_to_lines(), result.sol_to_lines())
+            
+            # Changing a source file makes the snapshot stale.
+            with open(nodesource, 'a') as file:
+                file.write('%23s%10d%10d%10d%2s%-33s\n' % (
+                    '', 999, 0, 0, 'ST', 'ISOLATED'))
+            rebuilt = FileNetwork(nodesource, linksource, cachefile)
+            self.assertEqual(len(text.nodes) + 1, len(rebuilt.nodes))
+            self.assertEqual('ISOLATED',
+                             rebuilt.node_by_name('ISOLATED', 'ST').description)
+        finally:
+            shutil.rmtree(directory)
+
+    def testNodeByName(self):
+        network = SyntheticNetwork(8)
+        network.nodes[5].description = 'SOUTH BOSTON'
+        network.nodes[9].description = 'BOSTON'
+        network.nodes[12].description = 'NEW HAVEN'
+        network.nodes[20].description = 'NEWHAVEN'
+        self.assertEqual(network.nodes[5], network.node_by_name('BOSTON', 'ST'))
+        self.assertEqual(network.nodes[12],
+                         network.node_by_name('NEW HAVEN', 'ST'))
+        self.assertEqual(network.nodes[20],
+                         network.node_by_name('WHAVEN', 'ST'))
+        self.assertEqual(None, network.node_by_name('BOSTON', 'MA'))
+        self.assertEqual(None, network.node_by_name('PARIS', 'ST'))
+        # The first match wins even where the city ends inside a word.
+        network.nodes[3].description = 'SANTA FE'
+        network.nodes[7].description = 'SAN JOSE'
+        network.nodes[8].description = 'LOS SAN'
+        network._name_index = None
+        self.assertEqual(network.nodes[3], network.node_by_name('SAN', 'ST'))
+        self.assertEqual(network.nodes[7], network.node_by_name('SAN J', 'ST'))
+        self.assertEqual(network.nodes[8], network.node_by_name('S SAN', 'ST'))
+        self.assertEqual(network.nodes[3], network.node_by_name('TA F', 'ST'))
+        self.assertEqual(None, network.node_by_name('SAN FE', 'ST'))
+
+    def testNodeByNameMatchesScan(self):
+        network = SyntheticNetwork(12)
+        rng = random.Random(17)
+        words = ['SAN', 'SANTA', 'FE', 'NEW', 'NEWARK', 'ARK', 'PORT', 'LAND']
+        for node in network.nodes:
+            node.description = ' '.join(rng.choice(words)
+                                        for i in range(rng.randint(1, 3)))
+            node.state = rng.choice(['ST', 'MA'])
+        network._name_index = None
+        for i in range(300):
+            city = ' '.join(rng.choice(words)
+                            for i in range(rng.randint(1, 2)))
+            city = city[rng.randrange(3):]
+            for state in ['ST', 'MA', 'CA']:
+                expected = None
+                for node in network.nodes:
+                    if node.state == state and city in node.description:
+                        expected = node
+                        break
+                self.assertEqual(expected, network.node_by_name(city, state))
+
 if __name__ == '__main__':
     unittest.main()
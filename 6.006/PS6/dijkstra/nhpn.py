@@ -8,6 +8,13 @@
 National Highway Planning Network (NHPN) database. Also provides a
 way to load such objects from files."""
 
+import bisect
+import json
+import mmap
+import os
+import re
+from array import array
+
 class Node:
     """An NHPN geographical node."""
 
@@ -40,12 +47,260 @@ class Link:
         return "Link(%s, %s, '%s')" % (self.begin, self.end, self.description)
 
 
+class NameIndex(object):
+    """Finds the nodes whose description contains a word, in a given state.
+
+    Words are the runs of letters and digits in a description, so the index
+    maps (state, word) to the indexes of the matching nodes, in order.
+    """
+
+    def __init__(self, keys, offsets, indexes):
+        """Creates an index from arrays, as stored in a Snapshot.
+
+        The nodes for the key 'STATE WORD' keys[i] are
+        indexes[offsets[i]:offsets[i + 1]].
+        """
+        self.keys = keys
+        self.offsets = offsets
+        self.indexes = indexes
+        self._positions = dict(zip(keys, range(len(keys))))
+
+    @staticmethod
+    def words(text):
+        """The words in a description or city name."""
+        return re.findall('[A-Za-z0-9]+', text)
+
+    @staticmethod
+    def build(states, descriptions):
+        """Indexes the nodes with the given states and descriptions."""
+        nodes_for_key = {}
+        for i in range(len(states)):
+            for word in set(NameIndex.words(descriptions[i])):
+                key = '%s %s' % (states[i], word)
+                nodes_for_key.setdefault(key, []).append(i)
+        keys = sorted(nodes_for_key)
+        offsets = array('i', [0])
+        indexes = array('i')
+        for key in keys:
+            indexes.extend(nodes_for_key[key])
+            offsets.append(len(indexes))
+        return NameIndex(keys, offsets, indexes)
+
+    def lookup(self, state, word):
+        """Indexes of the nodes in state whose description contains word."""
+        position = self._positions.get('%s %s' % (state, word))
+        if position is None:
+            return []
+        return self.indexes[self.offsets[position]:self.offsets[position + 1]]
+
+    def search(self, state, text):
+        """Indexes of the nodes in state with a word that contains text, in
+        order.
+
+        A description that contains a city name has each word of the name
+        inside one of its words, so the result includes every node whose
+        description contains a city name with text as its first word.
+        """
+        # The keys are sorted, so the state's keys are a contiguous range.
+        start = bisect.bisect_left(self.keys, state + ' ')
+        end = bisect.bisect_left(self.keys, state + '!')
+        prefix = len(state) + 1
+        found = set()
+        for position in range(start, end):
+            if text in self.keys[position][prefix:]:
+                found.update(self.indexes[self.offsets[position]:
+                                          self.offsets[position + 1]])
+        return sorted(found)
+
+class Snapshot(object):
+    """The NHPN nodes and links compiled into arrays and a string table.
+
+    A snapshot is saved to a binary file with a JSON header line followed by
+    the arrays, and loaded by memory-mapping the file. The header records the
+    sizes and modification times of the source files, so a stale snapshot can
+    be detected and rebuilt.
+
+    Nodes are stored as parallel arrays (longitudes, latitudes, states,
+    descriptions) where states and descriptions index the string table, links
+    as parallel arrays of node indexes and descriptions, and the adjacency
+    lists in compressed sparse row form, in the order Network builds them.
+    """
+
+    VERSION = 1
+    ARRAYS = ['longitudes', 'latitudes', 'states', 'descriptions',
+              'link_begins', 'link_ends', 'link_descriptions',
+              'adjacency_offsets', 'adjacency_targets',
+              'name_offsets', 'name_indexes']
+
+    def __init__(self, sources, strings, arrays, name_keys):
+        """Creates a snapshot.
+
+        Args:
+            sources: [size, modification time] of each source file.
+            strings: list of the strings referenced by the arrays.
+            arrays: dict from each name in ARRAYS to an array('i').
+            name_keys: the keys of the NameIndex.
+        """
+        self.sources = sources
+        self.strings = strings
+        self.arrays = arrays
+        self.name_index = NameIndex(name_keys, arrays['name_offsets'],
+                                    arrays['name_indexes'])
+
+    @staticmethod
+    def source_stamps(filenames):
+        """[size, modification time] of each file."""
+        stamps = []
+        for filename in filenames:
+            status = os.stat(filename)
+            stamps.append([status.st_size, status.st_mtime])
+        return stamps
+
+    @staticmethod
+    def from_objects(sources, nodes, links):
+        """Builds a snapshot of Node and Link objects."""
+        strings = []
+        string_ids = {}
+        def string_id(string):
+            if string not in string_ids:
+                string_ids[string] = len(strings)
+                strings.append(string)
+            return string_ids[string]
+        arrays = dict((name, array('i')) for name in Snapshot.ARRAYS)
+        node_index = {}
+        for i, node in enumerate(nodes):
+            node_index[node] = i
+            arrays['longitudes'].append(node.longitude)
+            arrays['latitudes'].append(node.latitude)
+            arrays['states'].append(string_id(node.state))
+            arrays['descriptions'].append(string_id(node.description))
+        adjacency = [[] for node in nodes]
+        for link in links:
+            begin, end = node_index[link.begin], node_index[link.end]
+            arrays['link_begins'].append(begin)
+            arrays['link_ends'].append(end)
+            arrays['link_descriptions'].append(string_id(link.description))
+            adjacency[begin].append(end)
+            adjacency[end].append(begin)
+        arrays['adjacency_offsets'].append(0)
+        for neighbors in adjacency:
+            arrays['adjacency_targets'].extend(neighbors)
+            arrays['adjacency_offsets'].append(
+                len(arrays['adjacency_targets']))
+        name_index = NameIndex.build([node.state for node in nodes],
+                                     [node.description for node in nodes])
+        arrays['name_offsets'] = name_index.offsets
+        arrays['name_indexes'] = name_index.indexes
+        return Snapshot(sources, strings, arrays, name_index.keys)
+
+    def nodes(self):
+        """A new list of Node objects."""
+        strings = self.strings
+        longitudes, latitudes = self.arrays['longitudes'], self.arrays['latitudes']
+        states, descriptions = self.arrays['states'], self.arrays['descriptions']
+        return [Node(longitudes[i], latitudes[i], strings[states[i]],
+                     strings[descriptions[i]])
+                for i in range(len(longitudes))]
+
+    def links(self, nodes):
+        """A new list of Link objects between nodes, as returned by nodes()."""
+        strings = self.strings
+        begins, ends = self.arrays['link_begins'], self.arrays['link_ends']
+        descriptions = self.arrays['link_descriptions']
+        return [Link(nodes[begins[i]], nodes[ends[i]], strings[descriptions[i]])
+                for i in range(len(begins))]
+
+    def save(self, filename):
+        """Writes the snapshot to a file, replacing it atomically."""
+        header = {'version': self.VERSION, 'sources': self.sources,
+                  'itemsize': array('i').itemsize,
+                  'strings': len(self.strings),
+                  'name_keys': len(self.name_index.keys),
+                  'arrays': [[name, len(self.arrays[name])]
+                             for name in self.ARRAYS]}
+        temporary = '%s.%d.tmp' % (filename, os.getpid())
+        with open(temporary, 'wb') as file:
+            file.write((json.dumps(header) + '\n').encode('ascii'))
+            for name in self.ARRAYS:
+                self.arrays[name].tofile(file)
+            # Descriptions never contain newlines.
+            text = '\n'.join(self.strings + self.name_index.keys)
+            if not isinstance(text, bytes):
+                text = text.encode('latin-1')
+            file.write(text)
+        os.rename(temporary, filename)
+
+    @staticmethod
+    def load(filename, sources=None):
+        """Reads a snapshot written by save.
+
+        Args:
+            filename: the snapshot file.
+            sources: if given, [size, modification time] of each source file;
+                a snapshot of different sources is treated as missing.
+
+        Returns:
+            The Snapshot, or None if the file is missing, stale or in an
+            older format.
+        """
+        try:
+            file = open(filename, 'rb')
+        except IOError:
+            return None
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            file.close()
+            return None  # An empty file.
+        try:
+            header = json.loads(data.readline().decode('ascii'))
+            if (header.get('version') != Snapshot.VERSION or
+                    header['itemsize'] != array('i').itemsize or
+                    (sources is not None and header['sources'] != sources)):
+                return None
+            offset = data.tell()
+            arrays = {}
+            for name, length in header['arrays']:
+                end = offset + length * header['itemsize']
+                arrays[name] = array('i')
+                if hasattr(arrays[name], 'frombytes'):
+                    arrays[name].frombytes(data[offset:end])
+                else:
+                    arrays[name].fromstring(data[offset:end])
+                offset = end
+            text = data[offset:]
+            if not isinstance(text, str):
+                text = text.decode('latin-1')
+            strings = text.split('\n')
+        finally:
+            data.close()
+            file.close()
+        count = header['strings']
+        return Snapshot(header['sources'], strings[:count], arrays,
+                        strings[count:count + header['name_keys']])
+
 class Loader:
     """An instance of Loader can be used to access NHPN nodes and links as
     Python objects."""
 
-    def __init__(self, nodesource='data/nhpn.nod', linksource='data/nhpn.lnk'):
-        """Load node and link objects from corresponding files."""
+    def __init__(self, nodesource='data/nhpn.nod', linksource='data/nhpn.lnk',
+                 cachefile=None):
+        """Load node and link objects from corresponding files.
+
+        If cachefile is given, the nodes and links are loaded from the
+        Snapshot in that file, which is rebuilt if it is missing or if the
+        source files changed. The snapshot is then available as
+        self.snapshot; otherwise self.snapshot is None.
+        """
+        self.snapshot = None
+        if cachefile is not None:
+            sources = Snapshot.source_stamps([nodesource, linksource])
+            self.snapshot = Snapshot.load(cachefile, sources)
+            if self.snapshot is not None:
+                self._nodes = self.snapshot.nodes()
+                self._links = None  # Made by links() when first needed.
+                return
+
         nodeForFeatureID = {}   # FeatureID -> node mapping
 
         # Load nodes and add to feature table
@@ -78,10 +333,19 @@ class Loader:
             linkfile.close()
         self._links = links
 
+        if cachefile is not None:
+            self.snapshot = Snapshot.from_objects(sources, self._nodes, links)
+            try:
+                self.snapshot.save(cachefile)
+            except EnvironmentError:
+                pass  # A read-only directory only costs the next start.
+
     def nodes(self):
         """List of all NHPN nodes."""
         return self._nodes
 
     def links(self):
         """List of all NHPN links."""
-        return self._links
\ No newline at end of file
+        if self._links is None:
+            self._links = self.snapshot.links(self._nodes)
+        return self._links
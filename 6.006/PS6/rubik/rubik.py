@@ -163,6 +163,196 @@ quarter_twists_names[Li] = 'Li'
 quarter_twists_names[U] = 'U'
 quarter_twists_names[Ui] = 'Ui'
 
+###################################################
+### Ranking positions
+###################################################
+"""
+The quarter twists never move cubie 7, so a position reachable from I is
+described by the cubie at each of the locations 0 to 6 and its orientation:
+the index (0, 1 or 2) among the cubie's faces of the face that sits on the
+location's first (front or back) face. The orientations of the 8 cubies
+always add up to a multiple of 3, so the seventh one follows from the others.
+
+position_rank numbers these 7! * 3**6 positions from 0, as
+    permutation_rank * ORIENTATION_COUNT + orientation_rank
+where permutation_rank is the Lehmer rank of the cubies at locations 0 to 6,
+and orientation_rank has the orientations at locations 0 to 5 as its base-3
+digits (location 0 is the least significant).
+"""
+CUBIE_COUNT = 7
+PERMUTATION_COUNT = 5040
+ORIENTATION_COUNT = 3**6
+POSITION_COUNT = PERMUTATION_COUNT * ORIENTATION_COUNT
+
+def position_cubies(position):
+    """
+    Return (cubies, orientations) for a position, as lists with an entry
+    for each of the locations 0 to 6, or None if the position can't be
+    reached from I.
+    """
+    if tuple(position[21:24]) != (bdr, drb, rbd):
+        return None
+    cubies = []
+    orientations = []
+    for location in xrange(CUBIE_COUNT):
+        face = position[3 * location]
+        cubie, orientation = divmod(face, 3)
+        for i in (1, 2):
+            if position[3 * location + i] != 3 * cubie + (orientation + i) % 3:
+                return None
+        cubies.append(cubie)
+        orientations.append(orientation)
+    if sorted(cubies) != range(CUBIE_COUNT) or sum(orientations) % 3 != 0:
+        return None
+    return cubies, orientations
+
+def permutation_rank(cubies):
+    """
+    Return the Lehmer rank of a permutation of 0, 1, ..., n-1.
+    """
+    rank = 0
+    for i in xrange(len(cubies)):
+        smaller = 0
+        for j in xrange(i + 1, len(cubies)):
+            if cubies[j] < cubies[i]:
+                smaller += 1
+        rank = rank * (len(cubies) - i) + smaller
+    return rank
+
+def permutation_from_rank(rank, n=CUBIE_COUNT):
+    """
+    Return the permutation of 0, 1, ..., n-1 with the given Lehmer rank.
+    """
+    digits = []
+    for base in xrange(1, n + 1):
+        rank, digit = divmod(rank, base)
+        digits.append(digit)
+    digits.reverse()
+    remaining = range(n)
+    return [remaining.pop(digit) for digit in digits]
+
+def orientation_rank(orientations):
+    """
+    Return the rank of the orientations at locations 0 to 5.
+    """
+    rank = 0
+    for orientation in reversed(orientations[:CUBIE_COUNT - 1]):
+        rank = rank * 3 + orientation
+    return rank
+
+def orientations_from_rank(rank):
+    """
+    Return the orientations at locations 0 to 6 with the given rank.
+    """
+    orientations = []
+    for location in xrange(CUBIE_COUNT - 1):
+        rank, orientation = divmod(rank, 3)
+        orientations.append(orientation)
+    orientations.append(-sum(orientations) % 3)
+    return orientations
+
+def position_rank(position):
+    """
+    Return the rank of a position, or None if it can't be reached from I.
+    """
+    cubies = position_cubies(position)
+    if cubies is None:
+        return None
+    return (permutation_rank(cubies[0]) * ORIENTATION_COUNT +
+            orientation_rank(cubies[1]))
+
+def position_from_rank(rank):
+    """
+    Return the position with the given rank.
+    """
+    permutation, orientation = divmod(rank, ORIENTATION_COUNT)
+    position = list(I)
+    for location, (cubie, twist) in enumerate(
+            zip(permutation_from_rank(permutation),
+                orientations_from_rank(orientation))):
+        for i in xrange(3):
+            position[3 * location + i] = 3 * cubie + (twist + i) % 3
+    return tuple(position)
+
+_rank_move_tables = None
+
+def rank_move_tables():
+    """
+    Return (permutation_tables, orientation_tables), with a table for each
+    move in quarter_twists, so that applying move number m to the position
+    with rank permutation * ORIENTATION_COUNT + orientation gives the rank
+        permutation_tables[m][permutation] * ORIENTATION_COUNT +
+        orientation_tables[m][orientation]
+    The tables are built on the first call.
+    """
+    global _rank_move_tables
+    if _rank_move_tables is None:
+        permutations = [permutation_from_rank(rank)
+                        for rank in xrange(PERMUTATION_COUNT)]
+        orientations = [orientations_from_rank(rank)
+                        for rank in xrange(ORIENTATION_COUNT)]
+        permutation_tables = []
+        orientation_tables = []
+        for move in quarter_twists:
+            # The cubie moving to each location, and the twist it gets.
+            sources = [move[3 * location] // 3
+                       for location in xrange(CUBIE_COUNT)]
+            twists = [move[3 * location] % 3
+                      for location in xrange(CUBIE_COUNT)]
+            permutation_tables.append(
+                [permutation_rank([cubies[source] for source in sources])
+                 for cubies in permutations])
+            orientation_tables.append(
+                [orientation_rank([(twists[i] + twist[sources[i]]) % 3
+                                   for i in xrange(CUBIE_COUNT - 1)])
+                 for twist in orientations])
+        _rank_move_tables = (permutation_tables, orientation_tables)
+    return _rank_move_tables
+
+###################################################
+### Packed positions
+###################################################
+"""
+The packed engine stores a position as its rank (an int, see position_rank)
+and applies a twist with rank_move_tables instead of building a 24-tuple.
+Its moves are the indexes of the quarter twists, so packed_twists[i] is the
+packed form of quarter_twists[i], and packed_inverse(i) is the index of the
+inverse twist.
+"""
+packed_twists = tuple(xrange(len(quarter_twists)))
+
+packed_twists_names = dict((move, quarter_twists_names[quarter_twists[move]])
+                           for move in packed_twists)
+
+def pack(position):
+    """
+    Return the packed form of a position, or None if it can't be reached
+    from I.
+    """
+    return position_rank(position)
+
+def unpack(state):
+    """
+    Return the position (a 24-tuple) of a packed state.
+    """
+    return position_from_rank(state)
+
+def packed_apply(move, state):
+    """
+    Apply the packed twist move to the packed state.
+    """
+    permutation_tables, orientation_tables = rank_move_tables()
+    permutation, orientation = divmod(state, ORIENTATION_COUNT)
+    return (permutation_tables[move][permutation] * ORIENTATION_COUNT +
+            orientation_tables[move][orientation])
+
+def packed_inverse(move):
+    """
+    Return the packed twist that undoes move.
+    """
+    # quarter_twists alternates twists and their inverses.
+    return move ^ 1
+
 def input_configuration():
     """
     Prompts a user to input the current configuration of the cube, and
@@ -1,5 +1,25 @@
+import multiprocessing
+import os
+from array import array
+
 import rubik
 
+# The DistanceTable that shortest_path uses, if any; see use_distance_table.
+distance_table = None
+
+# 'tuple' searches 24-tuple positions with rubik.perm_apply; 'packed'
+# searches packed positions with rubik.packed_apply (see packed_shortest_path).
+engine = os.environ.get('RUBIK_ENGINE', 'tuple')
+
+# Worker processes used by the packed engine to expand large BFS layers.
+processes = int(os.environ.get('PROCESSES', 1))
+
+# The packed engine expands layers with fewer positions in this process.
+PARALLEL_THRESHOLD = 20000
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'rubik_distances.bin')
+
 def shortest_path(start, end):
     """
     Using 2-way BFS, finds the shortest path from start_position to
@@ -7,7 +27,13 @@ def shortest_path(start, end):
 
     You can use the rubik.quarter_twists move set.
     Each move can be applied using rubik.perm_apply
+
+    If a distance table is in use, the path is read from it instead.
     """
+    if distance_table is not None:
+        return distance_table.shortest_path(start, end)
+    if engine == 'packed':
+        return packed_shortest_path(start, end, processes)
 
     moves = rubik.quarter_twists
 
@@ -69,4 +95,252 @@ def get_moves(parentS, parentE, position):
     
     return start_moves + end_moves
 
-    
+class DistanceTable(object):
+    """
+    The distance from every position to rubik.I, and a move towards it.
+
+    The table is found by a single BFS from rubik.I over position ranks (see
+    rubik.position_rank), and holds a byte for each rank:
+        distance << 3 | move
+    where move is the index in rubik.quarter_twists of a move that takes the
+    position one step closer to rubik.I. Positions that haven't been reached
+    hold UNREACHED. A shortest path is found by following the moves, with
+    one table lookup per move.
+    """
+    UNREACHED = 0xff
+    NO_MOVE = 7
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    @staticmethod
+    def build():
+        """
+        Runs the BFS from rubik.I and returns the table.
+        """
+        permutation_tables, orientation_tables = rubik.rank_move_tables()
+        orientation_count = rubik.ORIENTATION_COUNT
+        entries = bytearray([DistanceTable.UNREACHED]) * rubik.POSITION_COUNT
+        solved = rubik.position_rank(rubik.I)
+        entries[solved] = DistanceTable.NO_MOVE
+        frontier = [solved]
+        distance = 0
+        while frontier:
+            distance += 1
+            next_frontier = []
+            for move in xrange(len(rubik.quarter_twists)):
+                permutation_table = permutation_tables[move]
+                orientation_table = orientation_tables[move]
+                entry = distance << 3 | rubik.packed_inverse(move)
+                for rank in frontier:
+                    permutation, orientation = divmod(rank, orientation_count)
+                    next_rank = (permutation_table[permutation] *
+                                 orientation_count +
+                                 orientation_table[orientation])
+                    if entries[next_rank] == DistanceTable.UNREACHED:
+                        entries[next_rank] = entry
+                        next_frontier.append(next_rank)
+            frontier = next_frontier
+        return DistanceTable(entries)
+
+    @staticmethod
+    def load(filename):
+        """
+        Reads a table written by save, or returns None if the file is
+        missing or has the wrong size.
+        """
+        try:
+            with open(filename, 'rb') as table_file:
+                entries = bytearray(table_file.read())
+        except IOError:
+            return None
+        if len(entries) != rubik.POSITION_COUNT:
+            return None
+        return DistanceTable(entries)
+
+    def save(self, filename):
+        with open(filename, 'wb') as table_file:
+            table_file.write(self.entries)
+
+    def distance(self, position):
+        """
+        The number of moves from position to rubik.I, or None if there is
+        no path.
+        """
+        rank = rubik.position_rank(position)
+        if rank is None or self.entries[rank] == self.UNREACHED:
+            return None
+        return self.entries[rank] >> 3
+
+    def solve(self, position):
+        """
+        Returns a shortest list of moves from position to rubik.I, or None
+        if there is no path.
+        """
+        rank = rubik.position_rank(position)
+        if rank is None:
+            return None
+        permutation_tables, orientation_tables = rubik.rank_move_tables()
+        moves = []
+        while True:
+            entry = self.entries[rank]
+            if entry == self.UNREACHED:
+                return None
+            if entry >> 3 == 0:
+                return moves
+            move = entry & 7
+            moves.append(rubik.quarter_twists[move])
+            permutation, orientation = divmod(rank, rubik.ORIENTATION_COUNT)
+            rank = (permutation_tables[move][permutation] *
+                    rubik.ORIENTATION_COUNT +
+                    orientation_tables[move][orientation])
+
+    def shortest_path(self, start, end):
+        """
+        Returns a shortest list of moves from start to end, or None if
+        there is no path.
+
+        Relabeling the faces so that end becomes rubik.I commutes with the
+        moves, so the path from start to end is the path from the relabeled
+        start to rubik.I.
+        """
+        labels = rubik.perm_inverse(end)
+        return self.solve(tuple([labels[face] for face in start]))
+
+def use_distance_table(filename=TABLE_FILE):
+    """
+    Makes shortest_path use a DistanceTable, loaded from filename, or built
+    and saved there if the file doesn't exist. Returns the table.
+    """
+    global distance_table
+    table = DistanceTable.load(filename)
+    if table is None:
+        table = DistanceTable.build()
+        table.save(filename)
+    distance_table = table
+    return table
+
+def expand_states(states):
+    """
+    Applies every packed twist to each packed state. Returns three parallel
+    arrays (next_states, previous_states, moves), with one entry for each
+    distinct next state.
+    """
+    permutation_tables, orientation_tables = rubik.rank_move_tables()
+    orientation_count = rubik.ORIENTATION_COUNT
+    parents = {}
+    for move in rubik.packed_twists:
+        permutation_table = permutation_tables[move]
+        orientation_table = orientation_tables[move]
+        for state in states:
+            permutation, orientation = divmod(state, orientation_count)
+            next_state = (permutation_table[permutation] * orientation_count +
+                          orientation_table[orientation])
+            if next_state not in parents:
+                parents[next_state] = (state, move)
+    next_states = array('l', parents.keys())
+    previous_states = array('l')
+    moves = bytearray()
+    for next_state in next_states:
+        state, move = parents[next_state]
+        previous_states.append(state)
+        moves.append(move)
+    return next_states, previous_states, moves
+
+def expand_layer(frontier, parents, pool=None, processes=1):
+    """
+    Expands one BFS layer. The states reached from frontier that aren't in
+    parents yet are added to parents, mapped to (previous state, move), and
+    returned as the next frontier.
+
+    With a multiprocessing pool of the given number of processes, the
+    frontier is split into slices that are expanded by the workers, and
+    their results are merged here.
+    """
+    next_frontier = []
+    if pool is None:
+        permutation_tables, orientation_tables = rubik.rank_move_tables()
+        orientation_count = rubik.ORIENTATION_COUNT
+        for move in rubik.packed_twists:
+            permutation_table = permutation_tables[move]
+            orientation_table = orientation_tables[move]
+            for state in frontier:
+                permutation, orientation = divmod(state, orientation_count)
+                next_state = (permutation_table[permutation] *
+                              orientation_count +
+                              orientation_table[orientation])
+                if next_state not in parents:
+                    parents[next_state] = (state, move)
+                    next_frontier.append(next_state)
+        return next_frontier
+
+    # A few slices per worker even out their loads.
+    slice_size = -(-len(frontier) // (4 * processes))
+    results = pool.map(expand_states,
+                       [frontier[i:i + slice_size]
+                        for i in xrange(0, len(frontier), slice_size)])
+    for next_states, previous_states, moves in results:
+        for i in xrange(len(next_states)):
+            next_state = next_states[i]
+            if next_state not in parents:
+                parents[next_state] = (previous_states[i], moves[i])
+                next_frontier.append(next_state)
+    return next_frontier
+
+def packed_shortest_path(start, end, processes=1):
+    """
+    Finds the shortest path from start to end like shortest_path, with a
+    level-synchronous two-way BFS over packed positions. Returns a list of
+    moves from rubik.quarter_twists, or None if there is no path.
+
+    The faces are relabeled so that end becomes rubik.I, which doesn't
+    change the path (see DistanceTable.shortest_path). Layers of at least
+    PARALLEL_THRESHOLD positions are expanded by that many worker processes.
+    """
+    labels = rubik.perm_inverse(end)
+    start_state = rubik.pack(tuple([labels[face] for face in start]))
+    if start_state is None:
+        return None
+    end_state = rubik.pack(rubik.I)
+    rubik.rank_move_tables()  # Build them once, before forking workers.
+
+    parentS = {start_state: None}
+    parentE = {end_state: None}
+    frontiers = [[start_state], [end_state]]
+    pool = None
+    try:
+        meeting = start_state if start_state == end_state else None
+        for i in xrange(14):
+            if meeting is not None:
+                break
+            # Expands the smaller side; the two sides' depths add up to i.
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            parents, others = ((parentS, parentE) if side == 0
+                               else (parentE, parentS))
+            if (pool is None and processes > 1 and
+                    len(frontiers[side]) >= PARALLEL_THRESHOLD):
+                pool = multiprocessing.Pool(processes)
+            frontiers[side] = expand_layer(frontiers[side], parents, pool,
+                                           processes)
+            for state in frontiers[side]:
+                if state in others:
+                    meeting = state
+                    break
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    if meeting is None:
+        return None
+
+    moves = []
+    state = meeting
+    while parentS[state] is not None:
+        state, move = parentS[state]
+        moves.append(rubik.quarter_twists[move])
+    moves.reverse()
+    state = meeting
+    while parentE[state] is not None:
+        state, move = parentE[state]
+        moves.append(rubik.quarter_twists[rubik.packed_inverse(move)])
+    return moves
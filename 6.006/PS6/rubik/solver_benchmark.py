@@ -0,0 +1,112 @@
+#!/usr/bin/python
+"""
+Benchmark for the Rubik's cube solvers.
+
+Reports the time taken to build, save and load the DistanceTable, and the
+per-query time of the two-way BFS with the tuple and packed engines and of
+the table on random scrambles of each depth.
+
+Usage:
+    python solver_benchmark.py [--depths 1-14] [--queries 10] [--table FILE]
+                               [--processes 1]
+"""
+import optparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import rubik
+import solver
+
+def scramble(depth, rng):
+    """
+    Returns the position reached from rubik.I by depth random quarter
+    twists.
+    """
+    position = rubik.I
+    for i in xrange(depth):
+        position = rubik.perm_apply(rng.choice(rubik.quarter_twists), position)
+    return position
+
+def time_queries(positions, table=None, engine='tuple', processes=1):
+    """
+    Solves each position with shortest_path, using a distance table or an
+    engine, and returns the average time per query and the path lengths.
+    """
+    old_settings = (solver.distance_table, solver.engine, solver.processes)
+    solver.distance_table = table
+    solver.engine = engine
+    solver.processes = processes
+    try:
+        lengths = []
+        start = time.time()
+        for position in positions:
+            lengths.append(len(solver.shortest_path(position, rubik.I)))
+        seconds = time.time() - start
+    finally:
+        solver.distance_table, solver.engine, solver.processes = old_settings
+    return seconds / len(positions), lengths
+
+def parse_depths(text):
+    first, last = text.split('-') if '-' in text else (text, text)
+    return range(int(first), int(last) + 1)
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option('--depths', default='1-14',
+                      help='range of scramble depths')
+    parser.add_option('--queries', type='int', default=10,
+                      help='number of scrambles of each depth')
+    parser.add_option('--table', default=None,
+                      help='load the table from FILE instead of building it')
+    parser.add_option('--processes', type='int', default=1,
+                      help='worker processes for the packed engine')
+    options, _ = parser.parse_args(argv)
+
+    if options.table:
+        start = time.time()
+        table = solver.DistanceTable.load(options.table)
+        print 'Loaded the table in %.3fs' % (time.time() - start)
+    else:
+        start = time.time()
+        table = solver.DistanceTable.build()
+        print 'Built the table in %.3fs' % (time.time() - start)
+        table_file, filename = tempfile.mkstemp()
+        os.close(table_file)
+        try:
+            start = time.time()
+            table.save(filename)
+            print 'Saved the table in %.3fs' % (time.time() - start)
+            start = time.time()
+            solver.DistanceTable.load(filename)
+            print 'Loaded the table in %.3fs' % (time.time() - start)
+        finally:
+            os.remove(filename)
+
+    rng = random.Random(6006)
+    rubik.rank_move_tables()  # Don't count building them in the first query.
+    solvers = [('tuple', {}), ('packed', {'engine': 'packed'})]
+    if options.processes > 1:
+        solvers.append(('packed x%d' % options.processes,
+                        {'engine': 'packed', 'processes': options.processes}))
+    solvers.append(('table', {'table': table}))
+    print '%6s %8s' % ('depth', 'moves'),
+    print ' '.join('%14s' % name for name, settings in solvers), '(ms/query)'
+    for depth in parse_depths(options.depths):
+        positions = [scramble(depth, rng) for i in xrange(options.queries)]
+        times = []
+        lengths = None
+        for name, settings in solvers:
+            seconds, solver_lengths = time_queries(positions, **settings)
+            if lengths is not None and solver_lengths != lengths:
+                raise RuntimeError('%s disagrees at depth %d' % (name, depth))
+            lengths = solver_lengths
+            times.append(seconds)
+        print '%6d %8.1f' % (depth, sum(lengths) / float(len(lengths))),
+        print ' '.join('%14.3f' % (seconds * 1000) for seconds in times)
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
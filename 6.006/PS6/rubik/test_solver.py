@@ -2,6 +2,7 @@
 import unittest
 import solver
 import rubik
+import random
 import sys
 
 class TestSolver(unittest.TestCase):
@@ -71,6 +72,84 @@ class TestSolver(unittest.TestCase):
             current = rubik.perm_apply(move, current)
         self.assertEqual(current, end)
 
+class TestDistanceTable(TestSolver):
+    """Runs the TestSolver tests with a distance table."""
+    table = None
+
+    def setUp(self):
+        if TestDistanceTable.table is None:
+            TestDistanceTable.table = solver.DistanceTable.build()
+        solver.distance_table = TestDistanceTable.table
+
+    def tearDown(self):
+        solver.distance_table = None
+
+    def testRanks(self):
+        rng = random.Random(6006)
+        permutation_tables, orientation_tables = rubik.rank_move_tables()
+        for i in range(100):
+            position = rubik.I
+            for j in range(rng.randrange(20)):
+                position = rubik.perm_apply(rng.choice(rubik.quarter_twists),
+                                            position)
+            rank = rubik.position_rank(position)
+            self.assertEqual(position, rubik.position_from_rank(rank))
+            permutation, orientation = divmod(rank, rubik.ORIENTATION_COUNT)
+            for m, move in enumerate(rubik.quarter_twists):
+                self.assertEqual(
+                    rubik.position_rank(rubik.perm_apply(move, position)),
+                    permutation_tables[m][permutation] *
+                    rubik.ORIENTATION_COUNT + orientation_tables[m][orientation])
+
+    def testTable(self):
+        entries = self.table.entries
+        self.assertEqual(rubik.POSITION_COUNT, len(entries))
+        self.assertFalse(solver.DistanceTable.UNREACHED in entries)
+        self.assertEqual(276, sum(1 for entry in entries if entry >> 3 == 14))
+        rng = random.Random(6006)
+        for i in range(5):
+            start = rubik.position_from_rank(rng.randrange(len(entries)))
+            end = rubik.position_from_rank(rng.randrange(len(entries)))
+            path = solver.shortest_path(start, end)
+            self.assertGoodPath(start, end, path)
+            solver.distance_table = None
+            self.assertEqual(len(solver.shortest_path(start, end)), len(path))
+
+class TestPackedEngine(TestSolver):
+    """Runs the TestSolver tests with the packed engine."""
+    def setUp(self):
+        solver.engine = 'packed'
+
+    def tearDown(self):
+        solver.engine = 'tuple'
+
+    def testPackedApply(self):
+        position = rubik.perm_apply(rubik.L, rubik.perm_apply(rubik.F, rubik.I))
+        state = rubik.pack(position)
+        self.assertEqual(position, rubik.unpack(state))
+        for move in rubik.packed_twists:
+            twist = rubik.quarter_twists[move]
+            self.assertEqual(rubik.pack(rubik.perm_apply(twist, position)),
+                             rubik.packed_apply(move, state))
+            self.assertEqual(state, rubik.packed_apply(
+                rubik.packed_inverse(move), rubik.packed_apply(move, state)))
+            self.assertEqual(rubik.quarter_twists_names[twist],
+                             rubik.packed_twists_names[move])
+
+    def testParallel(self):
+        start = (6, 7, 8, 20, 18, 19, 3, 4, 5, 16, 17, 15, 0, 1, 2, 14, 12, 13, 10, 11, 9, 21, 22, 23)
+        threshold = solver.PARALLEL_THRESHOLD
+        solver.PARALLEL_THRESHOLD = 100
+        try:
+            ans = solver.packed_shortest_path(start, rubik.I, 2)
+        finally:
+            solver.PARALLEL_THRESHOLD = threshold
+        self.assertEqual(len(ans), 14)
+        self.assertGoodPath(start, rubik.I, ans)
+
 if __name__ == '__main__':
-    suite = unittest.TestLoader().loadTestsFromTestCase(TestSolver)
+    suite = unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(TestSolver),
+        unittest.TestLoader().loadTestsFromTestCase(TestDistanceTable),
+        unittest.TestLoader().loadTestsFromTestCase(TestPackedEngine)])
     unittest.TextTestRunner(verbosity=2).run(suite)
@@ -5,6 +5,14 @@
 # This file defines additional pocket cube abstraction based on rubik.py.
 # It also provides interface to the solver.
 
+import os
+import sys
+
+# With RUBIK_ENGINE set, solve with the rubik.py and solver.py of the parent
+# directory (and the engine they select) instead of the ones here.
+if 'RUBIK_ENGINE' in os.environ:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    os.pardir))
 
 from rubik import *
 import solver
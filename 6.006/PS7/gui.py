@@ -1,6 +1,16 @@
 import os
 import Tkinter, tkFileDialog
-from resizeable_image import ResizeableImage
+from resizeable_image import ResizeableImage, ArrayResizeableImage, \
+    IncrementalResizeableImage
+
+# SEAM_ENGINE=array carves with the NumPy implementation, and
+# SEAM_ENGINE=incremental also keeps the energies and DP table between seams.
+if os.environ.get('SEAM_ENGINE') == 'array':
+    image_class = ArrayResizeableImage
+elif os.environ.get('SEAM_ENGINE') == 'incremental':
+    image_class = IncrementalResizeableImage
+else:
+    image_class = ResizeableImage
 
 seam = None
 image = None
@@ -13,7 +23,7 @@ def open_file():
     status['text'] = 'Loading %s...' % os.path.basename(filename)
     status.update()
     try:
-        image = ResizeableImage(filename)
+        image = image_class(filename)
     except:
         status['text'] = 'Error loading %s!' % os.path.basename(filename)
         raise
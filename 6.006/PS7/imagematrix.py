@@ -8,9 +8,17 @@ except:
     print 'You do not have PIL (the Python Imaging Library) installed.'
     sys.exit(1)
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class SeamError(Exception):
     pass
 
+# Energy of the pixels on the image's edge.
+EDGE_ENERGY = 10000
+
 class ImageMatrix(dict):
     def __init__(self, image):
         """Takes either a PIL image, or a filename of an image. Stores
@@ -93,7 +101,7 @@ class ImageMatrix(dict):
         with removing that pixel."""
         if i==0 or j==0 or i==self.width-1 or j==self.height-1:
             # For simplicity, return an arbitrarily large value on the edge.
-            return 10000
+            return EDGE_ENERGY
         else: # I think this is equivalent to the Sobel gradient magnitude.
             return self.distance(self[i-1,j], self[i+1,j]) +\
                    self.distance(self[i,j-1], self[i,j+1]) +\
@@ -108,3 +116,154 @@ class ImageMatrix(dict):
             valueB = pixelB[i]
             ans += abs(valueA-valueB)
         return ans
+
+class ArrayImage(object):
+    """An image stored as a NumPy array of shape (height, width, 3), with
+    the same interface as ImageMatrix. Pixel (i,j) is pixels[j,i].
+
+    The energies of all the pixels are computed at once by energy_map, and
+    remove_seam compacts the array with a mask instead of shifting pixels
+    one at a time."""
+
+    def __init__(self, image):
+        """Takes a PIL image, a filename of an image, an ImageMatrix, or an
+        array of RGB pixels with shape (height, width, 3)."""
+        if numpy is None:
+            raise ImportError('ArrayImage needs NumPy')
+        if isinstance(image, ImageMatrix):
+            image = image.image()
+        if isinstance(image, numpy.ndarray):
+            self.pixels = numpy.array(image, dtype=numpy.uint8)
+        else:
+            if not isinstance(image, Image.Image):
+                image = Image.open(image)
+            image = image.convert('RGB')
+            width, height = image.size
+            if hasattr(image, 'tobytes'):
+                data = image.tobytes()
+            else:
+                data = image.tostring()
+            self.pixels = numpy.frombuffer(data, dtype=numpy.uint8).reshape(
+                (height, width, 3)).copy()
+        self.height, self.width = self.pixels.shape[:2]
+
+    def __getitem__(self, coordinates):
+        i, j = coordinates
+        return tuple(int(value) for value in self.pixels[j, i])
+
+    def __setitem__(self, coordinates, color):
+        i, j = coordinates
+        self.pixels[j, i] = color
+
+    def color_seam(self, seam, color=(255,0,0)):
+        """Takes a seam (a list of coordinates) and colors it all one
+        color."""
+        columns, rows = self._seam_columns(seam, False)
+        self.pixels[rows, columns] = color
+
+    def remove_seam(self, seam):
+        """Takes a seam (a list of coordinates with exactly one pair of
+        coordinates per row). Removes pixel at each of those coordinates,
+        and slides left all the pixels to its right. Decreases the width
+        by 1."""
+        columns, rows = self._seam_columns(seam, True)
+        keep = numpy.ones((self.height, self.width), dtype=bool)
+        keep[rows, columns] = False
+        self._compact_pixels(keep)
+
+    def _compact_pixels(self, keep):
+        # Keeps the pixels where keep is true, which must be all but one in
+        # each row. Viewing each pixel as one 3-byte item makes this much
+        # faster than masking the (height, width, 3) array.
+        pixels = numpy.ascontiguousarray(self.pixels)
+        pixels = pixels.view(numpy.dtype((numpy.void, 3)))[:, :, 0][keep]
+        self.width -= 1
+        self.pixels = pixels.view(numpy.uint8).reshape(
+            (self.height, self.width, 3))
+
+    def _seam_columns(self, seam, check_rows):
+        # Returns the seam's column and row coordinates as two arrays. If
+        # check_rows is true, raises SeamError unless the seam has exactly
+        # one pixel in each row, like ImageMatrix.remove_seam.
+        coordinates = numpy.array(seam, dtype=numpy.intp).reshape((-1, 2))
+        columns, rows = coordinates[:, 0], coordinates[:, 1]
+        if check_rows:
+            outside = (rows < 0) | (rows >= self.height)
+            if outside.any():
+                raise SeamError('seam has nonexistent row %d' %
+                                columns[outside][0])
+            counts = numpy.bincount(rows, minlength=self.height)
+            if (counts > 1).any():
+                raise SeamError('seam has repeated row %d' %
+                                columns[counts[rows] > 1][0])
+            missed = numpy.nonzero(counts == 0)[0]
+            if len(missed):
+                raise SeamError('seam missed rows %s' %
+                                ','.join(map(str, missed)))
+        return columns, rows
+
+    def image(self):
+        """Returns a PIL Image that is represented by self."""
+        if hasattr(Image, 'frombytes'):
+            return Image.frombytes('RGB', (self.width, self.height),
+                                   self.pixels.tobytes())
+        return Image.fromstring('RGB', (self.width, self.height),
+                                self.pixels.tostring())
+
+    def save(self,*args,**keyw):
+        self.image().save(*args,**keyw)
+
+    def ppm(self):
+        """Returns self in (binary) ppm form."""
+        return 'P6 %d %d 255\n' % (self.width, self.height) + \
+            self.pixels.tostring()
+
+    save_ppm = ImageMatrix.save_ppm.im_func
+    show = ImageMatrix.show.im_func
+
+    def energy_map(self):
+        """Returns an array with the energy of pixel (i,j) at [j,i], as
+        computed by ImageMatrix.energy."""
+        pixels = self.pixels.astype(numpy.int32)
+        energies = numpy.empty((self.height, self.width), dtype=numpy.int64)
+        energies.fill(EDGE_ENERGY)
+        if self.width > 2 and self.height > 2:
+            def distances(a, b):
+                return numpy.abs(a - b).sum(axis=2)
+            # Each term compares the pixels on opposite sides of (i,j).
+            energies[1:-1, 1:-1] = (
+                distances(pixels[1:-1, :-2], pixels[1:-1, 2:]) +
+                distances(pixels[:-2, 1:-1], pixels[2:, 1:-1]) +
+                distances(pixels[:-2, :-2], pixels[2:, 2:]) +
+                distances(pixels[:-2, 2:], pixels[2:, :-2]))
+        return energies
+
+    def energies_at(self, rows, columns):
+        """Returns an array with the energies of the pixels (columns[k],
+        rows[k]), as computed by ImageMatrix.energy."""
+        energies = numpy.empty(len(rows), dtype=numpy.int64)
+        energies.fill(EDGE_ENERGY)
+        inside = ((rows > 0) & (rows < self.height - 1) &
+                  (columns > 0) & (columns < self.width - 1))
+        rows, columns = rows[inside], columns[inside]
+        def distances(rows_a, columns_a, rows_b, columns_b):
+            a = self.pixels[rows_a, columns_a].astype(numpy.int32)
+            b = self.pixels[rows_b, columns_b].astype(numpy.int32)
+            return numpy.abs(a - b).sum(axis=1)
+        energies[inside] = (
+            distances(rows, columns - 1, rows, columns + 1) +
+            distances(rows - 1, columns, rows + 1, columns) +
+            distances(rows - 1, columns - 1, rows + 1, columns + 1) +
+            distances(rows - 1, columns + 1, rows + 1, columns - 1))
+        return energies
+
+    def energy(self, i, j):
+        """Given coordinates (i,j), returns an energy, or cost associated
+        with removing that pixel."""
+        if i==0 or j==0 or i==self.width-1 or j==self.height-1:
+            return EDGE_ENERGY
+        pixels = self.pixels[j-1:j+2, i-1:i+2].astype(numpy.int32)
+        return int(numpy.abs(pixels[1, 0] - pixels[1, 2]).sum() +
+                   numpy.abs(pixels[0, 1] - pixels[2, 1]).sum() +
+                   numpy.abs(pixels[0, 0] - pixels[2, 2]).sum() +
+                   numpy.abs(pixels[0, 2] - pixels[2, 0]).sum())
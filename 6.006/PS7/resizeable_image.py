@@ -40,3 +40,150 @@ class ResizeableImage(imagematrix.ImageMatrix):
 
     def remove_best_seam(self):
         self.remove_seam(self.best_seam())
+
+class ArrayResizeableImage(imagematrix.ArrayImage):
+    """A ResizeableImage stored in a NumPy array. best_seam computes the
+    energies with energy_map and fills the DP table a row at a time, and
+    finds the same seams as ResizeableImage.best_seam."""
+
+    def best_seam(self):
+        numpy = imagematrix.numpy
+        energies = self.energy_map()
+        # cost[j,i] is the energy of the cheapest seam from the top row to
+        # pixel (i,j), and parent[j,i] is the column of its pixel in row j-1.
+        self.cost = numpy.empty((self.height, self.width), dtype=numpy.int64)
+        self.parent = numpy.empty((self.height, self.width), dtype=numpy.intp)
+        self.cost[0] = 0
+        for j in range(1, self.height):
+            self._update_row(j, 0, self.width - 1, energies)
+        return self.get_coordinates()
+
+    def _update_row(self, j, lo, hi, energies):
+        # Computes cost and parent for the pixels lo..hi of row j from the
+        # costs in row j-1.
+        numpy = imagematrix.numpy
+        start, end = max(lo - 1, 0), min(hi + 2, self.width)
+        above = numpy.empty(hi - lo + 3, dtype=numpy.int64)
+        above.fill(numpy.iinfo(numpy.int64).max)
+        above[start - lo + 1:end - lo + 1] = self.cost[j-1, start:end]
+        center, left, right = above[1:-1], above[:-2], above[2:]
+        minimum = numpy.minimum(numpy.minimum(left, center), right)
+        columns = numpy.arange(lo, hi + 1)
+        # Like ResizeableImage, prefers the right, then the left parent.
+        self.parent[j, lo:hi+1] = numpy.where(
+            right == minimum, columns + 1,
+            numpy.where(left == minimum, columns - 1, columns))
+        self.cost[j, lo:hi+1] = minimum + energies[j, lo:hi+1]
+
+    def get_coordinates(self):
+        i = int(self.cost[-1].argmin())
+        coordinates = [(i, self.height - 1)]
+        for j in range(self.height - 1, 0, -1):
+            i = int(self.parent[j, i])
+            coordinates.append((i, j - 1))
+        coordinates.reverse()
+        return coordinates
+
+    def remove_best_seam(self):
+        self.remove_seam(self.best_seam())
+
+class IncrementalResizeableImage(ArrayResizeableImage):
+    """An ArrayResizeableImage that keeps its energies and DP table between
+    seams, and finds the same seams.
+
+    Removing a seam only changes the energies of the pixels next to it, so
+    remove_seam recomputes those, and then the DP table from the top row
+    down, but only in the cone of pixels whose costs can have changed: the
+    seam's neighborhood in each row, widened by one pixel on each side of
+    the pixels whose costs changed in the row above. Changing pixels in any
+    other way makes the next best_seam start over."""
+
+    def __init__(self, image):
+        ArrayResizeableImage.__init__(self, image)
+        self._energies = None
+        self._cost_valid = False
+
+    def __setitem__(self, coordinates, color):
+        self._energies = None
+        self._cost_valid = False
+        ArrayResizeableImage.__setitem__(self, coordinates, color)
+
+    def color_seam(self, seam, color=(255,0,0)):
+        self._energies = None
+        self._cost_valid = False
+        ArrayResizeableImage.color_seam(self, seam, color)
+
+    def energy_map(self):
+        """Returns the cached energy map; callers must not modify it."""
+        if self._energies is None:
+            self._energies = ArrayResizeableImage.energy_map(self)
+        return self._energies
+
+    def best_seam(self):
+        if not self._cost_valid:
+            ArrayResizeableImage.best_seam(self)
+            self._cost_valid = True
+        return self.get_coordinates()
+
+    def remove_seam(self, seam):
+        numpy = imagematrix.numpy
+        columns, rows = self._seam_columns(seam, True)
+        keep = numpy.ones((self.height, self.width), dtype=bool)
+        keep[rows, columns] = False
+        self._compact_pixels(keep)
+        if self._energies is None and not self._cost_valid:
+            return
+
+        # In the new coordinates, only pixels lo[j]..hi[j] of row j can have
+        # different neighbors than before.
+        removed = numpy.empty(self.height, dtype=numpy.intp)
+        removed[rows] = columns
+        neighbors = numpy.concatenate(([removed[0]], removed, [removed[-1]]))
+        lo = numpy.minimum(numpy.minimum(neighbors[:-2], neighbors[1:-1]),
+                           neighbors[2:]) - 1
+        hi = numpy.maximum(numpy.maximum(neighbors[:-2], neighbors[1:-1]),
+                           neighbors[2:])
+        lo = lo.clip(0, self.width - 1)
+        hi = hi.clip(0, self.width - 1)
+
+        if self._energies is not None:
+            self._energies = self._energies[keep].reshape(
+                (self.height, self.width))
+            lengths = hi - lo + 1
+            band_rows = numpy.repeat(numpy.arange(self.height), lengths)
+            starts = numpy.cumsum(lengths) - lengths
+            band_columns = (lo[band_rows] + numpy.arange(len(band_rows)) -
+                            starts[band_rows])
+            self._energies[band_rows, band_columns] = self.energies_at(
+                band_rows, band_columns)
+
+        if self._cost_valid:
+            self.cost = self.cost[keep].reshape((self.height, self.width))
+            self.parent = self.parent[keep].reshape((self.height, self.width))
+            # Parents to the right of the removed pixel moved left.
+            self.parent[1:] -= self.parent[1:] > removed[:-1, numpy.newaxis]
+            energies = self.energy_map()
+            changed = None
+            for j in range(1, self.height):
+                row_lo, row_hi = lo[j], hi[j]
+                if changed is not None:
+                    row_lo = max(min(row_lo, changed[0] - 1), 0)
+                    row_hi = min(max(row_hi, changed[1] + 1), self.width - 1)
+                old_cost = self.cost[j, row_lo:row_hi+1].copy()
+                self._update_row(j, row_lo, row_hi, energies)
+                different = numpy.nonzero(
+                    self.cost[j, row_lo:row_hi+1] != old_cost)[0]
+                if len(different):
+                    changed = (row_lo + different[0], row_lo + different[-1])
+                else:
+                    changed = None
+
+    def remove_seams(self, count):
+        """Removes the count best seams one after another, and returns
+        them."""
+        seams = []
+        for k in range(count):
+            seam = self.best_seam()
+            self.remove_seam(seam)
+            seams.append(seam)
+        return seams
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Benchmark for the seam carving implementations.
+
+Removes seams from synthetic images of growing size with the array
+implementation (ArrayResizeableImage), with the incremental one
+(IncrementalResizeableImage.remove_seams) and, on the smaller images, with
+the dict implementation (ResizeableImage), checks that they remove the same
+seams, and reports the seconds taken per removed seam.
+
+Usage:
+    python seam_benchmark.py [--sizes 100x100,1000x1000] [--seams 3]
+                             [--reference-pixels 100000]
+"""
+import optparse
+import random
+import sys
+import time
+
+from PIL import Image
+import imagematrix
+from resizeable_image import ResizeableImage, ArrayResizeableImage, \
+    IncrementalResizeableImage
+
+def synthetic_pixels(width, height, seed=6006):
+    """Returns a (height, width, 3) array of smooth color gradients with
+    some noise, so that seams have something to avoid."""
+    numpy = imagematrix.numpy
+    rng = numpy.random.RandomState(seed)
+    rows = numpy.linspace(0, 255, height)[:, numpy.newaxis]
+    columns = numpy.linspace(0, 255, width)[numpy.newaxis, :]
+    pixels = numpy.empty((height, width, 3))
+    pixels[:, :, 0] = rows
+    pixels[:, :, 1] = columns
+    pixels[:, :, 2] = (rows + columns) / 2
+    pixels += rng.randint(-20, 21, size=pixels.shape)
+    return pixels.clip(0, 255).astype(numpy.uint8)
+
+def time_seams(image, seams):
+    """Removes seams from image. Returns the seams and the seconds taken per
+    seam."""
+    removed = []
+    start = time.time()
+    for k in range(seams):
+        seam = image.best_seam()
+        image.remove_seam(seam)
+        removed.append(seam)
+    return removed, (time.time() - start) / seams
+
+def time_batch(image, seams):
+    """Removes seams from image in one remove_seams call. Returns the seams
+    and the seconds taken per seam."""
+    start = time.time()
+    removed = image.remove_seams(seams)
+    return removed, (time.time() - start) / seams
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option('--sizes',
+                      default='100x100,300x300,1000x1000,1920x1080,3840x2160',
+                      help='comma-separated WIDTHxHEIGHT image sizes')
+    parser.add_option('--seams', type='int', default=3,
+                      help='number of seams to remove from each image')
+    parser.add_option('--reference-pixels', type='int', default=100000,
+                      help='largest image to carve with ResizeableImage')
+    options, _ = parser.parse_args(argv)
+
+    print '%-12s %10s %14s %14s %14s %8s' % (
+        'size', 'pixels', 'dict s/seam', 'array s/seam', 'incr. s/seam',
+        'speedup')
+    for size in options.sizes.split(','):
+        width, height = map(int, size.split('x'))
+        pixels = synthetic_pixels(width, height)
+        seams, array_seconds = time_seams(ArrayResizeableImage(pixels),
+                                          options.seams)
+        incremental_seams, incremental_seconds = time_batch(
+            IncrementalResizeableImage(pixels), options.seams)
+        if incremental_seams != seams:
+            raise RuntimeError('The incremental implementation disagrees on ' +
+                               size)
+        dict_seconds = None
+        if width * height <= options.reference_pixels:
+            image = Image.new('RGB', (width, height))
+            image.putdata([tuple(pixel) for pixel in
+                           pixels.reshape((-1, 3)).tolist()])
+            reference_seams, dict_seconds = time_seams(ResizeableImage(image),
+                                                       options.seams)
+            if reference_seams != seams:
+                raise RuntimeError('The implementations disagree on ' + size)
+        print '%-12s %10d %14s %14.4f %14.4f %8.1f' % (
+            size, width * height,
+            '-' if dict_seconds is None else '%.3f' % dict_seconds,
+            array_seconds, incremental_seconds,
+            array_seconds / max(incremental_seconds, 1e-9))
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
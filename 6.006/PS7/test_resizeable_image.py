@@ -1,6 +1,10 @@
 import unittest
+import random
 import sys
-from resizeable_image import ResizeableImage
+import imagematrix
+from imagematrix import ArrayImage, ImageMatrix, SeamError
+from resizeable_image import ResizeableImage, ArrayResizeableImage, \
+     IncrementalResizeableImage
 
 class TestImage(unittest.TestCase):
     def test_small(self):
@@ -25,6 +29,141 @@ class TestImage(unittest.TestCase):
         # Make sure the energy of the seam matches what we expect.
         total = sum([image.energy(coord[0], coord[1]) for coord in seam])
         self.assertEqual(total, expected_cost)
-            
+
+def random_pixels(rng, width, height, palette):
+    """Returns a (height, width, 3) array of colors picked from palette."""
+    return imagematrix.numpy.array(
+        [[rng.choice(palette) for i in range(width)] for j in range(height)],
+        dtype=imagematrix.numpy.uint8).reshape((height, width, 3))
+
+# Palettes for random images; the small ones make many seams tie.
+PALETTES = [[(0, 0, 0)],
+            [(0, 0, 0), (255, 255, 255)],
+            [(10, 20, 30), (11, 20, 30), (10, 21, 30)],
+            [(r, g, b) for r in (0, 128, 255) for g in (0, 255) for b in (7,)]]
+
+def random_images(seed, count, max_width=9, max_height=9):
+    """Yields count random arrays of pixels, from 1x1 up to the given
+    size."""
+    rng = random.Random(seed)
+    for k in range(count):
+        yield random_pixels(rng, rng.randint(1, max_width),
+                            rng.randint(1, max_height), rng.choice(PALETTES))
+
+def pixel_list(image):
+    return [image[i, j] for j in range(image.height)
+            for i in range(image.width)]
+
+@unittest.skipIf(imagematrix.numpy is None, 'ArrayImage needs NumPy')
+class TestArrayImage(unittest.TestCase):
+    def assert_energies_match(self, pixels):
+        array_image = ArrayImage(pixels)
+        matrix = ImageMatrix(array_image.image())
+        energies = array_image.energy_map()
+        self.assertEqual((matrix.height, matrix.width), energies.shape)
+        for j in range(matrix.height):
+            for i in range(matrix.width):
+                self.assertEqual(matrix.energy(i, j), energies[j, i])
+                self.assertEqual(matrix.energy(i, j),
+                                 array_image.energy(i, j))
+
+    def test_energy_map(self):
+        self.assert_energies_match(ArrayImage('sunset_small.png').pixels)
+        for pixels in random_images(20, 100):
+            self.assert_energies_match(pixels)
+
+    def assert_seams_match(self, image, seams):
+        # Removes seams best seams from both implementations of image.
+        array_image = ArrayResizeableImage(image)
+        matrix = ResizeableImage(array_image.image())
+        for k in range(seams):
+            seam = matrix.best_seam()
+            self.assertEqual(seam, array_image.best_seam())
+            matrix.remove_seam(seam)
+            array_image.remove_seam(seam)
+            self.assertEqual(matrix.width, array_image.width)
+            self.assertEqual(pixel_list(matrix), pixel_list(array_image))
+
+    def test_seams_small(self):
+        self.assert_seams_match('sunset_small.png', 3)
+
+    def test_seams_random(self):
+        for pixels in random_images(2020, 200):
+            self.assert_seams_match(pixels, pixels.shape[1] - 1)
+
+    def test_seam_errors(self):
+        image = ArrayImage(random_pixels(random.Random(7), 4, 3,
+                                         PALETTES[3]))
+        for seam in [[(0, 0), (1, 1), (1, 3)],          # nonexistent row
+                     [(0, 0), (1, 1), (1, -1)],         # nonexistent row
+                     [(0, 0), (1, 1), (2, 1), (1, 2)],  # repeated row
+                     [(0, 0), (1, 2)],                  # missed row
+                     []]:
+            self.assertRaises(SeamError, image.remove_seam, seam)
+            self.assertRaises(SeamError, ImageMatrix(image.image()).remove_seam,
+                              seam)
+        self.assertEqual(4, image.width)
+        image.remove_seam([(1, 2), (0, 0), (3, 1)])
+        self.assertEqual(3, image.width)
+
+@unittest.skipIf(imagematrix.numpy is None, 'ArrayImage needs NumPy')
+class TestIncrementalImage(unittest.TestCase):
+    def removed_seams(self, matrix, count):
+        # Removes count best seams from a ResizeableImage, recomputing each
+        # from scratch, and returns them.
+        seams = []
+        for k in range(count):
+            seams.append(matrix.best_seam())
+            matrix.remove_seam(seams[-1])
+        return seams
+
+    def assert_remove_seams_match(self, image, count):
+        incremental = IncrementalResizeableImage(image)
+        matrix = ResizeableImage(incremental.image())
+        self.assertEqual(self.removed_seams(matrix, count),
+                         incremental.remove_seams(count))
+        self.assertEqual(pixel_list(matrix), pixel_list(incremental))
+        if matrix.width > 1:  # ResizeableImage needs two columns
+            self.assertEqual(matrix.best_seam(), incremental.best_seam())
+
+    def test_remove_seams_small(self):
+        self.assert_remove_seams_match('sunset_small.png', 5)
+
+    def test_remove_seams_random(self):
+        for pixels in random_images(2121, 300, 12, 12):
+            self.assert_remove_seams_match(pixels, pixels.shape[1] - 1)
+
+    def test_narrow_and_flat(self):
+        rng = random.Random(21)
+        for width, height in [(2, 1), (3, 1), (2, 5), (3, 7), (12, 1)]:
+            for palette in PALETTES:
+                pixels = random_pixels(rng, width, height, palette)
+                self.assert_remove_seams_match(pixels, width - 1)
+
+    def test_cache_invalidation(self):
+        rng = random.Random(2121)
+        for k in range(50):
+            pixels = random_pixels(rng, rng.randint(6, 10),
+                                   rng.randint(2, 10), rng.choice(PALETTES))
+            incremental = IncrementalResizeableImage(pixels)
+            matrix = ResizeableImage(incremental.image())
+            self.assertEqual(self.removed_seams(matrix, 1),
+                             incremental.remove_seams(1))
+            # Both caches are filled now; changing pixels must reset them.
+            seam = incremental.best_seam()
+            color = rng.choice(PALETTES[3])
+            incremental.color_seam(seam, color)
+            matrix.color_seam(seam, color)
+            self.assertEqual(matrix.best_seam(), incremental.best_seam())
+            self.assertEqual(self.removed_seams(matrix, 1),
+                             incremental.remove_seams(1))
+            i, j = rng.randrange(matrix.width), rng.randrange(matrix.height)
+            color = rng.choice(PALETTES[3])
+            incremental[i, j] = color
+            matrix[i, j] = color
+            self.assertEqual(self.removed_seams(matrix, 2),
+                             incremental.remove_seams(2))
+            self.assertEqual(pixel_list(matrix), pixel_list(incremental))
+
 if __name__ == '__main__':
     unittest.main(argv = sys.argv + ['--verbose'])
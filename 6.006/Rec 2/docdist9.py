@@ -0,0 +1,485 @@
+#!/usr/bin/python
+# docdist9.py - compare a whole corpus of files at once
+#
+# Based on docdist8.py (see docdist[1-8].py).
+#
+# Usage:
+#    docdist9.py [--cache FILE] filename1 filename2 ...
+#
+# This program computes the same "distance" as docdist8.py, the angle
+# between word frequency vectors (in radians), but for every pair of
+# documents in a corpus instead of a single pair.
+#
+# The corpus is built as follows:
+#    (1) each file is read in fixed-size chunks, so a file is never held
+#        in memory as a whole, and split into words exactly as in
+#        docdist8.py (a word that straddles two chunks is carried over)
+#    (2) every distinct word gets an integer id from a vocabulary shared
+#        by all the documents
+#    (3) the word frequencies of document i are stored as row i of a
+#        sparse matrix in compressed sparse row form: the ids of its words
+#        are indices[indptr[i]:indptr[i+1]], in increasing order, and their
+#        frequencies are the same slice of counts
+#    (4) if a cache file is given, the rows of files whose size and
+#        modification time did not change are read back from it instead
+#        of from the files
+#
+# Dividing every row by its norm turns the inner product of two rows into
+# the cosine of their angle, so the cosines for all pairs are the product
+# of the normalized matrix with its own transpose.  The product is computed
+# a block of rows at a time.  With NumPy, the words found in many documents
+# are multiplied as a dense matrix and the others by merging their
+# posting lists; without it, a block is accumulated from the posting lists
+# in pure Python.
+
+import json
+import math
+import optparse
+import os
+from array import array
+
+from docdist8 import translation_table
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CHUNK_SIZE = 1 << 16
+
+def get_words_from_file(filename, chunk_size=CHUNK_SIZE):
+    """
+    Generate the words of the given file, reading it chunk_size bytes
+    at a time.  The words are the same as those that docdist8.py finds.
+    """
+    with open(filename, 'rb') as f:
+        carry = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            text = carry + chunk.translate(translation_table)
+            words = text.split()
+            # A word touching the end of the chunk may continue in the next.
+            if words and not text[-1].isspace():
+                carry = words.pop()
+            else:
+                carry = ''
+            for word in words:
+                yield word
+        if carry:
+            yield carry
+
+def count_frequency(words):
+    """
+    Return a dictionary mapping words to frequency.
+    """
+    D = {}
+    for word in words:
+        D[word] = D.get(word, 0) + 1
+    return D
+
+class Corpus(object):
+    """
+    Word frequency vectors of many documents, over a shared vocabulary.
+
+    Document i is self.filenames[i].  Its vector is row i of a sparse
+    matrix: the ids of the words it contains are
+    indices[indptr[i]:indptr[i+1]], sorted, and counts holds their
+    frequencies.  self.words[id] is the word with the given id.
+    """
+
+    # Cache file format version, bumped when the layout changes.
+    VERSION = 2
+    # Rows multiplied at once by cosine_blocks.
+    block_size = 256
+    # With NumPy, the words found in at least this fraction of the
+    # documents are multiplied as a dense matrix, where a pair of documents
+    # costs a few instructions per word instead of a posting list entry ...
+    dense_fraction = 0.1
+    # ... but at most this many of them, to bound the matrix's size.
+    dense_words = 1024
+
+    def __init__(self):
+        self.filenames = []
+        self.words = []
+        self.word_ids = {}
+        self.indptr = array('l', [0])
+        self.indices = array('i')
+        self.counts = array('i')
+        self.norms = array('d')
+        # (size, mtime) of each file when it was read, for the cache.
+        self.stamps = []
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def word_id(self, word):
+        """
+        Return the id of the given word, adding it to the vocabulary if it
+        is new.
+        """
+        id = self.word_ids.get(word)
+        if id is None:
+            id = self.word_ids[word] = len(self.words)
+            self.words.append(word)
+        return id
+
+    def add_file(self, filename):
+        """
+        Read the given file and append its vector to the corpus.
+        Return the document's index.
+        """
+        stat = os.stat(filename)
+        return self.add_frequencies(
+            filename, (stat.st_size, stat.st_mtime),
+            count_frequency(get_words_from_file(filename)))
+
+    def add_frequencies(self, filename, stamp, frequencies):
+        """
+        Append the vector with the given dictionary of (word,frequency)
+        pairs, for a file with the given (size, mtime) stamp.
+        Return the document's index.
+        """
+        row = sorted((self.word_id(word), count)
+                     for word, count in frequencies.iteritems())
+        return self._add_row(filename, stamp, row)
+
+    def _add_row(self, filename, stamp, row):
+        self.filenames.append(filename)
+        self.stamps.append(stamp)
+        self.indices.extend(id for id, count in row)
+        self.counts.extend(count for id, count in row)
+        self.indptr.append(len(self.indices))
+        self.norms.append(math.sqrt(sum(count * count for id, count in row)))
+        return len(self.filenames) - 1
+
+    def replace_frequencies(self, i, stamp, frequencies):
+        """
+        Replace the vector of document i with the given dictionary of
+        (word,frequency) pairs, for its file's new (size, mtime) stamp.
+        """
+        row = sorted((self.word_id(word), count)
+                     for word, count in frequencies.iteritems())
+        start, end = self.indptr[i], self.indptr[i + 1]
+        self.indices[start:end] = array('i', [id for id, count in row])
+        self.counts[start:end] = array('i', [count for id, count in row])
+        shift = len(row) - (end - start)
+        if shift:
+            for k in xrange(i + 1, len(self.indptr)):
+                self.indptr[k] += shift
+        self.stamps[i] = stamp
+        self.norms[i] = math.sqrt(sum(count * count for id, count in row))
+
+    def row(self, i):
+        """
+        Return the (word id, frequency) pairs of document i, sorted by id.
+        """
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return zip(self.indices[start:end], self.counts[start:end])
+
+    def vector(self, i):
+        """
+        Return the dictionary of (word,frequency) pairs of document i, as
+        docdist8.word_frequencies_for_file would.
+        """
+        return dict((self.words[id], count) for id, count in self.row(i))
+
+    def angle(self, i, j):
+        """
+        Return the angle between the vectors of documents i and j.
+        """
+        if not self.norms[i] or not self.norms[j]:
+            return math.pi / 2
+        counts = dict(self.row(i))
+        numerator = 0.0
+        for id, count in self.row(j):
+            if id in counts:
+                numerator += counts[id] * count
+        return cosine_to_angle(numerator / (self.norms[i] * self.norms[j]))
+
+    def cosine_blocks(self, block_size=None):
+        """
+        Generate (first, block) pairs that together cover all the
+        documents, where block[k][j] is the cosine of the angle between
+        documents first + k and j.  Empty documents are orthogonal to every
+        document, themselves included.
+
+        The blocks are NumPy arrays if NumPy is installed, and lists of
+        arrays of doubles otherwise.
+        """
+        block_size = block_size or self.block_size
+        if numpy is not None:
+            return self._numpy_cosine_blocks(block_size)
+        return self._python_cosine_blocks(block_size)
+
+    def angle_blocks(self, block_size=None):
+        """
+        Generate (first, block) pairs like cosine_blocks, where block[k][j]
+        is the angle between documents first + k and j.
+        """
+        for first, block in self.cosine_blocks(block_size):
+            if numpy is not None:
+                yield first, numpy.arccos(numpy.clip(block, -1.0, 1.0))
+            else:
+                yield first, [array('d', map(cosine_to_angle, cosines))
+                              for cosines in block]
+
+    def all_pairs(self):
+        """
+        Generate (i, j, angle) for every pair of documents with i < j.
+        """
+        for first, block in self.angle_blocks():
+            for k in xrange(len(block)):
+                i = first + k
+                for j in xrange(i + 1, len(self.filenames)):
+                    yield i, j, float(block[k][j])
+
+    def nearest(self):
+        """
+        Return a list with, for each document, a (j, angle) pair naming the
+        closest other document, or None for a corpus of one document.
+        """
+        if len(self.filenames) < 2:
+            return [None] * len(self.filenames)
+        result = []
+        for first, block in self.angle_blocks():
+            for k in xrange(len(block)):
+                angles = block[k]
+                if numpy is not None:
+                    angles = angles.copy()
+                    angles[first + k] = numpy.inf
+                    j = int(angles.argmin())
+                else:
+                    j = min((j for j in xrange(len(angles)) if j != first + k),
+                            key=angles.__getitem__)
+                result.append((j, float(angles[j])))
+        return result
+
+    def _weights(self):
+        # The frequencies divided by the norm of their row.
+        weights = array('d', self.counts)
+        for i in xrange(len(self.filenames)):
+            norm = self.norms[i]
+            for k in xrange(self.indptr[i], self.indptr[i + 1]):
+                weights[k] /= norm
+        return weights
+
+    def _postings(self, indices, weights, document_count, word_count):
+        # The transpose of the matrix: the (document, weight) pairs of each
+        # word, as compressed sparse column arrays.
+        colptr = array('l', [0]) * (word_count + 1)
+        for id in indices:
+            colptr[id + 1] += 1
+        for id in xrange(word_count):
+            colptr[id + 1] += colptr[id]
+        fill = array('l', colptr)
+        rows = array('l', [0]) * len(indices)
+        values = array('d', [0.0]) * len(indices)
+        for i in xrange(document_count):
+            for k in xrange(self.indptr[i], self.indptr[i + 1]):
+                position = fill[indices[k]]
+                rows[position] = i
+                values[position] = weights[k]
+                fill[indices[k]] += 1
+        return colptr, rows, values
+
+    def _python_cosine_blocks(self, block_size):
+        n = len(self.filenames)
+        weights = self._weights()
+        colptr, rows, values = self._postings(self.indices, weights, n,
+                                              len(self.words))
+        for first in xrange(0, n, block_size):
+            block = []
+            for i in xrange(first, min(first + block_size, n)):
+                cosines = array('d', [0.0]) * n
+                for k in xrange(self.indptr[i], self.indptr[i + 1]):
+                    id, weight = self.indices[k], weights[k]
+                    for position in xrange(colptr[id], colptr[id + 1]):
+                        cosines[rows[position]] += weight * values[position]
+                block.append(cosines)
+            yield first, block
+
+    def _numpy_cosine_blocks(self, block_size):
+        n, word_count = len(self.filenames), len(self.words)
+        indptr = numpy.frombuffer(self.indptr, dtype=numpy.int_)
+        indices = numpy.frombuffer(self.indices, dtype=numpy.intc)
+        lengths = numpy.diff(indptr)
+        row_of = numpy.repeat(numpy.arange(n), lengths)
+        norms = numpy.frombuffer(self.norms, dtype=numpy.float64)
+        # Only empty rows have a zero norm, and they have no entries.
+        weights = numpy.frombuffer(self.counts, dtype=numpy.intc) / \
+            norms[row_of]
+
+        # The words found in the most documents become the dense columns.
+        frequencies = numpy.bincount(indices, minlength=word_count)
+        dense = numpy.argsort(-frequencies, kind='mergesort')[
+            :self.dense_words]
+        dense = dense[frequencies[dense] >= self.dense_fraction * n]
+        column = numpy.full(word_count, -1, dtype=numpy.int_)
+        column[dense] = numpy.arange(len(dense))
+        is_dense = column[indices] >= 0
+        dense_matrix = numpy.zeros((n, len(dense)))
+        dense_matrix[row_of[is_dense], column[indices[is_dense]]] = \
+            weights[is_dense]
+
+        # The posting lists of the other words, sorted by word then document.
+        sparse = ~is_dense
+        sparse_rows, sparse_ids = row_of[sparse], indices[sparse]
+        sparse_weights = weights[sparse]
+        order = numpy.argsort(sparse_ids, kind='mergesort')
+        posting_rows = sparse_rows[order]
+        posting_weights = sparse_weights[order]
+        colptr = numpy.zeros(word_count + 1, dtype=numpy.int_)
+        colptr[1:] = numpy.cumsum(numpy.bincount(sparse_ids,
+                                                 minlength=word_count))
+        # Where each document's sparse entries start.
+        sparse_indptr = numpy.zeros(n + 1, dtype=numpy.int_)
+        sparse_indptr[1:] = numpy.cumsum(numpy.bincount(sparse_rows,
+                                                        minlength=n))
+
+        for first in xrange(0, n, block_size):
+            last = min(first + block_size, n)
+            block = numpy.dot(dense_matrix[first:last], dense_matrix.T)
+            # Pair every sparse entry of the block's rows with each document
+            # in the posting list of its word.
+            start, end = sparse_indptr[first], sparse_indptr[last]
+            ids = sparse_ids[start:end]
+            postings = colptr[ids + 1] - colptr[ids]
+            total = postings.sum()
+            if total:
+                offsets = numpy.cumsum(postings) - postings
+                positions = numpy.repeat(colptr[ids] - offsets, postings) + \
+                    numpy.arange(total)
+                targets = numpy.repeat((sparse_rows[start:end] - first) * n,
+                                       postings) + posting_rows[positions]
+                products = numpy.repeat(sparse_weights[start:end],
+                                        postings) * posting_weights[positions]
+                block += numpy.bincount(
+                    targets, weights=products,
+                    minlength=(last - first) * n).reshape((last - first, n))
+            yield first, block
+
+    def write(self, f):
+        """
+        Write the corpus to the binary file object f.
+        """
+        # Words never contain whitespace.
+        vocabulary = '\n'.join(self.words)
+        header = {'version': self.VERSION,
+                  'itemsize': array('i').itemsize,
+                  'documents': [[name, size, mtime, self.indptr[i + 1] -
+                                 self.indptr[i]] for i, (name, (size, mtime))
+                                in enumerate(zip(self.filenames,
+                                                 self.stamps))],
+                  'vocabulary': len(vocabulary)}
+        f.write(json.dumps(header) + '\n')
+        self.indices.tofile(f)
+        self.counts.tofile(f)
+        f.write(vocabulary)
+
+    @staticmethod
+    def read(f):
+        """
+        Read a corpus written by write from the binary file object f.
+
+        Raises:
+            ValueError: if the corpus was written in another format, or
+                the file ends before the corpus does.
+        """
+        header = json.loads(f.readline())
+        if header['version'] != Corpus.VERSION or \
+                header['itemsize'] != array('i').itemsize:
+            raise ValueError('Unsupported corpus format')
+        entries = sum(document[3] for document in header['documents'])
+        indices, counts = array('i'), array('i')
+        try:
+            indices.fromfile(f, entries)
+            counts.fromfile(f, entries)
+        except EOFError:
+            pass
+        vocabulary = f.read(header['vocabulary'])
+        if len(indices) != entries or len(counts) != entries or \
+                len(vocabulary) != header['vocabulary']:
+            raise ValueError('Truncated corpus')
+        corpus = Corpus()
+        if vocabulary:
+            corpus.words = vocabulary.split('\n')
+        corpus.word_ids = dict((word, id) for id, word in
+                               enumerate(corpus.words))
+        start = 0
+        for name, size, mtime, length in header['documents']:
+            corpus._add_row(str(name), (size, mtime),
+                            zip(indices[start:start + length],
+                                counts[start:start + length]))
+            start += length
+        return corpus
+
+    def save(self, filename):
+        """
+        Write the corpus to a cache file, replacing it atomically.
+        """
+        temporary = '%s.%d.tmp' % (filename, os.getpid())
+        with open(temporary, 'wb') as f:
+            self.write(f)
+        os.rename(temporary, filename)
+
+    @staticmethod
+    def load(filenames, cache=None):
+        """
+        Return the corpus of the given files.  If cache names a file written
+        by save, the vectors of the files that have the same size and
+        modification time as when it was written are taken from it, and
+        only the other files are read.  The vocabulary is kept, so the
+        cached word ids remain valid.
+        """
+        corpus = Corpus()
+        cached = Corpus()
+        if cache is not None and os.path.exists(cache):
+            with open(cache, 'rb') as f:
+                try:
+                    cached = Corpus.read(f)
+                except (ValueError, EOFError):
+                    pass
+            corpus.words, corpus.word_ids = cached.words, cached.word_ids
+        positions = dict((name, i) for i, name in
+                         enumerate(cached.filenames))
+        for filename in filenames:
+            stat = os.stat(filename)
+            i = positions.get(filename)
+            if i is not None and cached.stamps[i] == (stat.st_size,
+                                                      stat.st_mtime):
+                corpus._add_row(filename, cached.stamps[i], cached.row(i))
+            else:
+                corpus.add_file(filename)
+        if cache is not None:
+            corpus.save(cache)
+        return corpus
+
+def cosine_to_angle(cosine):
+    """
+    Return the angle with the given cosine, which may be slightly out of
+    [-1, 1] because of rounding.
+    """
+    return math.acos(min(1.0, max(-1.0, cosine)))
+
+def main():
+    parser = optparse.OptionParser(
+        usage='usage: %prog [--cache FILE] filename1 filename2 ...')
+    parser.add_option('--cache', default=None,
+                      help='reuse the word vectors saved in FILE')
+    options, filenames = parser.parse_args()
+    if len(filenames) < 2:
+        parser.print_usage()
+        return
+    corpus = Corpus.load(filenames, options.cache)
+    if len(filenames) == 2:
+        print "The distance between the documents is: %0.6f (radians)" % \
+            corpus.angle(0, 1)
+        return
+    for i, (j, angle) in enumerate(corpus.nearest()):
+        print "%s: closest to %s at %0.6f (radians)" % (
+            filenames[i], filenames[j], angle)
+
+if __name__ == "__main__":
+    main()
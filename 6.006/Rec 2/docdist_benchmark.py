@@ -0,0 +1,170 @@
+#!/usr/bin/python
+"""
+Benchmark for the docdist9.py corpus engine.
+
+Writes a synthetic corpus of text files, builds its Corpus with and without
+the cache, computes the angles between all pairs of documents, and compares
+the time with docdist8.py's pairwise path on a random sample of pairs,
+extrapolated to all the pairs.  docdist8 is timed both the way docdist8.py
+runs (reading both files for every pair) and with the word frequency
+dictionaries of every file computed once.
+
+Usage:
+    python docdist_benchmark.py [--documents 10000] [--pairs 200]
+                                [--block-size 256] [--directory DIR]
+"""
+import optparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import docdist8
+import docdist9
+
+def make_vocabulary(size, rng):
+    """
+    Return a list of size distinct random lower-case words.
+    """
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice('abcdefghijklmnopqrstuvwxyz')
+                          for i in xrange(rng.randint(2, 10))))
+    return sorted(words)
+
+def make_document(vocabulary, length, rng):
+    """
+    Return a text of about length words drawn with a Zipf-like
+    distribution, with some capitals and punctuation.
+    """
+    words = []
+    for i in xrange(length):
+        word = vocabulary[min(int(rng.paretovariate(0.3)) - 1,
+                              len(vocabulary) - 1)]
+        if rng.random() < 0.05:
+            word = word.capitalize()
+        if rng.random() < 0.08:
+            word += rng.choice(',.;:!?')
+        words.append(word)
+    lines = [' '.join(words[i:i + 12]) for i in xrange(0, len(words), 12)]
+    return '\n'.join(lines) + '\n'
+
+def write_corpus(directory, documents, rng, vocabulary_size=20000,
+                 length=300, duplicates=0.05):
+    """
+    Write documents text files to directory and return their names.  A
+    fraction of the documents are edited copies of earlier ones, so that
+    the corpus has some near-duplicates.
+    """
+    vocabulary = make_vocabulary(vocabulary_size, rng)
+    rng.shuffle(vocabulary)
+    filenames = []
+    texts = []
+    for i in xrange(documents):
+        if texts and rng.random() < duplicates:
+            words = rng.choice(texts).split(' ')
+            for k in xrange(max(1, len(words) // 20)):
+                words[rng.randrange(len(words))] = rng.choice(vocabulary)
+            text = ' '.join(words)
+        else:
+            text = make_document(vocabulary,
+                                 rng.randint(length // 2, 2 * length), rng)
+        texts.append(text)
+        filename = os.path.join(directory, 'doc%05d.txt' % i)
+        with open(filename, 'w') as f:
+            f.write(text)
+        filenames.append(filename)
+    return filenames
+
+def docdist8_pair(filename_1, filename_2):
+    """
+    What docdist8.py computes for one pair of files.
+    """
+    return docdist8.vector_angle(
+        docdist8.word_frequencies_for_file(filename_1),
+        docdist8.word_frequencies_for_file(filename_2))
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option('--documents', type='int', default=10000,
+                      help='number of documents in the corpus')
+    parser.add_option('--pairs', type='int', default=200,
+                      help='number of pairs to time docdist8 on')
+    parser.add_option('--block-size', type='int', default=256,
+                      help='rows per block of the all-pairs product')
+    parser.add_option('--directory', default=None,
+                      help='write the corpus to DIR and keep it')
+    options, _ = parser.parse_args(argv)
+
+    rng = random.Random(6006)
+    directory = options.directory or tempfile.mkdtemp()
+    try:
+        start = time.time()
+        filenames = write_corpus(directory, options.documents, rng)
+        print 'Wrote %d documents in %.3fs' % (len(filenames),
+                                               time.time() - start)
+        cache = os.path.join(directory, 'corpus.cache')
+        if os.path.exists(cache):
+            os.remove(cache)
+        start = time.time()
+        corpus = docdist9.Corpus.load(filenames, cache)
+        print 'Built the corpus (%d words, %d entries) in %.3fs' % (
+            len(corpus.words), len(corpus.indices), time.time() - start)
+        start = time.time()
+        corpus = docdist9.Corpus.load(filenames, cache)
+        print 'Loaded the corpus from the cache in %.3fs' % (
+            time.time() - start)
+
+        n = len(filenames)
+        pair_count = n * (n - 1) // 2
+        sample = []
+        while len(sample) < options.pairs:
+            i, j = rng.randrange(n), rng.randrange(n)
+            if i != j:
+                sample.append((min(i, j), max(i, j)))
+        wanted = {}
+        for i, j in sample:
+            wanted.setdefault(i, []).append(j)
+
+        start = time.time()
+        angles = {}
+        for first, block in corpus.angle_blocks(options.block_size):
+            for k in xrange(len(block)):
+                for j in wanted.get(first + k, ()):
+                    angles[first + k, j] = block[k][j]
+        corpus_seconds = time.time() - start
+        print 'docdist9: all %d pairs in %.3fs' % (pair_count,
+                                                   corpus_seconds)
+
+        start = time.time()
+        expected = [docdist8_pair(filenames[i], filenames[j])
+                    for i, j in sample]
+        seconds = (time.time() - start) / len(sample) * pair_count
+        print 'docdist8: all pairs in %.1fs (estimated from %d pairs), ' \
+            '%.0fx slower' % (seconds, len(sample), seconds / corpus_seconds)
+
+        start = time.time()
+        vectors = [docdist8.word_frequencies_for_file(filename)
+                   for filename in filenames]
+        vector_seconds = time.time() - start
+        start = time.time()
+        for i, j in sample:
+            docdist8.vector_angle(vectors[i], vectors[j])
+        seconds = vector_seconds + \
+            (time.time() - start) / len(sample) * pair_count
+        print 'docdist8 with vectors computed once: all pairs in %.1fs ' \
+            '(estimated), %.0fx slower' % (seconds, seconds / corpus_seconds)
+
+        error = max(abs(angles[pair] - angle)
+                    for pair, angle in zip(sample, expected))
+        print 'Largest difference from docdist8: %.2e radians' % error
+        if error > 1e-6:
+            raise RuntimeError('docdist9 disagrees with docdist8')
+    finally:
+        if options.directory is None:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,296 @@
+#!/usr/bin/python
+# docdist_lsh.py - find near-duplicate documents without comparing all pairs
+#
+# Based on docdist9.py (see docdist[1-9].py).
+#
+# Usage:
+#    docdist_lsh.py [--index FILE] [--max-angle 0.1] filename1 filename2 ...
+#
+# Comparing every pair of N documents takes N(N-1)/2 inner products, even
+# when only the few pairs of nearly identical documents are wanted.  This
+# program finds the pairs whose angle (as computed by docdist8.py) is at
+# most a given bound by only comparing pairs that are likely to be close:
+#    (1) every document is turned into the set of its "shingles", the
+#        sequences of shingle_size consecutive words, and each shingle is
+#        hashed to 32 bits
+#    (2) the MinHash signature of a document is the minimum of each of
+#        bands*rows random hash functions over its shingles; two documents
+#        agree on a given minimum with probability equal to the Jaccard
+#        similarity of their shingle sets
+#    (3) the signature is cut into bands of rows minimums, and documents
+#        whose signatures agree on a whole band land in the same bucket of
+#        that band; a pair with Jaccard similarity s shares at least one
+#        bucket with probability 1 - (1 - s**rows)**bands
+#    (4) the pairs that share a bucket are the candidates, and their exact
+#        angle is computed from the docdist9 word frequency vectors
+#
+# So every pair reported is within the bound, but a close pair whose
+# shingle sets are not similar enough may be missed.  Documents can be
+# added to the index one at a time, and the index can be saved to a file;
+# the files whose size or modification time changed since they were
+# indexed are read again.
+
+import bisect
+import json
+import optparse
+import os
+import random
+import zlib
+from array import array
+
+import docdist9
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MASK64 = (1 << 64) - 1
+
+class MinHashIndex(object):
+    """
+    A banded locality-sensitive hashing index of MinHash signatures.
+
+    Document i is self.corpus.filenames[i]; its signature is
+    self.signatures[i * self.size():(i + 1) * self.size()].  The hash
+    functions are h(x) = ((a * x + b) mod 2**64) >> 32 for random odd a and
+    random b, which is the same with and without NumPy.
+    """
+
+    # Index file format version, bumped when the layout changes.
+    VERSION = 1
+
+    def __init__(self, bands=16, rows=8, shingle_size=1, seed=6006):
+        self.bands = bands
+        self.rows = rows
+        self.shingle_size = shingle_size
+        self.seed = seed
+        rng = random.Random(seed)
+        self.multipliers = [rng.getrandbits(64) | 1
+                            for k in xrange(bands * rows)]
+        self.increments = [rng.getrandbits(64) for k in xrange(bands * rows)]
+        self.corpus = docdist9.Corpus()
+        self.signatures = array('I')
+        # buckets[band] maps the bytes of a band of a signature to the
+        # documents with that band.
+        self.buckets = [{} for band in xrange(bands)]
+
+    def __len__(self):
+        return len(self.corpus)
+
+    def size(self):
+        """
+        Return the number of minimums in a signature.
+        """
+        return self.bands * self.rows
+
+    def add_file(self, filename):
+        """
+        Read the given file, add it to the index and return its index.
+        """
+        stamp, frequencies, shingles = self._read(filename)
+        i = self.corpus.add_frequencies(filename, stamp, frequencies)
+        self.signatures.extend(self.signature(shingles))
+        if shingles:
+            self._insert(i)
+        return i
+
+    def update_file(self, i):
+        """
+        Read the file of document i again, and replace its vector,
+        signature and buckets.
+        """
+        stamp, frequencies, shingles = self._read(self.corpus.filenames[i])
+        if self.corpus.norms[i]:
+            self._remove(i)
+        self.corpus.replace_frequencies(i, stamp, frequencies)
+        start = i * self.size()
+        self.signatures[start:start + self.size()] = \
+            array('I', self.signature(shingles))
+        if shingles:
+            self._insert(i)
+
+    def update_files(self, filenames):
+        """
+        Add the given files that are not in the index, and read again the
+        ones whose size or modification time changed since they were read,
+        as docdist9.Corpus.load does.
+        """
+        positions = dict((name, i) for i, name in
+                         enumerate(self.corpus.filenames))
+        for filename in filenames:
+            i = positions.get(filename)
+            if i is None:
+                positions[filename] = self.add_file(filename)
+            else:
+                stat = os.stat(filename)
+                if self.corpus.stamps[i] != (stat.st_size, stat.st_mtime):
+                    self.update_file(i)
+
+    def _read(self, filename):
+        # The (size, mtime) stamp, word frequencies and shingle hashes of
+        # the given file.
+        stat = os.stat(filename)
+        frequencies = {}
+        shingles = set()
+        window = []
+        for word in docdist9.get_words_from_file(filename):
+            frequencies[word] = frequencies.get(word, 0) + 1
+            window.append(word)
+            if len(window) > self.shingle_size:
+                del window[0]
+            if len(window) == self.shingle_size:
+                shingles.add(zlib.crc32(' '.join(window)) & 0xffffffff)
+        if window and not shingles:
+            # Documents shorter than a shingle are a single shingle.
+            shingles.add(zlib.crc32(' '.join(window)) & 0xffffffff)
+        return (stat.st_size, stat.st_mtime), frequencies, shingles
+
+    def signature(self, shingles):
+        """
+        Return the MinHash signature, a list of size() integers, of the
+        given set of shingle hashes.  The signature of the empty set is all
+        0xffffffff.
+        """
+        if not shingles:
+            return [0xffffffff] * self.size()
+        if numpy is not None:
+            values = numpy.fromiter(shingles, dtype=numpy.uint64,
+                                    count=len(shingles))
+            multipliers = numpy.array(self.multipliers, dtype=numpy.uint64)
+            increments = numpy.array(self.increments, dtype=numpy.uint64)
+            # uint64 arithmetic wraps around, which is the mod 2**64.
+            hashes = (multipliers[:, numpy.newaxis] * values +
+                      increments[:, numpy.newaxis]) >> numpy.uint64(32)
+            return hashes.min(axis=1).tolist()
+        return [min(((a * x + b) & MASK64) >> 32 for x in shingles)
+                for a, b in zip(self.multipliers, self.increments)]
+
+    def _band_keys(self, i):
+        # The bytes of each band of document i's signature.
+        start = i * self.size()
+        for band in xrange(self.bands):
+            yield band, self.signatures[start + band * self.rows:
+                                        start + (band + 1) * self.rows
+                                        ].tostring()
+
+    def _insert(self, i):
+        # Buckets stay sorted, which candidate_pairs relies on.
+        for band, key in self._band_keys(i):
+            bisect.insort(self.buckets[band].setdefault(key, []), i)
+
+    def _remove(self, i):
+        for band, key in self._band_keys(i):
+            documents = self.buckets[band][key]
+            documents.remove(i)
+            if not documents:
+                del self.buckets[band][key]
+
+    def candidates(self, i):
+        """
+        Return the set of the other documents that share a bucket with
+        document i.
+        """
+        result = set()
+        if self.corpus.norms[i]:
+            for band, key in self._band_keys(i):
+                result.update(self.buckets[band].get(key, ()))
+        result.discard(i)
+        return result
+
+    def candidate_pairs(self):
+        """
+        Return the set of (i, j) pairs with i < j that share a bucket.
+        """
+        pairs = set()
+        for buckets in self.buckets:
+            for documents in buckets.itervalues():
+                for k, i in enumerate(documents):
+                    for j in documents[k + 1:]:
+                        pairs.add((i, j))
+        return pairs
+
+    def similar(self, i, max_angle):
+        """
+        Return the (angle, j) pairs, sorted, of the candidates j for
+        document i whose angle with it is at most max_angle.
+        """
+        result = []
+        for j in self.candidates(i):
+            angle = self.corpus.angle(i, j)
+            if angle <= max_angle:
+                result.append((angle, j))
+        result.sort()
+        return result
+
+    def near_duplicates(self, max_angle):
+        """
+        Return the (i, j, angle) triples, sorted, of the candidate pairs
+        with i < j whose angle is at most max_angle.
+        """
+        result = []
+        for i, j in sorted(self.candidate_pairs()):
+            angle = self.corpus.angle(i, j)
+            if angle <= max_angle:
+                result.append((i, j, angle))
+        return result
+
+    def save(self, filename):
+        """
+        Write the index to a file, replacing it atomically.
+        """
+        header = {'version': self.VERSION, 'bands': self.bands,
+                  'rows': self.rows, 'shingle_size': self.shingle_size,
+                  'seed': self.seed, 'itemsize': self.signatures.itemsize,
+                  'documents': len(self)}
+        temporary = '%s.%d.tmp' % (filename, os.getpid())
+        with open(temporary, 'wb') as f:
+            f.write(json.dumps(header) + '\n')
+            self.signatures.tofile(f)
+            self.corpus.write(f)
+        os.rename(temporary, filename)
+
+    @staticmethod
+    def load(filename):
+        """
+        Read an index written by save.
+
+        Raises:
+            ValueError: if the index was written in another format.
+        """
+        with open(filename, 'rb') as f:
+            header = json.loads(f.readline())
+            if header['version'] != MinHashIndex.VERSION or \
+                    header['itemsize'] != array('I').itemsize:
+                raise ValueError('Unsupported index format')
+            index = MinHashIndex(header['bands'], header['rows'],
+                                 header['shingle_size'], header['seed'])
+            index.signatures.fromfile(f, header['documents'] * index.size())
+            index.corpus = docdist9.Corpus.read(f)
+        for i in xrange(len(index)):
+            if index.corpus.norms[i]:
+                index._insert(i)
+        return index
+
+def main():
+    parser = optparse.OptionParser(
+        usage='usage: %prog [--index FILE] [--max-angle 0.1] '
+              'filename1 filename2 ...')
+    parser.add_option('--index', default=None,
+                      help='add the files to the index saved in FILE')
+    parser.add_option('--max-angle', type='float', default=0.1,
+                      help='report pairs at most this far apart (radians)')
+    options, filenames = parser.parse_args()
+    if options.index is not None and os.path.exists(options.index):
+        index = MinHashIndex.load(options.index)
+    else:
+        index = MinHashIndex()
+    index.update_files(filenames)
+    if options.index is not None:
+        index.save(options.index)
+    for i, j, angle in index.near_duplicates(options.max_angle):
+        print "%s and %s: %0.6f (radians)" % (
+            index.corpus.filenames[i], index.corpus.filenames[j], angle)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+"""
+Benchmark for the docdist_lsh.py near-duplicate index.
+
+Writes the synthetic corpus of docdist_benchmark.py, adds its documents to
+a MinHashIndex one at a time, and finds the pairs at most --max-angle
+apart.  The exact answer is computed by comparing all pairs with
+docdist9.py, and estimated for docdist8.py from a sample of pairs; the
+report gives the recall of the index against the exact answer and its
+speedup over both.
+
+Usage:
+    python docdist_lsh_benchmark.py [--documents 10000] [--max-angle 0.1]
+                                    [--bands 16] [--rows 8]
+                                    [--shingle-size 1]
+"""
+import optparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import docdist8
+import docdist9
+import docdist_lsh
+from docdist_benchmark import write_corpus
+
+def exact_near_duplicates(corpus, max_angle):
+    """
+    Return the set of (i, j) pairs with i < j whose angle is at most
+    max_angle, comparing all pairs.
+    """
+    pairs = set()
+    for first, block in corpus.angle_blocks():
+        for k in xrange(len(block)):
+            i = first + k
+            if docdist9.numpy is not None:
+                close = docdist9.numpy.nonzero(block[k][i + 1:] <= max_angle)
+                pairs.update((i, i + 1 + j) for j in close[0].tolist())
+            else:
+                pairs.update((i, j) for j in xrange(i + 1, len(corpus))
+                             if block[k][j] <= max_angle)
+    return pairs
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option('--documents', type='int', default=10000,
+                      help='number of documents in the corpus')
+    parser.add_option('--max-angle', type='float', default=0.1,
+                      help='largest angle of a near-duplicate pair')
+    parser.add_option('--bands', type='int', default=16,
+                      help='number of LSH bands')
+    parser.add_option('--rows', type='int', default=8,
+                      help='number of minimums per band')
+    parser.add_option('--shingle-size', type='int', default=1,
+                      help='number of words per shingle')
+    parser.add_option('--pairs', type='int', default=200,
+                      help='number of pairs to time docdist8 on')
+    options, _ = parser.parse_args(argv)
+
+    rng = random.Random(6006)
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = write_corpus(directory, options.documents, rng)
+        n = len(filenames)
+
+        start = time.time()
+        index = docdist_lsh.MinHashIndex(options.bands, options.rows,
+                                         options.shingle_size)
+        for filename in filenames:
+            index.add_file(filename)
+        build_seconds = time.time() - start
+        print 'Indexed %d documents in %.3fs (%.2fms each)' % (
+            n, build_seconds, build_seconds / n * 1000)
+
+        start = time.time()
+        found = index.near_duplicates(options.max_angle)
+        query_seconds = time.time() - start
+        candidates = len(index.candidate_pairs())
+        print 'LSH: %d pairs from %d candidates in %.3fs' % (
+            len(found), candidates, query_seconds)
+
+        index_file = os.path.join(directory, 'index')
+        start = time.time()
+        index.save(index_file)
+        loaded = docdist_lsh.MinHashIndex.load(index_file)
+        print 'Saved and loaded the index in %.3fs' % (time.time() - start)
+        if loaded.near_duplicates(options.max_angle) != found:
+            raise RuntimeError('The loaded index disagrees')
+
+        start = time.time()
+        exact = exact_near_duplicates(index.corpus, options.max_angle)
+        exact_seconds = time.time() - start
+        print 'docdist9: %d pairs from all %d pairs in %.3fs' % (
+            len(exact), n * (n - 1) // 2, exact_seconds)
+
+        vectors = [index.corpus.vector(i) for i in xrange(n)]
+        start = time.time()
+        for k in xrange(options.pairs):
+            i, j = rng.sample(xrange(n), 2)
+            docdist8.vector_angle(vectors[i], vectors[j])
+        docdist8_seconds = (time.time() - start) / options.pairs * \
+            (n * (n - 1) // 2)
+        print 'docdist8: all pairs in %.1fs (estimated from %d pairs)' % (
+            docdist8_seconds, options.pairs)
+
+        pairs = set((i, j) for i, j, angle in found)
+        if not pairs <= exact:
+            raise RuntimeError('LSH reported a pair that is too far apart')
+        print 'Recall %.4f (%d of %d pairs)' % (
+            len(pairs) / float(max(len(exact), 1)), len(pairs), len(exact))
+        print 'Speedup of the query: %.1fx over docdist9, %.0fx over ' \
+            'docdist8' % (exact_seconds / query_seconds,
+                          docdist8_seconds / query_seconds)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,148 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import docdist8
+import docdist9
+from docdist9 import Corpus
+
+def random_text(rng, length):
+    """
+    Return a text with words of mixed case, punctuation and whitespace.
+    """
+    pieces = []
+    for k in xrange(length):
+        pieces.append(rng.choice(['the', 'Cat', 'SAT', 'on', 'a', 'mat',
+                                  "don't", 'x', 'well-known', '42']))
+        pieces.append(rng.choice([' ', '  ', '\n', '\t', '. ', ',', '\r\n']))
+    return ''.join(pieces)
+
+class TestCorpus(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        rng = random.Random(22)
+        self.filenames = [self.write('doc%d.txt' % k,
+                                     random_text(rng, rng.randint(0, 60)))
+                          for k in xrange(12)]
+        self.filenames.append(self.write('empty.txt', ''))
+        self.filenames.append(self.write('blank.txt', ' \n.,;\n'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'wb') as f:
+            f.write(text)
+        return filename
+
+    def test_chunked_words(self):
+        for filename in self.filenames:
+            expected = docdist8.word_frequencies_for_file(filename)
+            for chunk_size in [1, 2, 3, 5, 7, 64, docdist9.CHUNK_SIZE]:
+                words = docdist9.get_words_from_file(filename, chunk_size)
+                self.assertEqual(expected, docdist9.count_frequency(words))
+
+    def test_vectors(self):
+        corpus = Corpus.load(self.filenames)
+        for i, filename in enumerate(self.filenames):
+            self.assertEqual(docdist8.word_frequencies_for_file(filename),
+                             corpus.vector(i))
+            for j in xrange(len(self.filenames)):
+                if corpus.norms[i] and corpus.norms[j]:
+                    self.assertAlmostEqual(
+                        docdist8.vector_angle(corpus.vector(i),
+                                              corpus.vector(j)),
+                        corpus.angle(i, j))
+
+    def test_empty_documents(self):
+        corpus = Corpus.load(self.filenames)
+        empty = [len(self.filenames) - 2, len(self.filenames) - 1]
+        for i in empty:
+            self.assertEqual({}, corpus.vector(i))
+            self.assertEqual(0, corpus.norms[i])
+        for first, block in corpus.cosine_blocks(5):
+            for k in xrange(len(block)):
+                for i in empty:
+                    self.assertEqual(0, block[k][i])
+                    if first + k == i:
+                        self.assertEqual([0] * len(corpus),
+                                         list(block[k]))
+        for i in empty:
+            for j in xrange(len(corpus)):
+                self.assertAlmostEqual(docdist9.math.pi / 2,
+                                       corpus.angle(i, j))
+        empty_corpus = Corpus.load(self.filenames[-2:])
+        self.assertEqual([(0, 1, docdist9.math.pi / 2)],
+                         list(empty_corpus.all_pairs()))
+        self.assertEqual([], list(Corpus().all_pairs()))
+
+    @unittest.skipIf(docdist9.numpy is None, 'NumPy is not installed')
+    def test_cosine_blocks_without_numpy(self):
+        corpus = Corpus.load(self.filenames)
+        # Only the three commonest words are dense, so both NumPy paths
+        # are used.
+        corpus.dense_words = 3
+        for block_size in [1, 4, 256]:
+            expected = [(first, [list(row) for row in block])
+                        for first, block in corpus.cosine_blocks(block_size)]
+            numpy = docdist9.numpy
+            docdist9.numpy = None
+            try:
+                found = list(corpus.cosine_blocks(block_size))
+            finally:
+                docdist9.numpy = numpy
+            self.assertEqual([first for first, block in expected],
+                             [first for first, block in found])
+            for (first, block), (other, rows) in zip(expected, found):
+                self.assertEqual(len(block), len(rows))
+                for row, cosines in zip(block, rows):
+                    for cosine, other_cosine in zip(row, cosines):
+                        self.assertAlmostEqual(cosine, other_cosine)
+
+    def test_cache(self):
+        cache = os.path.join(self.directory, 'cache')
+        corpus = Corpus.load(self.filenames, cache)
+        self.assertTrue(os.path.exists(cache))
+        # Cached rows are used as they are, even if the files changed
+        # without changing their size or modification time.
+        for k, filename in enumerate(self.filenames):
+            os.utime(filename, (0, 1000000 + k))
+        corpus = Corpus.load(self.filenames, cache)
+        size = os.path.getsize(self.filenames[0])
+        self.write('doc0.txt', 'y' * size)
+        os.utime(self.filenames[0], (0, 1000000))
+        cached = Corpus.load(self.filenames, cache)
+        for i in xrange(len(corpus)):
+            self.assertEqual(corpus.vector(i), cached.vector(i))
+
+        # A new modification time invalidates the file's row only.
+        os.utime(self.filenames[0], (0, 2000000))
+        changed = Corpus.load(self.filenames, cache)
+        self.assertEqual({'y' * size: 1} if size else {},
+                         changed.vector(0))
+        for i in xrange(1, len(corpus)):
+            self.assertEqual(corpus.vector(i), changed.vector(i))
+        self.assertEqual(len(corpus.words) + (1 if size else 0),
+                         len(changed.words))
+
+    def test_truncated_cache(self):
+        cache = os.path.join(self.directory, 'cache')
+        corpus = Corpus.load(self.filenames, cache)
+        with open(cache, 'rb') as f:
+            data = f.read()
+        header = len(data.split('\n', 1)[0]) + 1
+        for length in [0, header - 1, header, header + 5, len(data) - 1]:
+            with open(cache, 'wb') as f:
+                f.write(data[:length])
+            if length >= header:
+                with open(cache, 'rb') as f:
+                    self.assertRaises(ValueError, Corpus.read, f)
+            loaded = Corpus.load(self.filenames, cache)
+            for i in xrange(len(corpus)):
+                self.assertEqual(corpus.vector(i), loaded.vector(i))
+
+if __name__ == '__main__':
+    unittest.main()
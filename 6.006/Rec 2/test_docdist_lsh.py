@@ -0,0 +1,139 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import docdist_lsh
+from docdist_lsh import MinHashIndex
+
+def random_documents(rng, count):
+    """
+    Return count texts, about half of them small edits of an earlier one.
+    """
+    vocabulary = ['word%d' % k for k in xrange(300)]
+    texts = []
+    for k in xrange(count):
+        if texts and rng.random() < 0.5:
+            words = rng.choice(texts).split()
+            for edit in xrange(rng.randint(0, 3)):
+                words[rng.randrange(len(words))] = rng.choice(vocabulary)
+        else:
+            words = [rng.choice(vocabulary)
+                     for i in xrange(rng.randint(20, 80))]
+        texts.append(' '.join(words))
+    return texts
+
+class TestMinHashIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filenames = []
+        rng = random.Random(23)
+        for k, text in enumerate(random_documents(rng, 40)):
+            self.filenames.append(self.write('doc%d.txt' % k, text))
+            # Whole seconds, so that tests can restore them exactly.
+            os.utime(self.filenames[-1], (0, 1000000 + k))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'w') as f:
+            f.write(text)
+        return filename
+
+    def build(self, **options):
+        index = MinHashIndex(**options)
+        for filename in self.filenames:
+            index.add_file(filename)
+        return index
+
+    def assertSameIndex(self, expected, index):
+        self.assertEqual(expected.corpus.filenames, index.corpus.filenames)
+        self.assertEqual(list(expected.signatures), list(index.signatures))
+        self.assertEqual(expected.buckets, index.buckets)
+        for i in xrange(len(expected)):
+            self.assertEqual(expected.corpus.vector(i),
+                             index.corpus.vector(i))
+            self.assertAlmostEqual(expected.corpus.norms[i],
+                                   index.corpus.norms[i])
+        self.assertEqual(expected.near_duplicates(0.5),
+                         index.near_duplicates(0.5))
+
+    @unittest.skipIf(docdist_lsh.numpy is None, 'NumPy is not installed')
+    def test_signature_without_numpy(self):
+        index = MinHashIndex()
+        rng = random.Random(1)
+        shingle_sets = [set([0, 0xffffffff]), set([12345])] + \
+            [set(rng.getrandbits(32) for k in xrange(rng.randint(1, 50)))
+             for j in xrange(20)]
+        expected = [index.signature(shingles) for shingles in shingle_sets]
+        numpy = docdist_lsh.numpy
+        docdist_lsh.numpy = None
+        try:
+            for shingles, signature in zip(shingle_sets, expected):
+                self.assertEqual(signature, index.signature(shingles))
+            self.assertEqual([0xffffffff] * index.size(),
+                             index.signature(set()))
+        finally:
+            docdist_lsh.numpy = numpy
+
+    def test_save_and_load(self):
+        self.filenames.append(self.write('empty.txt', ''))
+        for options in [{}, {'bands': 4, 'rows': 3, 'shingle_size': 2}]:
+            index = self.build(**options)
+            filename = os.path.join(self.directory, 'index')
+            index.save(filename)
+            loaded = MinHashIndex.load(filename)
+            for name in ['bands', 'rows', 'shingle_size', 'seed',
+                         'multipliers', 'increments']:
+                self.assertEqual(getattr(index, name), getattr(loaded, name))
+            self.assertSameIndex(index, loaded)
+
+    def test_near_duplicates_are_exact(self):
+        for options in [{}, {'bands': 8, 'rows': 2}, {'shingle_size': 3}]:
+            index = self.build(**options)
+            for max_angle in [0.0, 0.1, 0.3]:
+                # The cosines of identical documents can round to just
+                # under 1, which acos turns into angles of about 1e-8.
+                exact = set((i, j) for i, j, angle in index.corpus.all_pairs()
+                            if angle <= max_angle + 1e-6)
+                found = index.near_duplicates(max_angle)
+                self.assertEqual(sorted(found), found)
+                for i, j, angle in found:
+                    self.assertTrue(i < j)
+                    self.assertTrue((i, j) in exact)
+                    self.assertAlmostEqual(index.corpus.angle(i, j), angle)
+            # The identical copies are always found.
+            self.assertTrue(index.near_duplicates(0.0))
+
+    def test_stale_files(self):
+        filename = os.path.join(self.directory, 'index')
+        index = self.build()
+        index.save(filename)
+        stale = MinHashIndex.load(filename)
+        # Grow, shrink and empty files, and change one without changing its
+        # size.
+        self.write('doc3.txt', open(self.filenames[5]).read() + ' extra')
+        self.write('doc7.txt', 'word1 word2')
+        self.write('doc8.txt', '')
+        text = open(self.filenames[11]).read()
+        self.write('doc11.txt', text[::-1])
+        for k in [3, 7, 8, 11]:
+            os.utime(self.filenames[k], (0, 12345 + k))
+        self.filenames.append(self.write('new.txt', 'word1 word2 word3'))
+        stale.update_files(self.filenames)
+        self.assertSameIndex(self.build(), stale)
+
+        # Files with the same size and modification time are not read again.
+        vector = stale.corpus.vector(5)
+        self.write('doc5.txt', 'x' * os.path.getsize(self.filenames[5]))
+        os.utime(self.filenames[5], (0, 1000005))
+        signatures = list(stale.signatures)
+        stale.update_files(self.filenames)
+        self.assertEqual(signatures, list(stale.signatures))
+        self.assertEqual(vector, stale.corpus.vector(5))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -135,6 +135,11 @@ class LSRouter(Router):
         if (time % self.ADVERT_INTERVAL) == self.ADVERT_INTERVAL/2:
             self.integrate(time)
 
+    def next_transmit(self, time):
+        half = self.ADVERT_INTERVAL/2
+        return min(Router.next_transmit(self, time),
+                   time + (half - time) % self.ADVERT_INTERVAL)
+
     def OnClick(self,which):
         if which == 'left':
             print self
@@ -757,3 +757,61 @@ def convergence_time(net, correct_routing_table):
             break
 
     return i-9, result
+
+# The state that step and step_events must agree on once a network has
+# run: when each packet was sent and where and when it arrived, the queue
+# statistics and the shortest path costs.  Routes are left out, since
+# LSRouter breaks ties between equal cost paths in the order of a dict
+# keyed by Link objects, which differs between two runs.
+def engine_fingerprint(net):
+    packets = [(p.source,p.destination,p.type,p.start,p.finish,
+                [(n.address,t) for n,t in p.route]) for p in net.packets]
+    queues = [(n.address,n.queue_length_sum,n.queue_length_max)
+              for n in net.nlist]
+    costs = [(n.address,sorted(n.spcost.items())) for n in net.nlist]
+    return net.time,packets,queues,costs
+
+# run verify_routes once with each engine and check that every network
+# it builds ends up in the same state, with the same random state
+def verify_engines(network):
+    print 'Testing',network,'with step_events against step...'
+    results = []
+    for event_driven in (False,True):
+        nets = []
+        class EngineNetwork(network):
+            def __init__(self,*args):
+                network.__init__(self,*args)
+                self.event_driven = event_driven
+                nets.append(self)
+        # verify_routes looks at the class name
+        EngineNetwork.__name__ = network.__name__
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull,'w')
+        try:
+            verify_routes(EngineNetwork)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        results.append(([engine_fingerprint(net) for net in nets],
+                        random.getstate()))
+    (expected,expected_state),(found,found_state) = results
+    result = len(expected) == len(found)
+    for i,(a,b) in enumerate(zip(expected,found)):
+        for name,x,y in zip(('time','packets','queue statistics',
+                             'route costs'),a,b):
+            if x != y:
+                print 'network %d: step_events gives different %s' % (i,name)
+                result = False
+    if expected_state != found_state:
+        print 'step_events leaves a different random state'
+        result = False
+    if result:
+        print '...PASSED'
+    return result
+
+if __name__ == '__main__':
+    import PS8_dv,PS8_ls
+    result = verify_engines(PS8_dv.DVRouterNetwork)
+    result &= verify_engines(PS8_ls.LSRouterNetwork)
+    if not result:
+        sys.exit(1)
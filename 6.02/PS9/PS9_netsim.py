@@ -1,4 +1,4 @@
-import random, sys, wx, math, time
+import random, sys, wx, math, time, os, heapq, inspect
 
 ################################################################################
 #
@@ -9,6 +9,7 @@ import random, sys, wx, math, time
 # Node.receive(p)     -- called to process packet sent to this node
 # Node.transmit(time) -- allow node to send packets at current time
 # Node.forward(p)     -- lookup route for pkt p and send it on appropriate link
+# Node.next_transmit(time) -- when transmit next has work (for step_events)
 # Node.arrived_on(p)  -- returns link that packet p just arrived on
 #
 ################################################################################
@@ -100,6 +101,15 @@ class Node:
                 self.process(self.transmit_queue.pop(0),None,time)
             else: break
 
+    # earliest timestep at or after time at which transmit has something
+    # to do even if no packets arrive, or None if there is no such time.
+    # Used by Network.step_events: a class that overrides transmit should
+    # override this as well, otherwise its nodes are run every timestep.
+    def next_transmit(self,time):
+        if len(self.transmit_queue) > 0:
+            return max(time,self.transmit_queue[0].start)
+        return None
+
     # OVERRIDE: forward packet onto proper outgoing link.  Default behavior
     # is to pick a link at random!
     def forward(self,p):
@@ -189,7 +199,8 @@ class Link:
         self.costrepr = str(self.cost) # representing cost in GUI
         self.rate = 1      # number of pkts/slot (same in each direction)
         self.pending = []  # packets that have yet to be sent on link
-        self.credits = 0.0 # deficit round robin to send pkts at "rate"
+        self.credits12 = 0.0 # deficit round robin to send pkts at "rate"
+        self.credits21 = 0.0
         self.network = None     # will be filled in later
         n1.add_link(self)
         n2.add_link(self)
@@ -201,7 +212,8 @@ class Link:
     def reset(self):
         self.q12 = []    # reset packet queues
         self.q21 = []
-        self.credits = 0.0
+        self.credits12 = 0.0
+        self.credits21 = 0.0
 
     # return count of undelivered packets sent by specified node
     def queue_length(self,n):
@@ -392,6 +404,10 @@ class Packet:
 #
 # Network.reset()                      -- initialize network state
 # Network.step(count=1)                -- simulate count timesteps
+# Network.step_events(count=1)         -- same, skipping idle nodes/timesteps
+#
+# Setting NETSIM_ENGINE=event in the environment makes step use
+# step_events.
 #
 ################################################################################
 class Network:
@@ -408,6 +424,8 @@ class Network:
         self.max_y = 0
         self.simtime = simtime
         self.playstep = 1.0     # 1 second play step by default
+        # simulate with step_events rather than one timestep at a time
+        self.event_driven = os.environ.get('NETSIM_ENGINE') == 'event'
 
         self.numnodes = 0       # TBD
 
@@ -498,6 +516,7 @@ class Network:
     # simulate network one timestep at a time.  At each timestep
     # each node processes one packet from each of its incoming links
     def step(self,count=1):
+        if self.event_driven: return self.step_events(count)
         stop_time = self.time + count
         while self.time < stop_time and self.pending > 0:
             # phase 1: nodes collect one packet from each link
@@ -512,6 +531,120 @@ class Network:
             self.time += 1
         return self.pending
 
+    # True if node says when its transmit has work to do, i.e. the
+    # class that defines its transmit also defines next_transmit
+    def schedules_transmit(self,node):
+        for cls in inspect.getmro(node.__class__):
+            if 'next_transmit' in cls.__dict__: return True
+            if 'transmit' in cls.__dict__: return False
+        return False
+
+    # number of packets node has queued up on its outgoing links
+    def queued_packets(self,node):
+        pending = 0
+        for link in node.links: pending += link.queue_length(node)
+        return pending
+
+    # simulate network like step, but at each timestep only run the
+    # nodes that have something to do: a packet waiting on one of their
+    # incoming links (or received in the previous timestep), or work for
+    # their transmit method (see Node.next_transmit).  The times at which
+    # nodes have work are kept in a priority queue, and timesteps in which
+    # no node has work are skipped.  Nodes that run do so in nlist order,
+    # so packets, routes, random numbers and queue statistics all come
+    # out the same as with step.
+    def step_events(self,count=1):
+        stop_time = self.time + count
+        if self.time >= stop_time or self.pending <= 0: return self.pending
+        position = dict((id(n),i) for i,n in enumerate(self.nlist))
+        # nodes whose transmit may do something at any timestep
+        always = set(i for i,n in enumerate(self.nlist)
+                     if not self.schedules_transmit(n))
+        # every node runs in the first timestep, since packets may have
+        # been added and links changed since the last call
+        events = [(self.time,i) for i in xrange(len(self.nlist))]
+        queued = set(events)
+        def schedule(time,i):
+            if time < stop_time and (time,i) not in queued:
+                queued.add((time,i))
+                heapq.heappush(events,(time,i))
+
+        # queue statistics are kept up to date lazily: since[i] is the
+        # first timestep not yet counted for node i, and its outgoing
+        # links have held waiting[i] packets from then on
+        since = [self.time] * len(self.nlist)
+        waiting = [self.queued_packets(n) for n in self.nlist]
+        pending = [waiting[i] + len(n.transmit_queue)
+                   for i,n in enumerate(self.nlist)]
+        total = sum(pending)
+        def count_queue(i,time):
+            if since[i] < time and waiting[i] > 0:
+                n = self.nlist[i]
+                n.queue_length_sum += waiting[i] * (time - since[i])
+                n.queue_length_max = max(n.queue_length_max,waiting[i])
+            since[i] = time
+
+        while True:
+            time = self.time
+            active = set(always)
+            while events and events[0][0] == time:
+                queued.discard(events[0])
+                active.add(heapq.heappop(events)[1])
+            active = sorted(active)
+
+            # phase 1: active nodes collect one packet from each link,
+            # which takes it off the queue of the node that sent it
+            received = set()
+            for i in active:
+                n = self.nlist[i]
+                n.phase1()
+                for link_p in n.packets:
+                    if link_p is not None:
+                        received.add(i)
+                        if link_p[0].end1 is n: j = position[id(link_p[0].end2)]
+                        else: j = position[id(link_p[0].end1)]
+                        count_queue(j,time)
+                        waiting[j] -= 1
+                        pending[j] -= 1
+                        total -= 1
+
+            # phase 2: active nodes process collected packets and
+            # transmit.  phase2 counts this timestep in their statistics.
+            for i in active:
+                n = self.nlist[i]
+                count_queue(i,time)
+                node_pending = n.phase2(time)
+                waiting[i] = node_pending - len(n.transmit_queue)
+                since[i] = time + 1
+                total += node_pending - pending[i]
+                pending[i] = node_pending
+
+            # schedule the next timestep for the receiving end of every
+            # link with packets waiting, and the next transmit of each node
+            for i in active:
+                n = self.nlist[i]
+                if i in received: schedule(time+1,i)
+                for link in n.links:
+                    if link.end1 is n: (other,out,inc) = (link.end2,link.q12,link.q21)
+                    else: (other,out,inc) = (link.end1,link.q21,link.q12)
+                    if len(out) > 0: schedule(time+1,position[id(other)])
+                    if len(inc) > 0: schedule(time+1,i)
+                if i not in always:
+                    next_time = n.next_transmit(time+1)
+                    if next_time is not None: schedule(next_time,i)
+
+            # increment time, skipping timesteps in which nothing happens
+            self.time = time + 1
+            if total <= 0 or self.time >= stop_time: break
+            if len(always) == 0:
+                if events: self.time = events[0][0]
+                else: self.time = stop_time
+                if self.time >= stop_time: break
+
+        for i in xrange(len(self.nlist)): count_queue(i,self.time)
+        self.pending = total
+        return self.pending
+
     #########################################################
     # support for graphical simulation interface
     #########################################################
@@ -895,6 +1028,9 @@ class Router(Node):
     def transmit(self, time):
         return
 
+    def next_transmit(self, time):
+        return None
+
     def OnClick(self,which):
         if which == 'left':
             #print whatever debugging information you want to print